@@ -6,6 +6,26 @@ HOST="0.0.0.0"
 PORT="8008"
 WORKERS=4
 PID_FILE="gunicorn.pid"
+WORKER_PID_FILE="worker.pid"
+ASYNC_APP_NAME="run_async:app"  # Async query endpoints (check-sla, check-sla-stream)
+ASYNC_PORT="8009"
+ASYNC_WORKERS=2  # Each worker runs one event loop with hundreds of requests in flight
+ASYNC_PID_FILE="gunicorn_async.pid"
+GUNICORN_CONF="gunicorn.conf.py"
+# Shared by every process so /metrics aggregates the API workers, the async server and the ingestion workers
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-$(pwd)/tmp/metrics}"
+
+# Start metrics from zero, unless another process is still writing to the directory
+prepare_metrics_dir() {
+    for pid_file in "$PID_FILE" "$ASYNC_PID_FILE" "$WORKER_PID_FILE"; do
+        if [ -f "$pid_file" ] && kill -0 $(cat "$pid_file") > /dev/null 2>&1; then
+            mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+            return
+        fi
+    done
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+}
 
 # Function to start gunicorn
 start_gunicorn() {
@@ -14,11 +34,12 @@ start_gunicorn() {
     if [ -f "$PID_FILE" ] && kill -0 $(cat "$PID_FILE") > /dev/null 2>&1; then
         echo "Gunicorn is already running."
     else
+        prepare_metrics_dir
         if [ "$2" == "background" ]; then
-            gunicorn -w $WORKERS -b $HOST:$PORT $APP_NAME --pid $PID_FILE --timeout 600&
+            gunicorn -c $GUNICORN_CONF -w $WORKERS -b $HOST:$PORT $APP_NAME --pid $PID_FILE --timeout 600&
             echo "Gunicorn started in the background with PID $(cat $PID_FILE)."
         else
-            gunicorn -w $WORKERS -b $HOST:$PORT $APP_NAME --pid $PID_FILE --timeout 600
+            gunicorn -c $GUNICORN_CONF -w $WORKERS -b $HOST:$PORT $APP_NAME --pid $PID_FILE --timeout 600
             echo "Gunicorn started in the foreground with PID $(cat $PID_FILE)."
         fi
     fi
@@ -44,6 +65,59 @@ stop_gunicorn() {
     fi
 }
 
+# Function to start the async query server
+start_async() {
+    echo "Starting async Gunicorn..."
+    if [ -f "$ASYNC_PID_FILE" ] && kill -0 $(cat "$ASYNC_PID_FILE") > /dev/null 2>&1; then
+        echo "Async Gunicorn is already running."
+    else
+        prepare_metrics_dir
+        gunicorn -c $GUNICORN_CONF -w $ASYNC_WORKERS -b $HOST:$ASYNC_PORT $ASYNC_APP_NAME --worker-class aiohttp.GunicornWebWorker --pid $ASYNC_PID_FILE --timeout 600 &
+        echo "Async Gunicorn started in the background on port $ASYNC_PORT."
+    fi
+}
+
+# Function to stop the async query server
+stop_async() {
+    echo "Stopping async Gunicorn..."
+    if [ -f "$ASYNC_PID_FILE" ]; then
+        PID=$(cat "$ASYNC_PID_FILE")
+        kill $PID > /dev/null 2>&1
+        rm -f "$ASYNC_PID_FILE"
+        echo "Async Gunicorn stopped (PID: $PID)."
+    else
+        echo "No PID file found. Async Gunicorn may not be running."
+    fi
+}
+
+# Function to start the ingestion job workers
+start_worker() {
+    echo "Starting ingestion workers..."
+    if [ -f "$WORKER_PID_FILE" ] && kill -0 $(cat "$WORKER_PID_FILE") > /dev/null 2>&1; then
+        echo "Ingestion workers are already running."
+    else
+        prepare_metrics_dir
+        python worker.py &
+        echo $! > "$WORKER_PID_FILE"
+        echo "Ingestion workers started in the background with PID $(cat $WORKER_PID_FILE)."
+    fi
+}
+
+# Function to stop the ingestion job workers
+stop_worker() {
+    echo "Stopping ingestion workers..."
+    if [ -f "$WORKER_PID_FILE" ]; then
+        PID=$(cat "$WORKER_PID_FILE")
+        # Stop the worker processes first, then the parent
+        pkill -P $PID > /dev/null 2>&1
+        kill $PID > /dev/null 2>&1
+        rm -f "$WORKER_PID_FILE"
+        echo "Ingestion workers stopped (PID: $PID)."
+    else
+        echo "No PID file found. Ingestion workers may not be running."
+    fi
+}
+
 # Function to show usage (check if gunicorn is running and show stats)
 show_usage() {
     if [ -f "$PID_FILE" ] && kill -0 $(cat "$PID_FILE") > /dev/null 2>&1; then
@@ -57,9 +131,13 @@ show_usage() {
 
 # Show script usage
 usage() {
-    echo "Usage: $0 {start|stop|usage} [background]"
+    echo "Usage: $0 {start|stop|usage|start-async|stop-async|start-worker|stop-worker} [background]"
     echo "   start       Start Gunicorn (optional: 'background' to run in the background)"
     echo "   stop        Stop the running Gunicorn server"
+    echo "   start-async   Start the async query server (check-sla endpoints) in the background"
+    echo "   stop-async    Stop the async query server"
+    echo "   start-worker  Start the ingestion job workers in the background"
+    echo "   stop-worker   Stop the ingestion job workers"
     echo "   usage       Show usage statistics for Gunicorn"
     exit 1
 }
@@ -75,6 +153,18 @@ case "$1" in
     usage)
         show_usage
         ;;
+    start-async)
+        start_async
+        ;;
+    stop-async)
+        stop_async
+        ;;
+    start-worker)
+        start_worker
+        ;;
+    stop-worker)
+        stop_worker
+        ;;
     *)
         usage
         ;;
@@ -8,6 +8,8 @@ from flask_jwt_extended import JWTManager
 from redis import Redis
 from app.config import Config
 from app.logger import setup_logging
+from app.mappings import document_mapping
+from app.aliases import ensure_alias
 
 # Setup logging
 setup_logging()
@@ -38,6 +40,15 @@ except Exception as e:
     logger.error(f"Error connecting to Elasticsearch: {e}")
     raise ConnectionError(f"Could not connect to Elasticsearch at {Config.ELASTICSEARCH_URL}.")
 
+def create_index_with_mapping(index_name=None):
+    """
+    Create Elasticsearch index with the necessary mapping for vector search,
+    as a versioned index behind the index_name alias.
+    """
+    mapping = document_mapping()
+    ensure_alias(es, index_name or Config.DOCUMENT_INDEX, mapping)
+
+
 # Define application factory
 def create_app():
     app = Flask(__name__)
@@ -58,33 +69,12 @@ def create_app():
                 logger.info("Database and tables created successfully.")
                 
                 # Ensure Elasticsearch index is set up
-                def create_index_with_mapping(index_name="pdf_documents"):
-                    """
-                    Create Elasticsearch index with the necessary mapping for vector search.
-                    """
-                    mapping = {
-                        "mappings": {
-                            "properties": {
-                                "tc_doc_id": {"type": "keyword"},
-                                "title": {"type": "text"},
-                                "content": {"type": "text"},
-                                "hash": {"type": "keyword"},
-                                "timestamp": {"type": "date"},
-                                "embedding": {
-                                    "type": "dense_vector",
-                                    "dims": 768  # Adjust to match embedding dimensions
-                                }
-                            }
-                        }
-                    }
-
-                    if not es.indices.exists(index=index_name):
-                        es.indices.create(index=index_name, body=mapping)
-                        logger.info(f"Index '{index_name}' created successfully.")
-                    else:
-                        logger.info(f"Index '{index_name}' already exists.")
-
                 create_index_with_mapping()
+
+                # Passage index used by chunked ingestion
+                if Config.CHUNKED_INGESTION:
+                    from app.chunking import create_chunk_index
+                    create_chunk_index(es)
             else:
                 logger.info("Database tables already exist. Skipping creation.")
         except Exception as e:
@@ -93,5 +83,13 @@ def create_app():
     # Register Blueprints
     from app.api import api_bp
     app.register_blueprint(api_bp, url_prefix='/api/v1/')
+
+    # Request metrics and the /metrics endpoint
+    from app import metrics
+    metrics.init_app(app)
+
+    # Server-Timing headers and the sampling profiler
+    from app import tracing
+    tracing.init_app(app)
     
     return app
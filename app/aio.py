@@ -0,0 +1,367 @@
+import asyncio
+import json
+import logging
+import time
+import aiohttp
+import jwt as pyjwt
+import openai
+from aiohttp import web
+from elasticsearch import AsyncElasticsearch
+from redis import asyncio as aioredis
+from .config import Config
+from .cache import embedding_cache, search_cache, semantic_cache
+from .embedding_client import embedding_client, EmbeddingError
+from .retrieval import aretrieve, ahydrate
+from .metrics import observe, observe_seconds, record_tokens, request_started, request_finished
+from .utils import best_document, build_sla_messages, read_stream_chunk, cacheable_stream, NO_SOLUTION
+from . import tracing
+
+logger = logging.getLogger()
+
+# Async serving mode for the query endpoints. One event loop per process keeps
+# hundreds of requests in flight while they wait on Ollama, Elasticsearch, Redis
+# and OpenAI; ingestion and admin endpoints stay on the Flask app.
+
+ES = web.AppKey("es", AsyncElasticsearch)
+REDIS = web.AppKey("redis", aioredis.Redis)
+LLM_SLOTS = web.AppKey("llm_slots", asyncio.Semaphore)
+LLM_SESSION = web.AppKey("llm_session", aiohttp.ClientSession)
+
+
+async def get_embedding(text, redis):
+    cached = await embedding_cache.aget(text, redis)
+    if cached is not None:
+        logger.debug("Embedding cache hit")
+        return cached
+
+    try:
+        embedding = (await embedding_client.aembed_batch([text]))[0]
+        logger.info(f"Successfully fetched embedding for text: {text}")
+        await embedding_cache.aset(text, embedding, redis)
+        return embedding
+    except EmbeddingError as e:
+        logger.error(f"Request failed: {e}")
+        return None
+
+
+async def retrieve_document(query, embedding, es):
+    return best_document(await ahydrate(es, await aretrieve(es, query, embedding)))
+
+
+async def sla_messages(query, document, embedding):
+    # Context building tokenizes the document, so it runs off the event loop
+    with observe("prompt"):
+        return await asyncio.to_thread(build_sla_messages, query, [document], embedding)
+
+
+async def find_sla(query, document, embedding, llm_slots):
+    try:
+        messages = await sla_messages(query, document, embedding)
+        async with llm_slots:
+            with observe("llm"):
+                response = await openai.ChatCompletion.acreate(model=Config.MODEL, messages=messages)
+        usage_info = response.get('usage', {})
+        record_tokens(Config.MODEL, usage_info)
+        logger.info(f"Response from OpenAI received for query: {query}")
+        logger.info(f"Total tokens used: {usage_info.get('total_tokens', 'N/A')}")
+        sla = response['choices'][0]['message']['content']
+        logger.info(f"Solution found: {sla}")
+    except Exception as e:
+        logger.error(f"Error in OpenAI solution search: {e}")
+        sla = NO_SOLUTION
+    return sla
+
+
+async def search_sla(query, es, redis, llm_slots):
+    """
+    Async counterpart of utils.search_sla, with the same caching and return value.
+    """
+    start_time = time.time()
+
+    cached_result = await search_cache.aget(query, redis)
+    if cached_result is not None:
+        logger.info("Cache hit, returning cached result")
+        return cached_result, True, round(time.time() - start_time, 3)
+
+    embedding = await get_embedding(query, redis)
+    if not embedding:
+        logger.warning("Failed to generate query embedding")
+        raise ValueError("Failed to generate query embedding")
+
+    try:
+        document = await retrieve_document(query, embedding, es)
+        if not document:
+            logger.warning("No results found in Elasticsearch")
+            return {"msg": "No results found"}, False, round(time.time() - start_time, 2)
+
+        cached_answer = await semantic_cache.alookup(es, embedding, document)
+        if cached_answer is not None:
+            result = {"solution": cached_answer}
+            await search_cache.aset(query, result, redis)
+            return result, True, round(time.time() - start_time, 2)
+
+        solution = await find_sla(query, document, embedding, llm_slots)
+        result = {"solution": solution}
+        if solution != NO_SOLUTION:
+            await semantic_cache.astore(es, query, embedding, document, solution)
+        await search_cache.aset(query, result, redis)
+
+    except Exception as e:
+        logger.error(f"Error during Elasticsearch query: {e}")
+        return {"msg": "Error during Elasticsearch query"}, False, round(time.time() - start_time, 2)
+
+    elapsed_time = round(time.time() - start_time, 2)
+    logger.info(f"Search completed in {elapsed_time} seconds")
+    return result, False, elapsed_time
+
+
+async def stream_sla(query, es, redis, llm_slots):
+    """
+    Async counterpart of utils.stream_sla: yields the same (event, data) tuples.
+    """
+    start_time = time.time()
+
+    cached_result = await search_cache.aget(query, redis)
+    if cached_result is not None:
+        logger.info("Cache hit, streaming cached result")
+        yield "meta", {"document": None, "cache_hit": True, "cache": "search"}
+        yield "token", {"content": cached_result.get("solution", "")}
+        yield "done", {"elapsed_time": round(time.time() - start_time, 3)}
+        return
+
+    embedding = await get_embedding(query, redis)
+    if not embedding:
+        yield "error", {"msg": "Failed to generate query embedding"}
+        return
+
+    try:
+        document = await retrieve_document(query, embedding, es)
+    except Exception as e:
+        logger.error(f"Error during Elasticsearch query: {e}")
+        yield "error", {"msg": "Error during Elasticsearch query"}
+        return
+
+    if not document:
+        logger.warning("No results found in Elasticsearch")
+        yield "error", {"msg": "No results found"}
+        return
+
+    meta = {
+        "document": {"tc_doc_id": document.get("tc_doc_id"), "title": document.get("title")},
+        "cache_hit": False,
+        "cache": None,
+        "retrieval_time": round(time.time() - start_time, 3)
+    }
+
+    cached_answer = await semantic_cache.alookup(es, embedding, document)
+    if cached_answer is not None:
+        meta.update(cache_hit=True, cache="semantic")
+        yield "meta", meta
+        yield "token", {"content": cached_answer}
+        await search_cache.aset(query, {"solution": cached_answer}, redis)
+        yield "done", {"elapsed_time": round(time.time() - start_time, 3)}
+        return
+
+    yield "meta", meta
+
+    parts = []
+    finished = False
+    usage_info = {}
+    try:
+        messages = await sla_messages(query, document, embedding)
+        async with llm_slots:
+            started = time.time()
+            response = await openai.ChatCompletion.acreate(model=Config.MODEL, messages=messages, stream=True,
+                                                           stream_options={"include_usage": True})
+            async for chunk in response:
+                content, finish_reason, usage = read_stream_chunk(chunk)
+                finished = finished or finish_reason is not None
+                usage_info = usage or usage_info
+                if content:
+                    if not parts:
+                        observe_seconds("llm_first_token", time.time() - started)
+                    parts.append(content)
+                    yield "token", {"content": content}
+            observe_seconds("llm", time.time() - started)
+    except Exception as e:
+        logger.error(f"Error in OpenAI solution search: {e}")
+        yield "error", {"msg": NO_SOLUTION}
+        return
+    finally:
+        record_tokens(Config.MODEL, usage_info)
+
+    solution = "".join(parts)
+    logger.info(f"Solution streamed for query: {query}")
+    logger.info(f"Total tokens used: {usage_info.get('total_tokens', 'N/A')}")
+    if cacheable_stream(query, solution, finished):
+        await semantic_cache.astore(es, query, embedding, document, solution)
+        await search_cache.aset(query, {"solution": solution}, redis)
+
+    yield "done", {"elapsed_time": round(time.time() - start_time, 3)}
+
+
+def verify_token(request):
+    """
+    Verify the bearer token issued by the Flask /login endpoint (flask_jwt_extended, HS256).
+    """
+    header = request.headers.get("Authorization", "")
+    if not header.startswith("Bearer "):
+        raise web.HTTPUnauthorized(text=json.dumps({"msg": "Missing Authorization Header"}), content_type="application/json")
+    try:
+        claims = pyjwt.decode(header[len("Bearer "):], Config.JWT_SECRET_KEY, algorithms=["HS256"])
+    except pyjwt.PyJWTError as e:
+        raise web.HTTPUnauthorized(text=json.dumps({"msg": str(e)}), content_type="application/json")
+    if claims.get("type") != "access":
+        raise web.HTTPUnauthorized(text=json.dumps({"msg": "Only access tokens are allowed"}), content_type="application/json")
+    return claims
+
+
+async def read_query(request):
+    """
+    Authenticate the request and return the query built from its title and message.
+    """
+    verify_token(request)
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    # Kept for the handler, e.g. the optional "timings" flag
+    request["data"] = data
+    title = data.get("title")
+    message = data.get("message")
+    if not title or not message:
+        logging.warning("Missing title or message in SLA check request")
+        raise web.HTTPBadRequest(text=json.dumps({"msg": "Title and message are required"}), content_type="application/json")
+    return title, message
+
+
+async def check_sla(request):
+    """
+    Async /check-sla, with the same request and response as the Flask endpoint.
+    """
+    title, message = await read_query(request)
+    app = request.app
+
+    try:
+        result, cache_hit, elapsed_time = await search_sla(f"{title} {message}", app[ES], app[REDIS], app[LLM_SLOTS])
+
+        if "msg" in result:
+            logging.error(f"Error in SLA search: {result['msg']}")
+            return web.json_response(result, status=500)
+
+        response_data = {
+            "title": title,
+            "message": message.encode('utf-8').decode('unicode_escape'),
+            "sla_info": result.get("solution", "No SLA found"),
+            "cache_hit": cache_hit,
+            "elapsed_time": elapsed_time
+        }
+        if tracing.requested(request.query, request.get("data")):
+            response_data["timings"] = tracing.timings()
+
+        with observe("serialize"):
+            return web.json_response(response_data)
+
+    except Exception as e:
+        logging.error(f"Error checking SLA: {str(e)}")
+        return web.json_response({"msg": f"Error checking SLA: {str(e)}"}, status=500)
+
+
+async def check_sla_stream(request):
+    """
+    Async /check-sla-stream, emitting the same Server-Sent Events as the Flask endpoint.
+    """
+    title, message = await read_query(request)
+    app = request.app
+
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+    await response.prepare(request)
+    try:
+        async for event, payload in stream_sla(f"{title} {message}", app[ES], app[REDIS], app[LLM_SLOTS]):
+            await response.write(f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+    except ConnectionResetError:
+        logging.info("Client disconnected from SLA stream")
+    except Exception as e:
+        logging.error(f"Error checking SLA: {str(e)}")
+        await response.write(f"event: error\ndata: {json.dumps({'msg': f'Error checking SLA: {str(e)}'})}\n\n".encode("utf-8"))
+    await response.write_eof()
+    return response
+
+
+@web.middleware
+async def track_requests(request, handler):
+    """
+    Latency and in-flight gauges per route, written to the same metrics as the Flask app.
+    """
+    resource = request.match_info.route.resource
+    endpoint = resource.canonical if resource else "unmatched"
+    started = request_started(endpoint)
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        request_finished(endpoint, status, started)
+
+
+@web.middleware
+async def trace_requests(request, handler):
+    """
+    Per-request stage tracing, returned as a Server-Timing header like on the Flask app.
+    """
+    trace = tracing.start()
+    try:
+        response = await handler(request)
+        # Streamed responses send their headers before any stage runs
+        if Config.SERVER_TIMING_ENABLED and not response.prepared:
+            response.headers["Server-Timing"] = trace.server_timing()
+        return response
+    finally:
+        tracing.finish()
+
+
+@web.middleware
+async def share_llm_session(request, handler):
+    """
+    Route OpenAI calls through the app's keep-alive session. openai.aiosession is a
+    ContextVar, so it is set in each request's task rather than once at startup.
+    """
+    openai.aiosession.set(request.app[LLM_SESSION])
+    return await handler(request)
+
+
+async def open_clients(app):
+    app[ES] = AsyncElasticsearch(Config.ELASTICSEARCH_URL, connections_per_node=Config.ASYNC_ES_CONNECTIONS)
+    app[REDIS] = aioredis.from_url(Config.REDIS_URL, max_connections=Config.ASYNC_REDIS_CONNECTIONS)
+    app[LLM_SLOTS] = asyncio.Semaphore(Config.ASYNC_LLM_CONCURRENCY)
+    app[LLM_SESSION] = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=Config.ASYNC_LLM_CONCURRENCY))
+
+
+async def close_clients(app):
+    await app[ES].close()
+    await app[REDIS].aclose()
+    await app[LLM_SESSION].close()
+    await embedding_client.aclose()
+
+
+def create_async_app():
+    """
+    aiohttp application serving the query endpoints under /api/v1/.
+    """
+    middlewares = [share_llm_session, trace_requests]
+    if Config.METRICS_ENABLED:
+        middlewares.insert(0, track_requests)
+    app = web.Application(middlewares=middlewares)
+    app.on_startup.append(open_clients)
+    app.on_cleanup.append(close_clients)
+    app.router.add_post("/api/v1/check-sla", check_sla)
+    app.router.add_post("/api/v1/check-sla-stream", check_sla_stream)
+    return app
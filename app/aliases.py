@@ -0,0 +1,89 @@
+import logging
+import time
+from datetime import datetime
+
+logger = logging.getLogger()
+
+# The application reads and writes through aliases (Config.DOCUMENT_INDEX, Config.CHUNK_INDEX).
+# Each alias points to one versioned index, so a rebuilt index can replace the live one
+# with a single atomic alias update instead of deleting and recreating it in place.
+
+
+def versioned_name(alias):
+    return f"{alias}_v{datetime.now().strftime('%Y%m%d%H%M%S')}"
+
+
+def alias_indices(es, alias):
+    """
+    Concrete indices behind a name: the alias targets, the index itself for a legacy
+    concrete index, or an empty list if neither exists.
+    """
+    if es.indices.exists_alias(name=alias):
+        return sorted(es.indices.get_alias(name=alias))
+    if es.indices.exists(index=alias):
+        return [alias]
+    return []
+
+
+def ensure_alias(es, alias, mapping):
+    """
+    Create a versioned index behind the alias unless the alias, or a legacy index of
+    that name, already exists. Returns the created index name, or None.
+    """
+    if es.indices.exists(index=alias):
+        logger.info(f"Index '{alias}' already exists.")
+        return None
+
+    index_name = versioned_name(alias)
+    es.indices.create(index=index_name, body=dict(mapping, aliases={alias: {"is_write_index": True}}))
+    logger.info(f"Index '{index_name}' created successfully behind alias '{alias}'.")
+    return index_name
+
+
+def swap_alias(es, alias, index_name):
+    """
+    Atomically point the alias at index_name. Returns the indices it pointed to before.
+    A legacy concrete index cannot share its name with the alias, so it is removed in
+    the same atomic step.
+    """
+    previous = alias_indices(es, alias)
+    actions = [{"add": {"index": index_name, "alias": alias, "is_write_index": True}}]
+    if previous == [alias]:
+        actions.append({"remove_index": {"index": alias}})
+    else:
+        actions.extend({"remove": {"index": old, "alias": alias}} for old in previous if old != index_name)
+    es.indices.update_aliases(actions=actions)
+    logger.info(f"Alias '{alias}' now points to '{index_name}' (was {previous or 'unset'}).")
+    return [old for old in previous if old not in (alias, index_name)]
+
+
+class TaskFailed(RuntimeError):
+    """
+    Raised when a server-side reindex task completes with errors.
+    """
+
+
+def embedding_dims(es, index_name):
+    """
+    Dimensions of the embedding field of an index or alias, or None without one.
+    """
+    # Keyed by the concrete index when index_name is an alias
+    properties = next(iter(es.indices.get_mapping(index=index_name).values()))["mappings"].get("properties", {})
+    return properties.get("embedding", {}).get("dims")
+
+
+def wait_for_task(es, task_id, poll_seconds):
+    """
+    Wait for a reindex task started with wait_for_completion=False, logging progress.
+    Returns the task's response.
+    """
+    while True:
+        task = es.tasks.get(task_id=task_id)
+        status = task["task"]["status"]
+        logger.info(f"  {status.get('created', 0) + status.get('updated', 0)}/{status.get('total', 0)} documents copied")
+        if task.get("completed"):
+            response = task.get("response", {})
+            if task.get("error") or response.get("failures"):
+                raise TaskFailed(f"Reindex failed: {task.get('error') or response.get('failures')[:3]}")
+            return response
+        time.sleep(poll_seconds)
@@ -4,18 +4,24 @@ import logging
 import os
 import time
 from elasticsearch import Elasticsearch
-from flask import Blueprint, Response, request, jsonify
+from flask import Blueprint, Response, request, jsonify, url_for, stream_with_context, send_from_directory
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from werkzeug.security import check_password_hash
 from .models import db, User
-from .utils import search_sla, get_embedding, generate_document_hash, extract_text_with_ocr, extract_text_from_pdf
+from .utils import search_sla, search_sla_batch, stream_sla, save_upload, get_embedding, generate_document_hash, extract_text_with_ocr, extract_text_from_pdf
+from .chunking import delete_chunks
+from .ingestion import ingest_pdf, IngestionError
+from .jobs import spool_upload, create_job, get_job, job_status
+from .backup import IndexExport, BackupError, CursorExpired, FORMATS
+from .bulk_ops import delete_documents, update_documents, summarize, task_status
+from .metrics import observe
+from .profiler import profiler
+from . import tracing
 from . import redis_client
 from datetime import timedelta
 from .config import Config
 import hashlib
-import zipfile
 from datetime import datetime
-from flask import send_file
 from elasticsearch import helpers
 
 
@@ -118,8 +124,12 @@ def check_sla():
             "cache_hit": cache_hit,
             "elapsed_time": elapsed_time
         }
+        if tracing.requested(request.args, data):
+            response_data["timings"] = tracing.timings()
 
-        return jsonify(response_data), 200
+        with observe("serialize"):
+            response = jsonify(response_data)
+        return response, 200
 
     except Exception as e:
         logging.error(f"Error checking SLA: {str(e)}")
@@ -128,6 +138,85 @@ def check_sla():
 
 
 
+@api_bp.route('/check-sla-batch', methods=['POST'])
+@jwt_required()
+def check_sla_batch():
+    """
+    Endpoint to check many tickets at once. Accepts {"items": [{"title", "message"}, ...]}
+    and returns one result per item, in order, with cache status and stage timings.
+    """
+    logging.info("SLA batch check endpoint accessed")
+    data = request.get_json(silent=True) or {}
+    items = data.get("items")
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"msg": "A non-empty list of items is required"}), 400
+    if len(items) > Config.BATCH_MAX_ITEMS:
+        return jsonify({"msg": f"At most {Config.BATCH_MAX_ITEMS} items are accepted per batch"}), 400
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get("title") or not item.get("message"):
+            return jsonify({"msg": f"Item {i}: title and message are required"}), 400
+
+    try:
+        results, timings = search_sla_batch([f"{item['title']} {item['message']}" for item in items], es)
+
+        response_items = []
+        for item, outcome in zip(items, results):
+            result = outcome["result"]
+            response_item = {
+                "title": item["title"],
+                "message": item["message"],
+                "cache_hit": outcome["cache_hit"],
+                "cache": outcome["cache"],
+                "elapsed_time": outcome["elapsed_time"]
+            }
+            if "msg" in result:
+                response_item["error"] = result["msg"]
+            else:
+                response_item["sla_info"] = result.get("solution", "No SLA found")
+            response_items.append(response_item)
+
+        return jsonify({"items": response_items, "timings": timings}), 200
+
+    except Exception as e:
+        logging.error(f"Error checking SLA batch: {str(e)}")
+        return jsonify({"msg": f"Error checking SLA batch: {str(e)}"}), 500
+
+
+@api_bp.route('/check-sla-stream', methods=['POST'])
+@jwt_required()
+def check_sla_stream():
+    """
+    Streaming variant of /check-sla using Server-Sent Events.
+    Emits a "meta" event with the matched document and cache status right after
+    retrieval, "token" events while the answer is generated, then "done" or "error".
+    """
+    logging.info("SLA Check stream endpoint accessed")
+    data = request.get_json()
+    title = data.get("title")
+    message = data.get("message")
+
+    # Validate input
+    if not title or not message:
+        logging.warning("Missing title or message in SLA check request")
+        return jsonify({"msg": "Title and message are required"}), 400
+
+    def generate():
+        try:
+            for event, payload in stream_sla(f"{title} {message}", es):
+                yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            logging.error(f"Error checking SLA: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'msg': f'Error checking SLA: {str(e)}'})}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        # Disable proxy buffering so events reach the client immediately
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @api_bp.route('/upload-documents', methods=['POST'])
 @jwt_required()
 def upload_documents():
@@ -141,10 +230,10 @@ def upload_documents():
             return jsonify({"msg": "TotalCare Doc ID is required."}), 400
 
         # Check if a document with the same tc_doc_id already exists
-        search_body = {"query": {"match": {"tc_doc_id": tc_doc_id}}}
-        response = es.search(index="pdf_documents", body=search_body)
+        search_body = {"query": {"term": {"tc_doc_id": tc_doc_id}}, "size": 0, "terminate_after": 1}
+        response = es.search(index=Config.DOCUMENT_INDEX, body=search_body)
 
-        if response["hits"]["hits"]:
+        if response["hits"]["total"]["value"]:
             return jsonify({"msg": f"Document with tc_doc_id {tc_doc_id} already exists."}), 409
 
         files = request.files.getlist("files")
@@ -155,29 +244,26 @@ def upload_documents():
             if not file.filename.endswith(".pdf"):
                 return jsonify({"msg": f"Unsupported file type: {file.filename}"}), 400
 
+        # Job mode: spool the files and let the ingestion workers do the heavy lifting
+        if use_ingestion_job():
+            spooled = []
+            for file in files:
+                file_path, digest = spool_upload(file)
+                spooled.append({"title": file.filename, "path": file_path, "digest": digest})
+            job = create_job("upload", tc_doc_id, spooled)
+            return job_accepted(job)
+
+        results = {}
+        for file in files:
             file_path = f"/tmp/{file.filename}"
-            file.save(file_path)
-
-            text = extract_text_from_pdf(file_path)
-            if not text:
-                return jsonify({"msg": f"Failed to extract text from {file.filename}"}), 500
-
-            embedding = get_embedding(text)
-            if not embedding:
-                return jsonify({"msg": f"Failed to generate embedding for {file.filename}"}), 500
-
-            document = {
-                "tc_doc_id": tc_doc_id,
-                "title": file.filename,
-                "content": text,
-                "hash": generate_document_hash({"title": file.filename, "content": text}),
-                "timestamp": datetime.now().isoformat(),
-                "embedding": embedding
-            }
+            digest = save_upload(file, file_path)
 
-            es.index(index="pdf_documents", document=document)
+            try:
+                results[file.filename] = ingest_pdf(es, tc_doc_id, file_path, file.filename, digest=digest)
+            except IngestionError as e:
+                return jsonify({"msg": str(e)}), 500
 
-        return jsonify({"msg": "Documents uploaded and indexed successfully."}), 201
+        return jsonify({"msg": "Documents uploaded and indexed successfully.", "results": results}), 201
 
     except Exception as e:
         logger.error(f"Error uploading documents: {str(e)}")
@@ -185,6 +271,42 @@ def upload_documents():
 
 
 
+def use_ingestion_job():
+    """
+    Whether an upload should run as a background job (form field async=true or ASYNC_INGESTION).
+    """
+    requested = request.form.get("async")
+    if requested is None:
+        return Config.ASYNC_INGESTION
+    return requested.lower() in ("1", "true", "yes")
+
+
+def job_accepted(job):
+    return jsonify({
+        "msg": "Ingestion job queued.",
+        "job_id": job["id"],
+        "status_url": url_for("api.get_job_status", job_id=job["id"])
+    }), 202
+
+
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_job_status(job_id):
+    """
+    Endpoint to check the status, per-stage progress and timings of an ingestion job.
+    """
+    try:
+        job = get_job(job_id)
+        if not job:
+            return jsonify({"msg": f"No job found with id: {job_id}"}), 404
+
+        return jsonify(job_status(job)), 200
+
+    except Exception as e:
+        logger.error(f"Error reading job {job_id}: {str(e)}")
+        return jsonify({"msg": f"Error reading job: {str(e)}"}), 500
+
+
 @api_bp.route('/delete-document', methods=['DELETE'])
 @jwt_required()
 def delete_document():
@@ -197,16 +319,15 @@ def delete_document():
         if not tc_doc_id:
             return jsonify({"msg": "TotalCare Doc ID is required."}), 400
 
-        # Search for the document by tc_doc_id
-        search_body = {"query": {"match": {"tc_doc_id": tc_doc_id}}}
-        response = es.search(index="pdf_documents", body=search_body)
+        # Delete every document stored under the tc_doc_id in one request
+        response = es.delete_by_query(index=Config.DOCUMENT_INDEX, query={"term": {"tc_doc_id": tc_doc_id}},
+                                      conflicts="proceed", refresh=True)
 
-        if not response['hits']['hits']:
+        if not response["deleted"]:
             return jsonify({"msg": f"No document found with tc_doc_id: {tc_doc_id}"}), 404
 
-        # Delete the document(s)
-        for hit in response['hits']['hits']:
-            es.delete(index="pdf_documents", id=hit['_id'])
+        # Delete the passages indexed for the document, if any
+        delete_chunks(es, tc_doc_id)
 
         return jsonify({"msg": f"Document with tc_doc_id {tc_doc_id} deleted successfully."}), 200
 
@@ -234,84 +355,204 @@ def update_document():
         if not file.filename.endswith(".pdf"):
             return jsonify({"msg": f"Unsupported file type: {file.filename}"}), 400
 
-        file_path = f"/tmp/{file.filename}"
-        file.save(file_path)
-
-        text = extract_text_from_pdf(file_path)
-        if not text:
-            return jsonify({"msg": f"Failed to extract text from {file.filename}"}), 500
+        search_body = {"query": {"term": {"tc_doc_id": tc_doc_id}}, "size": 0, "terminate_after": 1}
+        response = es.search(index=Config.DOCUMENT_INDEX, body=search_body)
 
-        embedding = get_embedding(text)
-        if not embedding:
-            return jsonify({"msg": f"Failed to generate embedding for {file.filename}"}), 500
+        if not response['hits']['total']['value']:
+            return jsonify({"msg": f"No document found with tc_doc_id: {tc_doc_id}"}), 404
 
-        search_body = {"query": {"match": {"tc_doc_id": tc_doc_id}}}
-        response = es.search(index="pdf_documents", body=search_body)
+        # Job mode: spool the file and let the ingestion workers do the heavy lifting
+        if use_ingestion_job():
+            file_path, digest = spool_upload(file)
+            job = create_job("update", tc_doc_id, [{"title": file.filename, "path": file_path, "digest": digest}])
+            return job_accepted(job)
 
-        if not response['hits']['hits']:
-            return jsonify({"msg": f"No document found with tc_doc_id: {tc_doc_id}"}), 404
+        file_path = f"/tmp/{file.filename}"
+        digest = save_upload(file, file_path)
 
-        for hit in response['hits']['hits']:
-            es.update(index="pdf_documents", id=hit['_id'], body={
-                "doc": {
-                    "title": file.filename,
-                    "content": text,
-                    "hash": generate_document_hash({"title": file.filename, "content": text}),
-                    "timestamp": datetime.now().isoformat(),
-                    "embedding": embedding
-                }
-            })
+        try:
+            result = ingest_pdf(es, tc_doc_id, file_path, file.filename, update=True, digest=digest)
+        except IngestionError as e:
+            return jsonify({"msg": str(e)}), 500
 
-        return jsonify({"msg": f"Document with tc_doc_id {tc_doc_id} updated successfully."}), 200
+        if result == "unchanged":
+            return jsonify({"msg": f"Document with tc_doc_id {tc_doc_id} is unchanged; metadata refreshed.", "result": result}), 200
+        return jsonify({"msg": f"Document with tc_doc_id {tc_doc_id} updated successfully.", "result": result}), 200
 
     except Exception as e:
         logger.error(f"Error updating document: {str(e)}")
         return jsonify({"msg": f"Error updating document: {str(e)}"}), 500
 
 
+def bulk_request():
+    """
+    Parse the JSON body of a bulk endpoint: tc_doc_ids and whether to wait for completion.
+    """
+    data = request.get_json(silent=True) or {}
+    tc_doc_ids = data.get("tc_doc_ids")
+    if not isinstance(tc_doc_ids, list) or not tc_doc_ids:
+        return None, None, (jsonify({"msg": "A non-empty list of tc_doc_ids is required."}), 400)
+    return data, tc_doc_ids, None
+
+
+def tasks_accepted(msg, task_ids):
+    return jsonify({
+        "msg": msg,
+        "tasks": [{"task_id": task_id, "status_url": url_for("api.get_task_status", task_id=task_id)} for task_id in task_ids]
+    }), 202
+
+
+@api_bp.route('/delete-documents', methods=['POST'])
+@jwt_required()
+def delete_documents_bulk():
+    """
+    Endpoint to delete many documents at once by tc_doc_id, with delete_by_query.
+    Runs as Elasticsearch tasks unless "wait" is true.
+    """
+    try:
+        data, tc_doc_ids, error = bulk_request()
+        if error:
+            return error
+
+        if data.get("wait"):
+            totals = summarize(delete_documents(es, tc_doc_ids, wait=True))
+            return jsonify({"msg": f"Deleted {totals['deleted']} document(s) and passage(s).", **totals}), 200
+
+        return tasks_accepted("Delete started.", delete_documents(es, tc_doc_ids))
+
+    except Exception as e:
+        logger.error(f"Error deleting documents: {str(e)}")
+        return jsonify({"msg": f"Error deleting documents: {str(e)}"}), 500
+
+
+@api_bp.route('/update-documents', methods=['POST'])
+@jwt_required()
+def update_documents_bulk():
+    """
+    Endpoint to set metadata fields on many documents at once by tc_doc_id, with update_by_query.
+    Runs as Elasticsearch tasks unless "wait" is true.
+    """
+    try:
+        data, tc_doc_ids, error = bulk_request()
+        if error:
+            return error
+
+        fields = data.get("fields")
+        if not isinstance(fields, dict) or not fields:
+            return jsonify({"msg": "A non-empty fields object is required."}), 400
+
+        try:
+            if data.get("wait"):
+                totals = summarize(update_documents(es, tc_doc_ids, fields, wait=True))
+                return jsonify({"msg": f"Updated {totals['updated']} document(s) and passage(s).", **totals}), 200
+            task_ids = update_documents(es, tc_doc_ids, fields)
+        except ValueError as e:
+            return jsonify({"msg": str(e)}), 400
+
+        return tasks_accepted("Update started.", task_ids)
+
+    except Exception as e:
+        logger.error(f"Error updating documents: {str(e)}")
+        return jsonify({"msg": f"Error updating documents: {str(e)}"}), 500
+
+
+@api_bp.route('/tasks/<task_id>', methods=['GET'])
+@jwt_required()
+def get_task_status(task_id):
+    """
+    Endpoint to check the progress of a bulk delete/update task.
+    """
+    try:
+        return jsonify(task_status(es, task_id)), 200
+
+    except Exception as e:
+        logger.error(f"Error reading task {task_id}: {str(e)}")
+        return jsonify({"msg": f"Error reading task: {str(e)}"}), 500
+
+
 @api_bp.route('/backup-index', methods=['GET'])
 @jwt_required()
 def backup_index():
     """
-    Backup Elasticsearch index and provide a downloadable ZIP file.
+    Stream a backup of an Elasticsearch index as compressed NDJSON.
+    Query params: index, format (zip, gzip, zstd or ndjson), fields (comma-separated),
+    exclude_embedding, slices, and cursor to resume an interrupted backup.
     """
-    logging.info("Memory endpoint accessed")
+    logging.info("Backup endpoint accessed")
     index_name = request.args.get("index", "default_index")  # Optional query param
+    fmt = request.args.get("format", "zip")
+    fields = [field.strip() for field in request.args.get("fields", "").split(",") if field.strip()]
+    exclude_embedding = request.args.get("exclude_embedding", "false").lower() in ("1", "true", "yes")
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    
-    # Define temporary directories and file names
-    tmp_dir = "/tmp"
-    backup_filename = f"backup_{index_name}_{timestamp}.json"
-    zip_filename = f"{backup_filename}.zip"
-    
-    # Paths for the temporary backup and zip files
-    backup_file_path = os.path.join(tmp_dir, backup_filename)
-    zip_file_path = os.path.join(tmp_dir, zip_filename)
+
+    if fmt not in FORMATS:
+        return jsonify({"msg": f"Unsupported format: {fmt}. Use one of {', '.join(FORMATS)}."}), 400
+    if not es.indices.exists(index=index_name):
+        return jsonify({"msg": f"Index '{index_name}' not found."}), 404
 
     try:
-        # Query Elasticsearch for the index data
-        query = {"query": {"match_all": {}}}
-        results = helpers.scan(es, index=index_name, query=query)
+        export = IndexExport(es, index_name, fields=fields, exclude_embedding=exclude_embedding,
+                             slices=request.args.get("slices", type=int), cursor=request.args.get("cursor"))
+        mimetype, extension = FORMATS[fmt]
+        backup_filename = f"backup_{index_name}_{timestamp}"
+        return Response(
+            export.stream(fmt, f"{backup_filename}.ndjson"),
+            mimetype=mimetype,
+            headers={"Content-Disposition": f"attachment; filename={backup_filename}.{extension}"}
+        )
+
+    except CursorExpired as e:
+        return jsonify({"msg": str(e)}), 410
+    except BackupError as e:
+        return jsonify({"msg": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error backing up index '{index_name}': {str(e)}")
+        return jsonify({"msg": f"Error backing up index: {str(e)}"}), 500
 
-        # Save the results to a JSON file in the tmp folder
-        with open(backup_file_path, "w") as backup_file:
-            for doc in results:
-                backup_file.write(json.dumps(doc) + "\n")
 
-        # Create a ZIP file for the JSON backup in the tmp folder
-        with zipfile.ZipFile(zip_file_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-            zipf.write(backup_file_path, arcname=backup_filename)
+def admin_required():
+    """
+    Return an error response unless the caller is listed in ADMIN_USERS.
+    """
+    if get_jwt_identity() not in Config.ADMIN_USERS:
+        logging.warning(f"Admin endpoint refused for user '{get_jwt_identity()}'")
+        return jsonify({"msg": "Admin privileges required"}), 403
+    return None
 
-        # Serve the ZIP file as a downloadable response
-        return send_file(zip_file_path, as_attachment=True, download_name=zip_filename)
 
-    except Exception as e:
-        logging.error(f"Error backing up index '{index_name}': {str(e)}")
-        return jsonify({"msg": f"Error backing up index: {str(e)}"}), 500
+@api_bp.route('/profiling', methods=['GET', 'POST'])
+@jwt_required()
+def profiling():
+    """
+    Show or change the sampling profiler settings (admin only). POST {"sample_percent": 5,
+    "interval_ms": 10} profiles 5% of requests in every worker; sample_percent 0 stops it.
+    """
+    denied = admin_required()
+    if denied:
+        return denied
 
-    finally:
-        # Clean up the temporary files after sending the response
-        if os.path.exists(backup_file_path):
-            os.remove(backup_file_path)
-        if os.path.exists(zip_file_path):
-            os.remove(zip_file_path)
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            settings = profiler.configure(data.get("sample_percent", 0), data.get("interval_ms"))
+        except (TypeError, ValueError):
+            return jsonify({"msg": "sample_percent and interval_ms must be numbers"}), 400
+    else:
+        settings = profiler.settings()
+
+    files = [dict(item, url=url_for('api.profile_file', name=item["name"])) for item in profiler.files()]
+    return jsonify({"settings": settings, "files": files}), 200
+
+
+@api_bp.route('/profiling/<name>', methods=['GET'])
+@jwt_required()
+def profile_file(name):
+    """
+    Download a collapsed-stack file (admin only), e.g. for flamegraph.pl or speedscope.
+    """
+    denied = admin_required()
+    if denied:
+        return denied
+    if not name.endswith(".collapsed"):
+        return jsonify({"msg": "Profile not found"}), 404
+    return send_from_directory(profiler.directory, name, mimetype="text/plain")
@@ -0,0 +1,286 @@
+import base64
+import io
+import json
+import logging
+import queue
+import threading
+import zipfile
+import zlib
+from datetime import datetime
+from .config import Config
+
+try:
+    import zstandard
+except ImportError:  # Optional: zstd backups are unavailable without it
+    zstandard = None
+
+logger = logging.getLogger()
+
+# Backup stream layout (NDJSON, one object per line):
+#   {"_meta": {...}}                            index name, mappings, settings and export options
+#   {"_index": ..., "_id": ..., "_source": ...}  one line per document
+#   {"_cursor": "..."}                          resume point covering every document above it
+#   {"_end": {"docs": n}}                       written only when the export completed
+FORMAT_VERSION = 1
+FORMATS = {
+    "zip": ("application/zip", "ndjson.zip"),
+    "gzip": ("application/gzip", "ndjson.gz"),
+    "zstd": ("application/zstd", "ndjson.zst"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+# Index settings worth carrying over to a restored index
+_SETTINGS = ("number_of_shards", "number_of_replicas", "analysis", "similarity")
+
+_DONE = object()
+
+
+class BackupError(Exception):
+    """
+    Raised for backup requests that cannot be served, e.g. invalid options or cursors.
+    """
+
+
+class CursorExpired(BackupError):
+    """
+    Raised when the point in time behind a resume cursor no longer exists.
+    """
+
+
+def check_slices(slices):
+    """
+    Validate a requested slice count and cap it at BACKUP_MAX_SLICES; each slice is a
+    reader thread and a PIT slice.
+    """
+    if not isinstance(slices, int) or slices < 1:
+        raise BackupError("slices must be a positive integer")
+    return min(slices, Config.BACKUP_MAX_SLICES)
+
+
+def encode_cursor(pit_id, slices, after):
+    state = {"pit": pit_id, "slices": slices, "after": after}
+    return base64.urlsafe_b64encode(json.dumps(state).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        pit_id, slices, after = state["pit"], state["slices"], {int(k): v for k, v in state["after"].items()}
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise BackupError(f"Invalid cursor: {e}")
+    # Slices cannot be capped on resume: the cursor's positions are per slice
+    if not isinstance(slices, int) or not 1 <= slices <= Config.BACKUP_MAX_SLICES:
+        raise BackupError(f"Invalid cursor: slices must be between 1 and {Config.BACKUP_MAX_SLICES}")
+    return pit_id, slices, after
+
+
+def source_filter(fields=None, exclude_embedding=False):
+    """
+    _source filter for the export: only the given fields, and/or everything except the embedding.
+    """
+    source = {}
+    if fields:
+        source["includes"] = list(fields)
+    if exclude_embedding:
+        source["excludes"] = ["embedding"]
+    return source or True
+
+
+def index_metadata(es, index_name):
+    """
+    Mappings and the portable part of the settings, so a restore can recreate the index.
+    """
+    mappings = next(iter(es.indices.get_mapping(index=index_name).values()))["mappings"]
+    settings = next(iter(es.indices.get_settings(index=index_name).values()))["settings"]["index"]
+    return mappings, {key: settings[key] for key in _SETTINGS if key in settings}
+
+
+class _Sink(io.RawIOBase):
+    """
+    Write-only stream that collects what the compressor writes until it is drained.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _compressor(fmt, name):
+    """
+    Return (write, finish) callables that turn NDJSON bytes into compressed output bytes.
+    """
+    if fmt == "ndjson":
+        return (lambda data: data), (lambda: b"")
+
+    if fmt == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress, compressor.flush
+
+    if fmt == "zstd":
+        if zstandard is None:
+            raise BackupError("zstd backups require the zstandard package")
+        sink = _Sink()
+        writer = zstandard.ZstdCompressor(level=3).stream_writer(sink, closefd=False)
+
+        def finish():
+            writer.close()
+            return sink.drain()
+
+        return (lambda data: (writer.write(data), sink.drain())[1]), finish
+
+    # The sink is not seekable, so zipfile writes data descriptors instead of seeking back
+    sink = _Sink()
+    archive = zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED)
+    member = archive.open(name, "w", force_zip64=True)
+
+    def finish():
+        member.close()
+        archive.close()
+        return sink.drain()
+
+    return (lambda data: (member.write(data), sink.drain())[1]), finish
+
+
+class IndexExport:
+    """
+    Parallel export of an index with a point in time: each slice pages with search_after
+    on its own thread, and pages are handed to the response generator through a bounded
+    queue so memory stays at a few pages regardless of index size.
+    """
+
+    def __init__(self, es, index_name, fields=None, exclude_embedding=False, slices=None, cursor=None):
+        self.es = es
+        self.index_name = index_name
+        self.fields = fields
+        self.exclude_embedding = exclude_embedding
+        self.keep_alive = Config.BACKUP_PIT_KEEP_ALIVE
+
+        if cursor:
+            self.pit_id, self.slices, self.after = decode_cursor(cursor)
+            try:
+                # Fails if the point in time expired since the cursor was issued
+                es.search(pit={"id": self.pit_id, "keep_alive": self.keep_alive}, size=0)
+            except Exception as e:
+                raise CursorExpired(f"Cursor can no longer be resumed: {e}")
+        else:
+            self.slices = check_slices(Config.BACKUP_SLICES if slices is None else slices)
+            self.pit_id = es.open_point_in_time(index=index_name, keep_alive=self.keep_alive)["id"]
+            self.after = {}
+
+        self._pages = queue.Queue(maxsize=Config.BACKUP_QUEUE_PAGES)
+        self._stop = threading.Event()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._pages.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def _read_slice(self, slice_id):
+        after = self.after.get(slice_id)
+        try:
+            while not self._stop.is_set():
+                # A finished slice is recorded as False in resume cursors
+                if after is False:
+                    break
+                params = {
+                    "pit": {"id": self.pit_id, "keep_alive": self.keep_alive},
+                    "sort": ["_shard_doc"],
+                    "size": Config.BACKUP_PAGE_SIZE,
+                    "source": source_filter(self.fields, self.exclude_embedding),
+                    "track_total_hits": False,
+                }
+                if self.slices > 1:
+                    params["slice"] = {"id": slice_id, "max": self.slices}
+                if after:
+                    params["search_after"] = after
+                hits = self.es.search(**params)["hits"]["hits"]
+                after = hits[-1]["sort"] if hits else False
+                self._put((slice_id, hits, after))
+        except Exception as e:
+            logger.error(f"Backup of '{self.index_name}' failed on slice {slice_id}: {e}")
+            self._put((slice_id, e, None))
+        finally:
+            self._put((slice_id, _DONE, None))
+
+    def lines(self):
+        """
+        Yield the backup as NDJSON byte lines.
+        """
+        mappings, settings = index_metadata(self.es, self.index_name)
+        meta = {
+            "version": FORMAT_VERSION,
+            "index": self.index_name,
+            "created": datetime.now().isoformat(),
+            "mappings": mappings,
+            "settings": settings,
+            "fields": self.fields,
+            "exclude_embedding": self.exclude_embedding,
+            "resumed": bool(self.after),
+        }
+        yield json.dumps({"_meta": meta}, ensure_ascii=False).encode("utf-8") + b"\n"
+
+        threads = [threading.Thread(target=self._read_slice, args=(i,), daemon=True) for i in range(self.slices)]
+        for thread in threads:
+            thread.start()
+
+        docs = 0
+        pages = 0
+        running = len(threads)
+        try:
+            while running:
+                slice_id, hits, after = self._pages.get()
+                if hits is _DONE:
+                    running -= 1
+                    continue
+                if isinstance(hits, Exception):
+                    # Leave the cursor for the pages already written so the client can resume
+                    yield json.dumps({"_cursor": encode_cursor(self.pit_id, self.slices, self.after)}).encode("utf-8") + b"\n"
+                    raise hits
+
+                yield b"".join(
+                    json.dumps({"_index": hit["_index"], "_id": hit["_id"], "_source": hit.get("_source", {})},
+                               ensure_ascii=False).encode("utf-8") + b"\n"
+                    for hit in hits
+                )
+                docs += len(hits)
+                self.after[slice_id] = after
+                pages += 1
+                if pages % Config.BACKUP_CURSOR_EVERY == 0:
+                    yield json.dumps({"_cursor": encode_cursor(self.pit_id, self.slices, self.after)}).encode("utf-8") + b"\n"
+
+            yield json.dumps({"_end": {"docs": docs}}).encode("utf-8") + b"\n"
+            # The point in time is only released on completion; an interrupted export stays resumable
+            self.es.close_point_in_time(id=self.pit_id)
+            logger.info(f"Backup of '{self.index_name}' completed: {docs} documents")
+        finally:
+            self._stop.set()
+
+    def stream(self, fmt, name):
+        """
+        Return a generator of the backup compressed in the given format.
+        The compressor is set up eagerly so an unavailable format fails before streaming starts.
+        """
+        write, finish = _compressor(fmt, name)
+
+        def generate():
+            for line in self.lines():
+                data = write(line)
+                if data:
+                    yield data
+            yield finish()
+
+        return generate()
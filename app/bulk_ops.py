@@ -0,0 +1,112 @@
+import logging
+from .config import Config
+
+logger = logging.getLogger()
+
+# Copies the request's fields into each matched document
+UPDATE_SCRIPT = "for (entry in params.fields.entrySet()) { ctx._source[entry.getKey()] = entry.getValue(); }"
+
+
+def update_script(fields):
+    return {"source": UPDATE_SCRIPT, "lang": "painless", "params": {"fields": fields}}
+
+
+def set_fields(es, tc_doc_id, fields, index_name=None):
+    """
+    Set fields on every document stored under one tc_doc_id in a single request.
+    """
+    index_name = index_name or Config.DOCUMENT_INDEX
+    response = es.update_by_query(index=index_name, query={"term": {"tc_doc_id": tc_doc_id}},
+                                  script=update_script(fields), conflicts="proceed", refresh=True)
+    return response.get("updated", 0)
+
+
+def tc_doc_id_batches(tc_doc_ids, batch_size=None):
+    """
+    Split tc_doc_ids into terms-query sized batches, dropping duplicates.
+    """
+    batch_size = batch_size or Config.BULK_TERMS_BATCH
+    unique = list(dict.fromkeys(str(tc_doc_id) for tc_doc_id in tc_doc_ids))
+    return [unique[i:i + batch_size] for i in range(0, len(unique), batch_size)]
+
+
+def target_indices():
+    indices = [Config.DOCUMENT_INDEX]
+    if Config.CHUNKED_INGESTION:
+        indices.append(Config.CHUNK_INDEX)
+    return ",".join(indices)
+
+
+def _run(es, method, tc_doc_ids, wait, **params):
+    """
+    Run a by-query operation over documents and their chunks, one request per batch of ids.
+    Returns ES task ids when wait is False, otherwise the per-batch responses.
+    """
+    results = []
+    for batch in tc_doc_id_batches(tc_doc_ids):
+        response = method(
+            index=target_indices(),
+            query={"terms": {"tc_doc_id": batch}},
+            slices=Config.BULK_SLICES,
+            conflicts="proceed",
+            refresh=True,
+            ignore_unavailable=True,
+            wait_for_completion=wait,
+            **params
+        )
+        results.append(response if wait else response["task"])
+    return results
+
+
+def delete_documents(es, tc_doc_ids, wait=False):
+    """
+    Delete every document and chunk stored under the given tc_doc_ids.
+    """
+    results = _run(es, es.delete_by_query, tc_doc_ids, wait)
+    logger.info(f"Delete by query for {len(tc_doc_ids)} tc_doc_id(s): {results if not wait else 'done'}")
+    return results
+
+
+def update_documents(es, tc_doc_ids, fields, wait=False):
+    """
+    Set metadata fields on every document and chunk stored under the given tc_doc_ids.
+    """
+    protected = set(fields) & set(Config.BULK_PROTECTED_FIELDS)
+    if protected:
+        hint = " (rename a document with PUT /update-document, which keeps its hash in step)" if "title" in protected else ""
+        raise ValueError(f"Fields cannot be updated in bulk: {', '.join(sorted(protected))}{hint}")
+    results = _run(es, es.update_by_query, tc_doc_ids, wait, script=update_script(fields))
+    logger.info(f"Update by query for {len(tc_doc_ids)} tc_doc_id(s): {results if not wait else 'done'}")
+    return results
+
+
+def summarize(responses):
+    """
+    Add up the counters of completed by-query responses.
+    """
+    totals = {"total": 0, "deleted": 0, "updated": 0, "version_conflicts": 0, "failures": []}
+    for response in responses:
+        for key in ("total", "deleted", "updated", "version_conflicts"):
+            totals[key] += response.get(key, 0)
+        totals["failures"].extend(response.get("failures", []))
+    return totals
+
+
+def task_status(es, task_id):
+    """
+    Progress of a by-query task started with wait_for_completion=false.
+    """
+    response = es.tasks.get(task_id=task_id)
+    status = response["task"].get("status", {})
+    return {
+        "task_id": task_id,
+        "completed": response.get("completed", False),
+        "action": response["task"].get("action"),
+        "running_seconds": round(response["task"].get("running_time_in_nanos", 0) / 1e9, 3),
+        "total": status.get("total"),
+        "deleted": status.get("deleted"),
+        "updated": status.get("updated"),
+        "version_conflicts": status.get("version_conflicts"),
+        "error": response.get("error"),
+        "failures": response.get("response", {}).get("failures", [])
+    }
@@ -0,0 +1,325 @@
+import hashlib
+import json
+import logging
+import struct
+import threading
+import unicodedata
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from .config import Config
+from .mappings import answer_cache_mapping
+from .metrics import observe, cache_lookup
+from . import redis_client
+
+logger = logging.getLogger()
+
+
+def normalize_text(text):
+    """
+    Normalize text before hashing so trivial whitespace differences share a cache entry.
+    """
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def normalize_query(text):
+    """
+    Normalize a search query for cache keys: NFKC, accent folding (Greek tonos and
+    dialytika included), case folding and whitespace collapsing.
+    """
+    text = unicodedata.normalize("NFKC", text)
+    text = "".join(c for c in unicodedata.normalize("NFD", text) if not unicodedata.combining(c))
+    return " ".join(text.casefold().split())
+
+
+def pack_vector(vector):
+    """
+    Pack a vector as little-endian float32 bytes.
+    """
+    return struct.pack(f"<{len(vector)}f", *vector)
+
+
+def unpack_vector(data):
+    """
+    Unpack little-endian float32 bytes into a list of floats.
+    """
+    return list(struct.unpack(f"<{len(data) // 4}f", data))
+
+
+@contextmanager
+def _tolerated(failure, stage=None):
+    """
+    Run a cache read or write, timed under stage. Caches are an optimization, so a
+    failure is logged and the caller carries on as if it missed.
+    """
+    try:
+        with observe(stage) if stage else nullcontext():
+            yield
+    except Exception as e:
+        logger.warning(f"{failure}: {e}")
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache: an in-process LRU in front of Redis.
+    Keys contain the embedding model name, so a model change never serves stale vectors.
+    """
+
+    def __init__(self, max_size=None, ttl=None, use_redis=None):
+        self.max_size = max_size or Config.EMBEDDING_CACHE_SIZE
+        self.ttl = ttl or Config.EMBEDDING_CACHE_TTL
+        self.use_redis = Config.USE_REDIS if use_redis is None else use_redis
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, text, model=None):
+        model = model or Config.EMBEDDING_MODEL
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"Embedding:{model}:{digest}"
+
+    def get(self, text, model=None):
+        key = self.key(text, model)
+        embedding = self._get_local(key)
+        if embedding is not None or not self.use_redis:
+            return embedding
+
+        data = None
+        with _tolerated("Embedding cache lookup in Redis failed", "redis"):
+            data = redis_client.get(key)
+        return self._from_redis(key, data)
+
+    def set(self, text, embedding, model=None):
+        key = self.key(text, model)
+        self._store_local(key, embedding)
+        if self.use_redis:
+            with _tolerated("Embedding cache write to Redis failed", "redis"):
+                redis_client.set(key, pack_vector(embedding), ex=self.ttl)
+
+    async def aget(self, text, redis, model=None):
+        """
+        get() for the async serving path, with a redis.asyncio client.
+        """
+        key = self.key(text, model)
+        embedding = self._get_local(key)
+        if embedding is not None or not self.use_redis:
+            return embedding
+
+        data = None
+        with _tolerated("Embedding cache lookup in Redis failed", "redis"):
+            data = await redis.get(key)
+        return self._from_redis(key, data)
+
+    async def aset(self, text, embedding, redis, model=None):
+        key = self.key(text, model)
+        self._store_local(key, embedding)
+        if self.use_redis:
+            with _tolerated("Embedding cache write to Redis failed", "redis"):
+                await redis.set(key, pack_vector(embedding), ex=self.ttl)
+
+    def _get_local(self, key):
+        with self._lock:
+            embedding = self._local.get(key)
+            if embedding is not None:
+                self._local.move_to_end(key)
+        cache_lookup("embedding_memory", embedding is not None)
+        return embedding
+
+    def _from_redis(self, key, data):
+        cache_lookup("embedding_redis", bool(data))
+        if not data:
+            return None
+        embedding = unpack_vector(data)
+        self._store_local(key, embedding)
+        return embedding
+
+    def _store_local(self, key, embedding):
+        with self._lock:
+            self._local[key] = embedding
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+
+class SearchCache:
+    """
+    Redis cache of search results, looked up before any embedding or search work.
+    Keys are versioned by the embedding and chat models and values are
+    zlib-compressed JSON that expire after REDIS_CACHE_EXPIRATION seconds.
+    """
+
+    FORMAT_VERSION = b"\x01"
+
+    def __init__(self, ttl=None, use_redis=None):
+        self.ttl = ttl or Config.REDIS_CACHE_EXPIRATION
+        self.use_redis = Config.USE_REDIS if use_redis is None else use_redis
+
+    def key(self, query):
+        digest = hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+        return f"Search:{Config.EMBEDDING_MODEL}:{Config.MODEL}:{digest}"
+
+    def get(self, query):
+        if not self.use_redis:
+            return None
+        data = None
+        with _tolerated("Search cache lookup failed", "redis"):
+            data = redis_client.get(self.key(query))
+        return self._result(data)
+
+    def set(self, query, result):
+        if self.use_redis:
+            with _tolerated("Search cache write failed", "redis"):
+                redis_client.set(self.key(query), self.encode(result), ex=self.ttl)
+
+    async def aget(self, query, redis):
+        """
+        get() for the async serving path, with a redis.asyncio client.
+        """
+        if not self.use_redis:
+            return None
+        data = None
+        with _tolerated("Search cache lookup failed", "redis"):
+            data = await redis.get(self.key(query))
+        return self._result(data)
+
+    async def aset(self, query, result, redis):
+        if self.use_redis:
+            with _tolerated("Search cache write failed", "redis"):
+                await redis.set(self.key(query), self.encode(result), ex=self.ttl)
+
+    def encode(self, result):
+        return self.FORMAT_VERSION + zlib.compress(json.dumps(result, ensure_ascii=False).encode("utf-8"))
+
+    def decode(self, data):
+        # Entries written in another format (e.g. plain JSON from older releases) count as misses
+        if not data.startswith(self.FORMAT_VERSION):
+            return None
+        try:
+            return json.loads(zlib.decompress(data[1:]).decode("utf-8"))
+        except (zlib.error, ValueError):
+            return None
+
+    def _result(self, data):
+        result = self.decode(data) if data else None
+        cache_lookup("search", result is not None)
+        return result
+
+
+class SemanticCache:
+    """
+    Answer cache keyed by query meaning rather than wording.
+
+    Each answered query is stored in a small Elasticsearch index with its embedding
+    and the hash of the document the answer was generated from. A new query reuses
+    a stored answer when its embedding is within SEMANTIC_CACHE_THRESHOLD cosine
+    similarity and it retrieved the same top document.
+    """
+
+    def __init__(self, index_name=None, threshold=None, ttl=None, enabled=None):
+        self.index_name = index_name or Config.SEMANTIC_CACHE_INDEX
+        self.threshold = Config.SEMANTIC_CACHE_THRESHOLD if threshold is None else threshold
+        self.ttl = ttl or Config.SEMANTIC_CACHE_TTL
+        self.enabled = Config.SEMANTIC_CACHE_ENABLED if enabled is None else enabled
+        self._index_ready = False
+
+    def lookup(self, es, embedding, document):
+        """
+        Return a stored answer for a similar query on the same document, or None.
+        """
+        if not self._applies(document):
+            return None
+        hits = []
+        with _tolerated("Semantic cache lookup failed", "semantic_cache"):
+            hits = es.search(index=self.index_name, body=self._lookup_query(embedding, document),
+                             ignore_unavailable=True)["hits"]["hits"]
+        return self._answer(hits)
+
+    async def alookup(self, es, embedding, document):
+        """
+        lookup() for the async serving path, with an AsyncElasticsearch client.
+        """
+        if not self._applies(document):
+            return None
+        hits = []
+        with _tolerated("Semantic cache lookup failed", "semantic_cache"):
+            hits = (await es.search(index=self.index_name, body=self._lookup_query(embedding, document),
+                                    ignore_unavailable=True))["hits"]["hits"]
+        return self._answer(hits)
+
+    def store(self, es, query, embedding, document, answer):
+        """
+        Remember the answer generated for a query on a document.
+        """
+        if not self._applies(document):
+            return
+        with _tolerated("Semantic cache write failed"):
+            if not self._index_ready:
+                self._index_checked(es.options(ignore_status=[400]).indices.create(index=self.index_name, body=self._mapping()))
+            es.index(index=self.index_name, document=self._entry(query, embedding, document, answer))
+
+    async def astore(self, es, query, embedding, document, answer):
+        """
+        store() for the async serving path, with an AsyncElasticsearch client.
+        """
+        if not self._applies(document):
+            return
+        with _tolerated("Semantic cache write failed"):
+            if not self._index_ready:
+                self._index_checked(await es.options(ignore_status=[400]).indices.create(index=self.index_name, body=self._mapping()))
+            await es.index(index=self.index_name, document=self._entry(query, embedding, document, answer))
+
+    def _applies(self, document):
+        return self.enabled and bool(document.get("hash"))
+
+    def _index_checked(self, response):
+        # Creation is attempted once per process; a 400 means the index already exists
+        if response.meta.status == 200:
+            logger.info(f"Index '{self.index_name}' created successfully.")
+        self._index_ready = True
+
+    def _lookup_query(self, embedding, document):
+        return {
+            "knn": {
+                "field": "embedding",
+                "query_vector": embedding,
+                "k": 1,
+                "num_candidates": 10,
+                "similarity": self.threshold,
+                "filter": {"bool": {"filter": [
+                    {"term": {"doc_hash": document["hash"]}},
+                    {"term": {"embedding_model": Config.EMBEDDING_MODEL}},
+                    {"term": {"chat_model": Config.MODEL}},
+                    {"range": {"timestamp": {"gte": f"now-{self.ttl}s"}}}
+                ]}}
+            },
+            "_source": ["query", "answer"],
+            "size": 1
+        }
+
+    def _answer(self, hits):
+        cache_lookup("semantic", bool(hits))
+        if not hits:
+            return None
+
+        logger.info(f"Semantic cache hit (score {hits[0]['_score']}) for stored query: {hits[0]['_source']['query']}")
+        return hits[0]["_source"]["answer"]
+
+    def _entry(self, query, embedding, document, answer):
+        return {
+            "query": query,
+            "answer": answer,
+            "doc_hash": document["hash"],
+            "tc_doc_id": document.get("tc_doc_id"),
+            "embedding_model": Config.EMBEDDING_MODEL,
+            "chat_model": Config.MODEL,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "embedding": embedding
+        }
+
+    def _mapping(self):
+        return answer_cache_mapping()
+
+
+embedding_cache = EmbeddingCache()
+search_cache = SearchCache()
+semantic_cache = SemanticCache()
@@ -0,0 +1,235 @@
+import logging
+import re
+from datetime import datetime
+from .config import Config
+from .mappings import chunk_mapping
+from .aliases import ensure_alias
+
+logger = logging.getLogger()
+
+# Rough token estimate used when no model tokenizer is available. Every word or
+# punctuation mark counts as one token, and long words (common in Greek
+# contracts) count extra because subword tokenizers split them.
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_WORD_RE = re.compile(r"\S+")
+
+
+def estimate_tokens(text):
+    """
+    Estimate the number of model tokens in a piece of text.
+    """
+    return sum(1 + len(token) // 8 for token in _TOKEN_RE.findall(text))
+
+
+def _split_word(word, max_tokens):
+    """
+    Hard-split a whitespace-free run (OCR noise, long URLs) into pieces of at most max_tokens.
+    """
+    pieces = []
+    while word:
+        size = len(word)
+        cost = estimate_tokens(word)
+        while size > 1 and cost > max_tokens:
+            size = min(size - 1, size * max_tokens // cost)
+            cost = estimate_tokens(word[:max(size, 1)])
+        size = max(size, 1)
+        pieces.append((word[:size], cost))
+        word = word[size:]
+    return pieces
+
+
+def chunk_pages(pages, max_tokens=None, overlap_tokens=None):
+    """
+    Split per-page text records into overlapping, token-bounded passages.
+    Each passage keeps the page range it was taken from.
+    """
+    max_tokens = max_tokens or Config.CHUNK_MAX_TOKENS
+    overlap_tokens = Config.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+
+    # Flatten the pages into (word, page, starts_line, cost) tuples so passages can span pages
+    words = []
+    for page in pages:
+        text = page.get("text") or ""
+        last_end = 0
+        for match in _WORD_RE.finditer(text):
+            starts_line = last_end == 0 or "\n" in text[last_end:match.start()]
+            word = match.group()
+            cost = estimate_tokens(word)
+            if cost <= max_tokens:
+                words.append((word, page["page"], starts_line, cost))
+            else:
+                # A single word would otherwise become one passage far over the limit
+                for piece, piece_cost in _split_word(word, max_tokens):
+                    words.append((piece, page["page"], starts_line, piece_cost))
+                    starts_line = False
+            last_end = match.end()
+
+    passages = []
+    start = 0
+    while start < len(words):
+        end = start
+        total = 0
+        while end < len(words) and (end == start or total + words[end][3] <= max_tokens):
+            total += words[end][3]
+            end += 1
+
+        parts = [words[start][0]]
+        for word, _, starts_line, _ in words[start + 1:end]:
+            parts.append("\n" if starts_line else " ")
+            parts.append(word)
+
+        passages.append({
+            "chunk_id": len(passages),
+            "content": "".join(parts),
+            "page_start": words[start][1],
+            "page_end": words[end - 1][1],
+            "tokens": total
+        })
+
+        if end >= len(words):
+            break
+
+        # Step back so consecutive passages share up to overlap_tokens, leaving room for the
+        # next word; otherwise a long word makes every following passage advance by one word
+        next_start = end
+        overlap = 0
+        room = min(overlap_tokens, max_tokens - words[end][3])
+        while next_start > start + 1 and overlap + words[next_start - 1][3] <= room:
+            next_start -= 1
+            overlap += words[next_start][3]
+        start = next_start
+
+    return passages
+
+
+def trim_overlap(previous, current, overlap_tokens=None):
+    """
+    Split the text of the passage following previous into the words it repeats from
+    previous's end and the rest. Returns (repeated, rest).
+    """
+    overlap_tokens = Config.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    tail = _WORD_RE.findall(previous)
+    head = list(_WORD_RE.finditer(current))
+
+    # chunk_pages steps back as many words as the overlap allows, so no longer run can be shared
+    longest = 0
+    cost = 0
+    while longest < min(len(tail) - 1, len(head)) and cost + estimate_tokens(tail[-longest - 1]) <= overlap_tokens:
+        longest += 1
+        cost += estimate_tokens(tail[-longest])
+
+    for size in range(longest, 0, -1):
+        if tail[-size:] == [match.group() for match in head[:size]]:
+            end = head[size - 1].end()
+            return current[:end], current[end:].lstrip()
+    return "", current
+
+
+def mean_embedding(embeddings):
+    """
+    Average passage embeddings into a single document-level vector.
+    """
+    embeddings = [e for e in embeddings if e]
+    if not embeddings:
+        return None
+    return [sum(values) / len(embeddings) for values in zip(*embeddings)]
+
+
+def create_chunk_index(es, index_name=None):
+    """
+    Create the passage index used by chunked ingestion if it does not exist yet.
+    """
+    index_name = index_name or Config.CHUNK_INDEX
+    mapping = chunk_mapping()
+    ensure_alias(es, index_name, mapping)
+
+
+def build_chunk_actions(tc_doc_id, title, doc_hash, passages, embeddings, index_name=None):
+    """
+    Build bulk index actions for the passages of one document.
+    """
+    index_name = index_name or Config.CHUNK_INDEX
+    timestamp = datetime.now().isoformat()
+    for passage, embedding in zip(passages, embeddings):
+        yield {
+            "_op_type": "index",
+            "_index": index_name,
+            # Deterministic ids make re-indexing the same document idempotent
+            "_id": f"{tc_doc_id}:{title}:{passage['chunk_id']}",
+            "_source": {
+                "tc_doc_id": tc_doc_id,
+                "title": title,
+                "content": passage["content"],
+                "hash": doc_hash,
+                "chunk_id": passage["chunk_id"],
+                "page_start": passage["page_start"],
+                "page_end": passage["page_end"],
+                "timestamp": timestamp,
+                "embedding": embedding
+            }
+        }
+
+
+def delete_chunks(es, tc_doc_id, index_name=None):
+    """
+    Delete all passages that belong to a TotalCare document.
+    """
+    index_name = index_name or Config.CHUNK_INDEX
+    response = es.delete_by_query(
+        index=index_name,
+        body={"query": {"term": {"tc_doc_id": tc_doc_id}}},
+        ignore_unavailable=True,
+        refresh=True
+    )
+    return response.get("deleted", 0)
+
+
+def delete_stale_chunks(es, tc_doc_id, doc_hash, index_name=None):
+    """
+    Delete the passages of a TotalCare document left over from an earlier version,
+    i.e. those whose hash differs from doc_hash. Run it after the new passages are indexed.
+    """
+    index_name = index_name or Config.CHUNK_INDEX
+    response = es.delete_by_query(
+        index=index_name,
+        body={"query": {"bool": {
+            "filter": [{"term": {"tc_doc_id": tc_doc_id}}],
+            "must_not": [{"term": {"hash": doc_hash}}]
+        }}},
+        ignore_unavailable=True,
+        refresh=True
+    )
+    return response.get("deleted", 0)
+
+
+def merge_passages(hits, max_passages=None):
+    """
+    Turn passage hits into a single document for the LLM prompt.
+    Only passages of the best matching parent document are kept, in document order.
+    """
+    if not hits:
+        return None
+    max_passages = max_passages or Config.CHUNK_CONTEXT_PASSAGES
+
+    top = hits[0]["_source"]
+    # All retrieved passages of the document, in score order
+    retrieved = [
+        hit["_source"] for hit in hits
+        if hit["_source"].get("tc_doc_id") == top.get("tc_doc_id")
+        and hit["_source"].get("title") == top.get("title")
+    ]
+    selected = sorted(retrieved[:max_passages], key=lambda passage: passage.get("chunk_id", 0))
+
+    content = "\n\n".join(
+        f"[pages {p.get('page_start')}-{p.get('page_end')}]\n{p.get('content', '')}"
+        for p in selected
+    )
+    # All of them, in document order, for the token-budgeted context builder
+    passages = sorted(retrieved, key=lambda passage: passage.get("chunk_id", 0))
+    return {
+        "tc_doc_id": top.get("tc_doc_id"),
+        "title": top.get("title"),
+        "hash": top.get("hash"),
+        "content": content,
+        "passages": passages
+    }
@@ -8,15 +8,120 @@ class Config:
     RATE_LIMIT_MAX_REQUESTS = 10000  # Maximum requests per time window
     RATE_LIMIT_WINDOW_SECONDS = 1  # Time window in seconds (5 minutes)
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-    OLLAMA_API_URL = "http://localhost:11434/api/embeddings"
-    OLLAMA_MODEL = "paraphrase-multilingual"
+    OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434/api/embed")  # Batch endpoint, accepts a list of inputs
+    OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "paraphrase-multilingual")
     MODEL = "gpt-4o-mini"  # Set this to your GPT model ID or name
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
     # Redis URL for caching
-    REDIS_URL = "redis://localhost:6379/0"
+    REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
     BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-    SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(BASE_DIR, 'database/app.db')}"
+    SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", f"sqlite:///{os.path.join(BASE_DIR, 'database/app.db')}")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    ELASTICSEARCH_URL = "http://localhost:9200"
-    USE_REDIS = False  # Check if Redis caching is enabled
+    ELASTICSEARCH_URL = os.getenv("ELASTICSEARCH_URL", "http://localhost:9200")
+    DOCUMENT_INDEX = os.getenv("DOCUMENT_INDEX", "pdf_documents")  # Alias of the current versioned document index
+    USE_REDIS = os.getenv("USE_REDIS", "false").lower() == "true"  # Check if Redis caching is enabled
     REDIS_CACHE_EXPIRATION = 3600  # Cache expiration in seconds
+    # Passage-level (chunked) ingestion and retrieval
+    CHUNKED_INGESTION = os.getenv("CHUNKED_INGESTION", "false").lower() == "true"
+    CHUNK_INDEX = os.getenv("CHUNK_INDEX", "pdf_chunks")  # Alias, like DOCUMENT_INDEX
+    CHUNK_MAX_TOKENS = 256  # Keep passages inside the embedding model's input window
+    CHUNK_OVERLAP_TOKENS = 32
+    CHUNK_SEARCH_SIZE = 20  # Passages retrieved per query
+    CHUNK_CONTEXT_PASSAGES = 6  # Passages of the top document sent to the LLM
+    # Embedding cache (in-process LRU, plus Redis when USE_REDIS is enabled)
+    EMBEDDING_CACHE_SIZE = 4096  # Maximum vectors kept in memory per worker
+    EMBEDDING_CACHE_TTL = 7 * 24 * 3600  # Redis expiration in seconds
+    # Embedding client
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "ollama")  # "ollama" or "openai"
+    OPENAI_EMBEDDING_URL = "https://api.openai.com/v1/embeddings"
+    OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
+    EMBEDDING_MODEL = OLLAMA_MODEL if EMBEDDING_BACKEND == "ollama" else OPENAI_EMBEDDING_MODEL
+    EMBEDDING_POOL_SIZE = 8  # Keep-alive connections and concurrent batch requests
+    EMBEDDING_BATCH_SIZE = 32  # Maximum inputs per request
+    EMBEDDING_BATCH_WINDOW_MS = 5  # How long single calls wait to be batched together
+    EMBEDDING_MAX_RETRIES = 3
+    EMBEDDING_RETRY_BACKOFF = 0.5  # Seconds, doubled on every retry
+    EMBEDDING_TIMEOUT = 60
+    # Semantic answer cache (reuses answers of near-identical questions on the same document)
+    SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    SEMANTIC_CACHE_INDEX = "sla_answer_cache"
+    SEMANTIC_CACHE_THRESHOLD = 0.95  # Minimum cosine similarity between queries
+    SEMANTIC_CACHE_TTL = 7 * 24 * 3600  # Seconds a stored answer stays reusable
+    # Asynchronous ingestion jobs
+    ASYNC_INGESTION = os.getenv("ASYNC_INGESTION", "false").lower() == "true"  # Default when the request sets no "async" field
+    JOB_QUEUE = "Jobs:queue"
+    JOB_TTL = 7 * 24 * 3600  # Seconds job status is kept in Redis
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # Worker processes started by worker.py
+    SPOOL_DIR = "/tmp/semantic_sla_spool"  # Uploads waiting for a worker; must be shared with the workers
+    # OCR of scanned PDFs
+    OCR_LANG = "ell+eng"
+    OCR_DPI = 300
+    OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0"))  # 0 = one per CPU, capped by the memory ceiling
+    OCR_MAX_MEMORY_MB = int(os.getenv("OCR_MAX_MEMORY_MB", "2048"))  # Ceiling for all OCR workers together
+    OCR_HARD_MEMORY_LIMIT = True  # Enforce each worker's share of the ceiling on its Tesseract processes with RLIMIT_AS
+    OCR_WINDOW_PAGES = 8  # Pages rasterized to temp files at a time
+    OCR_WORKER_BASE_MB = 160  # Tesseract process and language models
+    OCR_IMAGE_COPIES = 6  # Working copies of the page image Tesseract holds
+    OCR_MIN_PAGE_CHARS = 100  # Pages with fewer non-space characters in their text layer are OCR'd
+    OCR_MIN_ALNUM_RATIO = 0.5  # Pages whose text layer is mostly symbols are OCR'd
+    # On-disk cache of extracted PDF text, shared by the API, job workers and tools
+    EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+    EXTRACTION_CACHE_DIR = os.path.join(os.path.dirname(BASE_DIR), "tmp", "extraction_cache")
+    EXTRACTION_CACHE_MAX_MB = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "1024"))
+    EXTRACTION_CACHE_SCAN_SECONDS = 600  # Rescan at least this often to count entries written by other processes
+    # Token-budgeted LLM context
+    CONTEXT_TOKEN_BUDGET = 6000  # Document tokens per prompt for models not listed below
+    CONTEXT_TOKEN_BUDGETS = {"gpt-4o-mini": 6000, "gpt-4o": 8000}
+    CONTEXT_PASSAGE_TOKENS = 200  # Passage size when ranking unchunked documents
+    CONTEXT_LEXICAL_WEIGHT = 0.4
+    CONTEXT_VECTOR_WEIGHT = 0.6
+    # Streaming index backups
+    BACKUP_SLICES = 4  # Parallel point-in-time slices
+    BACKUP_MAX_SLICES = 16  # Most slices a request may ask for; each one is a reader thread
+    BACKUP_PAGE_SIZE = 1000  # Documents per search_after page
+    BACKUP_PIT_KEEP_ALIVE = "10m"  # How long an interrupted backup can be resumed
+    BACKUP_QUEUE_PAGES = 8  # Pages buffered between the slice readers and the response
+    BACKUP_CURSOR_EVERY = 10  # Pages between resume cursor records
+    # Bulk delete/update by tc_doc_id
+    BULK_TERMS_BATCH = 10000  # tc_doc_ids per by-query request (ES allows up to 65536 terms)
+    BULK_SLICES = "auto"  # Parallel slices for delete_by_query/update_by_query
+    BULK_PROTECTED_FIELDS = ("tc_doc_id", "title", "content", "hash", "content_digest", "embedding")  # Not settable by bulk update; hash covers title
+    # Batch SLA checks
+    BATCH_MAX_ITEMS = 500  # Items accepted per /check-sla-batch request
+    BATCH_LLM_CONCURRENCY = 4  # Parallel LLM calls per batch; keep within the OpenAI rate limit
+    # Async serving mode for the query endpoints (run_async.py)
+    JWT_SECRET_KEY = SECRET_KEY  # Shared by Flask-JWT-Extended and the async token check
+    ASYNC_PORT = 8009
+    ASYNC_LLM_CONCURRENCY = 256  # OpenAI calls in flight per process
+    ASYNC_ES_CONNECTIONS = 64  # Per Elasticsearch node, per process
+    ASYNC_REDIS_CONNECTIONS = 64
+    # Hybrid retrieval (lexical + kNN)
+    RETRIEVAL_FUSION = os.getenv("RETRIEVAL_FUSION", "rrf")  # "rrf" (native retriever) or "weighted"
+    RETRIEVAL_SIZE = 10  # Documents returned per query (passages: CHUNK_SEARCH_SIZE)
+    RETRIEVAL_WINDOW = 50  # Candidates per retriever before fusion; also the kNN k
+    RETRIEVAL_NUM_CANDIDATES = 200  # kNN candidates per shard; raise for recall, lower for latency
+    RETRIEVAL_RANK_CONSTANT = 60  # rrf: higher values flatten the contribution of top ranks
+    RETRIEVAL_LEXICAL_WEIGHT = 0.3  # weighted: blend of min-max normalized scores
+    RETRIEVAL_VECTOR_WEIGHT = 0.7
+    RETRIEVAL_LEXICAL_FIELDS = ["title", "content"]
+    RETRIEVAL_FUZZINESS = "AUTO"
+    RETRIEVAL_SOURCE_FIELDS = ["tc_doc_id", "title", "hash"]  # Candidate hits; winners are fetched in full with mget
+    # Vector field layout, shared by every index with an embedding (app/mappings.py)
+    EMBEDDING_DIMS = int(os.getenv("EMBEDDING_DIMS", "768" if EMBEDDING_BACKEND == "ollama" else "1536"))
+    VECTOR_SIMILARITY = "cosine"
+    VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "int8_hnsw")  # hnsw, int8_hnsw, int4_hnsw or bbq_hnsw
+    VECTOR_HNSW_M = 16  # Graph neighbours per node; higher improves recall at the cost of memory
+    VECTOR_HNSW_EF_CONSTRUCTION = 100  # Candidates considered while building the graph
+    VECTOR_CONFIDENCE_INTERVAL = None  # int8/int4 quantile; None lets Elasticsearch choose
+    # Prometheus metrics (app/metrics.py); api.sh sets PROMETHEUS_MULTIPROC_DIR to aggregate worker processes
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    METRICS_PATH = "/metrics"
+    # Per-request stage tracing and the sampling profiler (app/tracing.py, app/profiler.py)
+    SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+    PROFILE_DIR = os.path.join(os.path.dirname(BASE_DIR), "tmp", "profiles")  # Shared by every worker process
+    PROFILE_INTERVAL_MS = 10  # Default time between stack samples of a profiled request
+    ADMIN_USERS = [user for user in os.getenv("ADMIN_USERS", "").split(",") if user]  # May change profiler settings
+    # Zero-downtime reindex / re-embed (tools/reindex.py)
+    REINDEX_BATCH_SIZE = 500  # Documents read per scroll page and written per bulk request
+    REINDEX_EMBED_BATCH = 32  # Texts per embedding request while re-embedding
+    REINDEX_MAX_EMBED_RATE = 0  # Embedding requests per second while re-embedding; 0 disables throttling
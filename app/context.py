@@ -0,0 +1,191 @@
+import logging
+import math
+import re
+from collections import Counter
+from .config import Config
+from .cache import normalize_query
+from .chunking import chunk_pages, estimate_tokens, trim_overlap
+
+try:
+    import tiktoken
+except ImportError:  # Pinned in requirements.txt; the chunking estimate only covers partial installs
+    tiktoken = None
+
+logger = logging.getLogger()
+
+_TERM_RE = re.compile(r"\w{3,}")
+
+# Lines that start a contract section, compared after accent and case folding
+_HEADING_WORDS = ("αρθρο", "παραρτημα", "κεφαλαιο", "ενοτητα", "article", "annex", "appendix", "chapter", "section", "schedule")
+_NUMBERED_HEADING_RE = re.compile(r"^\d+(\.\d+)*\.?\s+\S")
+
+_encodings = {}
+
+
+def count_tokens(text, model=None):
+    """
+    Count tokens with the model's tokenizer, or estimate them if tiktoken is missing.
+    """
+    model = model or Config.MODEL
+    encoding = _encoding(model) if tiktoken is not None else None
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _encoding(model):
+    """
+    The model's tiktoken encoding, or None once loading it has failed.
+    The first load downloads the BPE file unless TIKTOKEN_CACHE_DIR already holds it,
+    so a failure is remembered instead of retried on every prompt.
+    """
+    if model not in _encodings:
+        try:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning(f"Tokenizer for {model} unavailable, estimating tokens instead: {e}")
+            _encodings[model] = None
+    return _encodings[model]
+
+
+def token_budget(model=None):
+    model = model or Config.MODEL
+    return Config.CONTEXT_TOKEN_BUDGETS.get(model, Config.CONTEXT_TOKEN_BUDGET)
+
+
+def is_heading(line):
+    line = line.strip()
+    if not line or len(line) > 100:
+        return False
+    folded = normalize_query(line)
+    if folded.startswith(_HEADING_WORDS) or _NUMBERED_HEADING_RE.match(line):
+        return True
+    letters = [c for c in line if c.isalpha()]
+    return len(line) <= 80 and len(letters) >= 4 and all(c.isupper() for c in letters)
+
+
+def _terms(text):
+    return _TERM_RE.findall(normalize_query(text))
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def score_passages(query, passages, query_embedding=None):
+    """
+    Score passages against the query: BM25 over the document's own passages,
+    blended with cosine similarity when passage embeddings are available.
+    """
+    query_terms = set(_terms(query))
+    passage_terms = [Counter(_terms(p["content"])) for p in passages]
+    average_length = sum(sum(t.values()) for t in passage_terms) / max(len(passages), 1) or 1
+    k1, b = 1.2, 0.75
+    containing = Counter(term for t in passage_terms for term in query_terms.intersection(t))
+    idf = {term: math.log(1 + (len(passages) - containing[term] + 0.5) / (containing[term] + 0.5)) for term in containing}
+
+    lexical = []
+    for terms in passage_terms:
+        length = sum(terms.values())
+        score = 0.0
+        for term in query_terms:
+            frequency = terms.get(term, 0)
+            if not frequency:
+                continue
+            score += idf[term] * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * length / average_length))
+        lexical.append(score)
+
+    top_lexical = max(lexical, default=0) or 1
+    scores = []
+    for passage, lexical_score in zip(passages, lexical):
+        score = Config.CONTEXT_LEXICAL_WEIGHT * lexical_score / top_lexical
+        if query_embedding and passage.get("embedding"):
+            score += Config.CONTEXT_VECTOR_WEIGHT * _cosine(query_embedding, passage["embedding"])
+        scores.append(score)
+    return scores
+
+
+def build_context(query, document, query_embedding=None, model=None, budget=None):
+    """
+    Assemble the document text sent to the LLM within a token budget.
+    Passages are ranked against the query, the best ones are packed into the budget
+    and emitted in document order, each under the section heading it belongs to.
+    """
+    model = model or Config.MODEL
+    budget = budget or token_budget(model)
+    content = document.get("content", "")
+
+    passages = document.get("passages")
+    if not passages:
+        # Small documents are sent whole
+        if count_tokens(content, model) <= budget:
+            return content
+        passages = chunk_pages([{"page": 1, "text": content}], Config.CONTEXT_PASSAGE_TOKENS, 0)
+    passages = sorted(passages, key=lambda p: p.get("chunk_id", 0))
+
+    # The heading in force at each passage is the last one seen before or at its first line
+    headings = []
+    current = None
+    for passage in passages:
+        lines = passage["content"].splitlines()
+        if lines and is_heading(lines[0]):
+            current = lines[0].strip()
+        headings.append(current)
+        for line in lines[1:]:
+            if is_heading(line):
+                current = line.strip()
+
+    # Indexed passages repeat the end of the one before; that text is sent and counted once
+    follows = [i > 0 and passage.get("chunk_id", i) == passages[i - 1].get("chunk_id", i - 1) + 1
+               for i, passage in enumerate(passages)]
+    rests = [passage["content"] for passage in passages]
+    repeated = [0] * len(passages)
+    if document.get("passages"):
+        for i in range(1, len(passages)):
+            if follows[i]:
+                shared, rests[i] = trim_overlap(passages[i - 1]["content"], passages[i]["content"])
+                repeated[i] = count_tokens(shared, model) if shared else 0
+
+    scores = score_passages(query, passages, query_embedding)
+    ranked = sorted(range(len(passages)), key=lambda i: scores[i], reverse=True)
+
+    selected = set()
+    used = 0
+    for i in ranked:
+        cost = count_tokens(passages[i]["content"], model)
+        if i - 1 in selected:
+            cost -= repeated[i]
+        if i + 1 in selected:
+            cost -= repeated[i + 1]
+        if headings[i]:
+            cost += count_tokens(headings[i], model)
+        if document.get("passages"):
+            cost += 8  # Page range marker
+        if used + cost > budget:
+            continue
+        selected.add(i)
+        used += cost
+
+    parts = []
+    previous = None
+    last_heading = None
+    for i in sorted(selected):
+        passage = passages[i]
+        adjacent = previous is not None and follows[i] and i - 1 in selected
+        if previous is not None and not adjacent:
+            parts.append("[...]")
+        if headings[i] and headings[i] != last_heading and not passage["content"].startswith(headings[i]):
+            parts.append(headings[i])
+        last_heading = headings[i]
+        if document.get("passages"):
+            parts.append(f"[pages {passage['page_start']}-{passage['page_end']}]")
+        parts.append(rests[i] if adjacent else passage["content"])
+        previous = passage.get("chunk_id", i)
+
+    logger.info(f"Context for {document.get('title')}: {len(selected)} of {len(passages)} passages, {used} of {budget} tokens")
+    return "\n".join(parts)
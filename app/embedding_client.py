@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from .config import Config
+from .metrics import observe
+from . import tracing
+
+logger = logging.getLogger()
+
+# HTTP statuses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class EmbeddingError(Exception):
+    """
+    Raised when the embedding backend cannot produce vectors after all retries.
+    """
+
+
+class EmbeddingClient:
+    """
+    Embedding client with a keep-alive connection pool, multi-input batch requests,
+    retry with exponential backoff and micro-batching of concurrent callers.
+
+    Supported backends are Ollama (`/api/embed` with an input list) and the
+    OpenAI embeddings API (`input=[...]`).
+    """
+
+    def __init__(self, backend=None, url=None, model=None, api_key=None, pool_size=None,
+                 batch_size=None, batch_window_ms=None, max_retries=None, backoff=None, timeout=None):
+        self.backend = backend or Config.EMBEDDING_BACKEND
+        if self.backend not in ("ollama", "openai"):
+            raise ValueError(f"Unsupported embedding backend: {self.backend}")
+
+        if self.backend == "ollama":
+            self.url = url or Config.OLLAMA_API_URL
+            self.model = model or Config.OLLAMA_MODEL
+        else:
+            self.url = url or Config.OPENAI_EMBEDDING_URL
+            self.model = model or Config.OPENAI_EMBEDDING_MODEL
+        self.api_key = api_key or Config.OPENAI_API_KEY
+        self.pool_size = pool_size or Config.EMBEDDING_POOL_SIZE
+        self.batch_size = batch_size or Config.EMBEDDING_BATCH_SIZE
+        self.batch_window = (Config.EMBEDDING_BATCH_WINDOW_MS if batch_window_ms is None else batch_window_ms) / 1000.0
+        self.max_retries = Config.EMBEDDING_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = Config.EMBEDDING_RETRY_BACKOFF if backoff is None else backoff
+        self.timeout = timeout or Config.EMBEDDING_TIMEOUT
+
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def embed(self, text):
+        """
+        Embed a single text. Concurrent callers within the batch window share one request.
+        """
+        self._ensure_started()
+        future = Future()
+        self._queue.put((text, future))
+        # The request runs on the batcher's thread, so the wait is traced here
+        with tracing.stage("embedding"):
+            return future.result()
+
+    def embed_batch(self, texts):
+        """
+        Embed many texts with as few requests as the batch size allows.
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        self._ensure_started()
+
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1:
+            return self._request(batches[0])
+
+        embeddings = []
+        with tracing.stage("embedding"):
+            for result in self._executor.map(self._request, batches):
+                embeddings.extend(result)
+        return embeddings
+
+    def _ensure_started(self):
+        # Sessions, threads and pools do not survive a fork, so they are created per process
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="embedding")
+            self._queue = queue.Queue()
+            threading.Thread(target=self._dispatch, name="embedding-batcher", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _dispatch(self):
+        """
+        Collect queued single-text calls into micro-batches and send them on the pool.
+        """
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._resolve, batch)
+
+    def _resolve(self, batch):
+        try:
+            embeddings = self._request([text for text, _ in batch])
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+
+    async def aembed_batch(self, texts):
+        """
+        Async embed_batch for the async serving path; requests run concurrently
+        on a keep-alive aiohttp session owned by the running event loop.
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = await asyncio.gather(*(self._arequest(batch) for batch in batches))
+        return [embedding for result in results for embedding in result]
+
+    async def aclose(self):
+        session = getattr(self, "_aio_session", None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    def _aio(self):
+        session = getattr(self, "_aio_session", None)
+        if session is None or session.closed:
+            self._aio_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._aio_session
+
+    async def _arequest(self, texts):
+        with observe("embedding"):
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with self._aio().post(self.url, headers=self._headers(), json=self._payload(texts)) as response:
+                        if response.status in RETRY_STATUSES and attempt < self.max_retries:
+                            raise aiohttp.ClientResponseError(response.request_info, (), status=response.status,
+                                                              message=f"{response.status} from {self.url}")
+                        response.raise_for_status()
+                        return self._parse(await response.json(content_type=None), len(texts))
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    status = getattr(e, "status", None)
+                    if attempt >= self.max_retries or (status is not None and status not in RETRY_STATUSES):
+                        raise EmbeddingError(f"Embedding request failed: {e}") from e
+                    delay = self.backoff * (2 ** attempt) * (1 + random.random() / 2)
+                    logger.warning(f"Embedding request failed ({e}), retrying in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                except ValueError as e:
+                    raise EmbeddingError(f"Invalid embedding response: {e}") from e
+
+    def _headers(self):
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+        if self.backend == "openai":
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def _payload(self, texts):
+        return {"model": self.model, "input": texts}
+
+    def _request(self, texts):
+        headers = self._headers()
+        payload = self._payload(texts)
+
+        # Retries and backoff count towards the stage: it is the latency callers see
+        with observe("embedding"):
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = self._session.post(self.url, headers=headers, json=payload, timeout=self.timeout)
+                    if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                        raise requests.HTTPError(f"{response.status_code} from {self.url}", response=response)
+                    response.raise_for_status()
+                    return self._parse(response.json(), len(texts))
+                except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                    status = e.response.status_code if getattr(e, "response", None) is not None else None
+                    if attempt >= self.max_retries or (status is not None and status not in RETRY_STATUSES):
+                        raise EmbeddingError(f"Embedding request failed: {e}") from e
+                    delay = self.backoff * (2 ** attempt) * (1 + random.random() / 2)
+                    logger.warning(f"Embedding request failed ({e}), retrying in {delay:.2f}s")
+                    time.sleep(delay)
+                except ValueError as e:
+                    raise EmbeddingError(f"Invalid embedding response: {e}") from e
+
+    def _parse(self, body, expected):
+        if self.backend == "ollama":
+            embeddings = body.get("embeddings")
+        else:
+            embeddings = [item["embedding"] for item in sorted(body.get("data", []), key=lambda item: item["index"])]
+        if not embeddings or len(embeddings) != expected:
+            raise EmbeddingError(f"Expected {expected} embeddings, got {len(embeddings or [])}")
+        return embeddings
+
+
+embedding_client = EmbeddingClient()
@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from .config import Config
+
+logger = logging.getLogger()
+
+# Bump when extraction logic changes so old entries are no longer used
+EXTRACTOR_VERSION = 2
+
+# File layout: magic, page count, one index entry per page, then the zlib-compressed
+# page texts. Each page is compressed on its own; load() maps the file and decodes every page.
+MAGIC = b"SLAX\x01"
+COUNT = struct.Struct("<I")
+ENTRY = struct.Struct("<IBQI")  # page number, source, offset, length
+SOURCES = ("text", "ocr")
+
+# Eviction frees space down to this share of the limit, so the next writes do not trigger another scan
+LOW_WATER = 0.9
+
+
+def file_digest(path, block_size=1024 * 1024):
+    """
+    SHA-256 of a file's raw bytes, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    On-disk cache of per-page PDF text, keyed by the PDF byte digest, the extractor
+    version and the OCR settings. Shared by the API, the job workers and the CLI tools.
+    Least recently used entries are evicted once the directory exceeds max_mb. The size
+    is tracked as entries are written, so the directory is only scanned when the total
+    crosses the limit or EXTRACTION_CACHE_SCAN_SECONDS have passed.
+    """
+
+    def __init__(self, directory=None, max_mb=None, enabled=None):
+        self.directory = directory or Config.EXTRACTION_CACHE_DIR
+        self.max_bytes = (max_mb or Config.EXTRACTION_CACHE_MAX_MB) * 1024 * 1024
+        self.enabled = Config.EXTRACTION_CACHE_ENABLED if enabled is None else enabled
+        self._lock = threading.Lock()
+        self._size = None  # Bytes found by the last scan plus those written since
+        self._scanned = 0.0
+
+    def key(self, digest):
+        settings = f"{digest}:{EXTRACTOR_VERSION}:{Config.OCR_LANG}:{Config.OCR_DPI}:" \
+                   f"{Config.OCR_MIN_PAGE_CHARS}:{Config.OCR_MIN_ALNUM_RATIO}"
+        return hashlib.sha256(settings.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.slax")
+
+    def load(self, digest):
+        """
+        Return the cached per-page records for a PDF digest, or None.
+        """
+        if not self.enabled:
+            return None
+        path = self.path(self.key(digest))
+        try:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                pages = self._decode(data)
+            # Touch the entry so eviction sees it as recently used
+            os.utime(path)
+            return pages
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, zlib.error, struct.error) as e:
+            logger.warning(f"Discarding unreadable extraction cache entry {path}: {e}")
+            self._remove(path)
+            return None
+
+    def store(self, digest, pages):
+        """
+        Write per-page records for a PDF digest, then evict old entries if needed.
+        """
+        if not self.enabled:
+            return
+        path = self.path(self.key(digest))
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file and rename so readers never see partial entries
+            data = self._encode(pages)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write extraction cache entry {path}: {e}")
+            return
+
+        with self._lock:
+            if self._size is not None:
+                self._size += len(data)
+            due = time.monotonic() - self._scanned > Config.EXTRACTION_CACHE_SCAN_SECONDS
+        if self._size is None or self._size > self.max_bytes or due:
+            self.evict()
+
+    def evict(self):
+        """
+        Scan the cache and, if it exceeds max_bytes, remove least recently used entries
+        until it is back under LOW_WATER of the limit.
+        """
+        with self._lock:
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if not name.endswith(".slax"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+            entries.sort()
+            target = self.max_bytes * LOW_WATER if total > self.max_bytes else total
+            while total > target and entries:
+                _, size, path = entries.pop(0)
+                self._remove(path)
+                total -= size
+            self._size = total
+            self._scanned = time.monotonic()
+
+    def _encode(self, pages):
+        blobs = [zlib.compress(page["text"].encode("utf-8")) for page in pages]
+        offset = len(MAGIC) + COUNT.size + ENTRY.size * len(pages)
+        header = [MAGIC, COUNT.pack(len(pages))]
+        for page, blob in zip(pages, blobs):
+            header.append(ENTRY.pack(page["page"], SOURCES.index(page.get("source", "text")), offset, len(blob)))
+            offset += len(blob)
+        return b"".join(header + blobs)
+
+    def _decode(self, data):
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("unknown format")
+        (count,) = COUNT.unpack_from(data, len(MAGIC))
+        pages = []
+        for i in range(count):
+            number, source, offset, length = ENTRY.unpack_from(data, len(MAGIC) + COUNT.size + ENTRY.size * i)
+            text = zlib.decompress(data[offset:offset + length]).decode("utf-8")
+            pages.append({"page": number, "text": text, "source": SOURCES[source]})
+        return pages
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+extraction_cache = ExtractionCache()
@@ -0,0 +1,172 @@
+import logging
+import os
+from datetime import datetime
+from .config import Config
+from elasticsearch import helpers
+from .chunking import delete_stale_chunks
+from .bulk_ops import set_fields
+from .utils import get_embedding, generate_document_hash, extract_pages_from_pdf, pages_to_text, index_document_chunks
+from .extraction_cache import file_digest
+from .metrics import record_ingestion
+
+logger = logging.getLogger()
+
+# Pipeline stages, in execution order
+STAGES = ("extract", "embed", "index")
+
+
+class IngestionError(Exception):
+    """
+    Raised when a document cannot be extracted, embedded or indexed.
+    """
+
+
+def find_by_digest(es, digest, tc_doc_id=None):
+    """
+    A stored document whose PDF bytes have the given SHA-256, optionally under one tc_doc_id, or None.
+    """
+    filters = [{"term": {"content_digest": digest}}]
+    if tc_doc_id is not None:
+        filters.append({"term": {"tc_doc_id": tc_doc_id}})
+    response = es.search(index=Config.DOCUMENT_INDEX, body={"query": {"bool": {"filter": filters}}, "size": 1})
+    hits = response['hits']['hits']
+    return hits[0]['_source'] if hits else None
+
+
+def copy_chunks(es, source, tc_doc_id, title, doc_hash):
+    """
+    Copy the passage chunks of an already indexed document under another tc_doc_id.
+    Other titles stored under the source tc_doc_id are left out by matching the source's hash.
+    """
+    def actions():
+        query = {"query": {"bool": {"filter": [
+            {"term": {"tc_doc_id": source['tc_doc_id']}},
+            {"term": {"hash": source['hash']}}
+        ]}}}
+        for hit in helpers.scan(es, index=Config.CHUNK_INDEX, query=query):
+            chunk = dict(hit['_source'], tc_doc_id=tc_doc_id, title=title, hash=doc_hash)
+            yield {"_index": Config.CHUNK_INDEX, "_id": f"{tc_doc_id}:{title}:{chunk['chunk_id']}", "_source": chunk}
+
+    helpers.bulk(es, actions(), refresh=True)
+
+
+def rename(es, tc_doc_id, title):
+    """
+    Set a new title on the documents and passages stored under tc_doc_id. The hash covers
+    the title, so it is recomputed to keep the passages and semantic cache entries matching.
+    """
+    response = es.search(index=Config.DOCUMENT_INDEX, body={
+        "query": {"term": {"tc_doc_id": tc_doc_id}}, "_source": ["content"], "size": 1
+    })
+    content = response['hits']['hits'][0]['_source']['content']
+    fields = {
+        "title": title,
+        "hash": generate_document_hash({"title": title, "content": content}),
+        "timestamp": datetime.now().isoformat()
+    }
+    set_fields(es, tc_doc_id, fields)
+    if Config.CHUNKED_INGESTION:
+        set_fields(es, tc_doc_id, fields, index_name=Config.CHUNK_INDEX)
+
+
+def skip_stages(notify, reason):
+    for stage in STAGES:
+        notify(stage, "skipped", {"reason": reason})
+
+
+def ingest_pdf(es, tc_doc_id, file_path, title, update=False, on_stage=None, digest=None):
+    """
+    Run the ingestion pipeline for one PDF: extraction, embedding and indexing.
+    With update=True the documents stored under tc_doc_id are replaced instead of added.
+    on_stage(stage, status, details) is called when a stage starts and finishes.
+
+    digest is the SHA-256 of the PDF bytes (computed here if not given). PDFs that are
+    already indexed are not extracted or embedded again. Returns "unchanged" when an
+    update only touched metadata, "reused" when the content came from another document
+    with the same bytes, and "indexed" otherwise.
+    """
+    notify = on_stage or (lambda stage, status, details=None: None)
+    digest = digest or file_digest(file_path)
+
+    if update:
+        query = {"term": {"tc_doc_id": tc_doc_id}}
+        if not es.count(index=Config.DOCUMENT_INDEX, query=query)["count"]:
+            raise IngestionError(f"No document found with tc_doc_id: {tc_doc_id}")
+        changed = es.count(index=Config.DOCUMENT_INDEX, query={
+            "bool": {"filter": [query], "must_not": [{"term": {"content_digest": digest}}]}
+        })["count"]
+        if not changed:
+            skip_stages(notify, "unchanged")
+            rename(es, tc_doc_id, title)
+            logger.info(f"Skipped unchanged {title} (tc_doc_id: {tc_doc_id})")
+            record_ingestion("unchanged")
+            return "unchanged"
+    else:
+        if find_by_digest(es, digest, tc_doc_id):
+            skip_stages(notify, "unchanged")
+            logger.info(f"Skipped {title}: already indexed under tc_doc_id {tc_doc_id}")
+            record_ingestion("unchanged")
+            return "unchanged"
+        source = find_by_digest(es, digest)
+        if source:
+            skip_stages(notify, "duplicate")
+            doc_hash = generate_document_hash({"title": title, "content": source['content']})
+            if Config.CHUNKED_INGESTION:
+                copy_chunks(es, source, tc_doc_id, title, doc_hash)
+            document = {
+                "tc_doc_id": tc_doc_id,
+                "title": title,
+                "content": source['content'],
+                "hash": doc_hash,
+                "content_digest": digest,
+                "timestamp": datetime.now().isoformat(),
+                "embedding": source['embedding']
+            }
+            es.index(index=Config.DOCUMENT_INDEX, document=document)
+            logger.info(f"Reused content of tc_doc_id {source['tc_doc_id']} for {title} (tc_doc_id: {tc_doc_id})")
+            record_ingestion("reused")
+            return "reused"
+
+    notify("extract", "running")
+    pages = extract_pages_from_pdf(file_path, digest)
+    text = pages_to_text(pages)
+    if not text:
+        raise IngestionError(f"Failed to extract text from {title}")
+    notify("extract", "done", {"pages": len(pages), "characters": len(text)})
+
+    notify("embed", "running")
+    doc_hash = generate_document_hash({"title": title, "content": text})
+    if Config.CHUNKED_INGESTION:
+        # Embed passages; the parent keeps their average for document-level search
+        embedding = index_document_chunks(es, tc_doc_id, title, doc_hash, pages)
+        # Passages of the previous version go only once the new ones are in, so a failed
+        # re-ingest leaves the old passages searchable
+        if update and embedding:
+            delete_stale_chunks(es, tc_doc_id, doc_hash)
+    else:
+        embedding = get_embedding(text)
+    if not embedding:
+        raise IngestionError(f"Failed to generate embedding for {title}")
+    notify("embed", "done")
+
+    notify("index", "running")
+    document = {
+        "tc_doc_id": tc_doc_id,
+        "title": title,
+        "content": text,
+        "hash": doc_hash,
+        "content_digest": digest,
+        "timestamp": datetime.now().isoformat(),
+        "embedding": embedding
+    }
+
+    if update:
+        fields = {key: value for key, value in document.items() if key != "tc_doc_id"}
+        set_fields(es, tc_doc_id, fields)
+    else:
+        es.index(index=Config.DOCUMENT_INDEX, document=document)
+    notify("index", "done")
+
+    logger.info(f"Ingested {title} (tc_doc_id: {tc_doc_id})")
+    record_ingestion("indexed", pages, os.path.getsize(file_path))
+    return "indexed"
@@ -0,0 +1,156 @@
+import json
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from datetime import datetime
+from elasticsearch import Elasticsearch
+from .config import Config
+from . import redis_client
+from .utils import save_upload
+from .ingestion import ingest_pdf, STAGES
+
+logger = logging.getLogger()
+
+
+def _key(job_id):
+    return f"Job:{job_id}"
+
+
+def _save(job):
+    redis_client.set(_key(job["id"]), json.dumps(job, ensure_ascii=False), ex=Config.JOB_TTL)
+
+
+def spool_upload(file):
+    """
+    Save an uploaded file into the spool directory shared with the job workers.
+    Returns the spooled path and the SHA-256 of the file's bytes.
+    """
+    os.makedirs(Config.SPOOL_DIR, exist_ok=True)
+    file_path = os.path.join(Config.SPOOL_DIR, f"{uuid.uuid4().hex}_{os.path.basename(file.filename)}")
+    return file_path, save_upload(file, file_path)
+
+
+def create_job(kind, tc_doc_id, files):
+    """
+    Register an ingestion job and put it on the queue.
+    kind is "upload" or "update"; files is a list of {"title", "path", "digest"} dicts.
+    """
+    job = {
+        "id": uuid.uuid4().hex,
+        "kind": kind,
+        "tc_doc_id": tc_doc_id,
+        "status": "queued",
+        "error": None,
+        "created_at": datetime.now().isoformat(),
+        "started_at": None,
+        "finished_at": None,
+        "files": [
+            {
+                "title": file["title"],
+                "path": file["path"],
+                "digest": file.get("digest"),
+                "status": "queued",
+                "stages": {stage: {"status": "pending"} for stage in STAGES}
+            }
+            for file in files
+        ]
+    }
+    _save(job)
+    redis_client.lpush(Config.JOB_QUEUE, job["id"])
+    logger.info(f"Queued {kind} job {job['id']} for tc_doc_id {tc_doc_id} ({len(files)} file(s))")
+    return job
+
+
+def get_job(job_id):
+    data = redis_client.get(_key(job_id))
+    return json.loads(data) if data else None
+
+
+def job_status(job):
+    """
+    Job view returned by the API, without server-side spool paths.
+    """
+    status = dict(job)
+    status["files"] = [{k: v for k, v in file.items() if k != "path"} for file in job["files"]]
+    return status
+
+
+def run_job(es, job_id):
+    """
+    Run the extraction -> embedding -> indexing pipeline for every file of a job,
+    recording per-stage status and timings as it goes.
+    """
+    job = get_job(job_id)
+    if not job:
+        logger.warning(f"Job {job_id} not found or expired")
+        return
+
+    job["status"] = "running"
+    job["started_at"] = datetime.now().isoformat()
+    _save(job)
+    started = time.time()
+
+    for file in job["files"]:
+        def on_stage(stage, status, details=None, file=file):
+            record = file["stages"][stage]
+            if status == "running":
+                record["started_at"] = time.time()
+                file["status"] = stage
+            elif "started_at" in record:
+                record["seconds"] = round(time.time() - record["started_at"], 3)
+            record["status"] = status
+            if details:
+                record.update(details)
+            _save(job)
+
+        try:
+            if job["status"] == "failed":
+                file["status"] = "skipped"
+                continue
+            file["result"] = ingest_pdf(es, job["tc_doc_id"], file["path"], file["title"],
+                                        update=job["kind"] == "update", on_stage=on_stage, digest=file.get("digest"))
+            file["status"] = "completed"
+        except Exception as e:
+            logger.error(f"Job {job_id} failed on {file['title']}: {e}")
+            for record in file["stages"].values():
+                if record["status"] == "running":
+                    record["status"] = "failed"
+            file["status"] = "failed"
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            if os.path.exists(file["path"]):
+                os.remove(file["path"])
+
+    if job["status"] != "failed":
+        job["status"] = "completed"
+    job["finished_at"] = datetime.now().isoformat()
+    job["seconds"] = round(time.time() - started, 3)
+    _save(job)
+    logger.info(f"Job {job_id} {job['status']} in {job['seconds']} seconds")
+
+
+def work():
+    """
+    Worker loop: take job ids from the Redis queue and run them.
+    """
+    es = Elasticsearch(Config.ELASTICSEARCH_URL)
+    logger.info(f"Ingestion worker {os.getpid()} started")
+    while True:
+        item = redis_client.brpop(Config.JOB_QUEUE, timeout=5)
+        if item:
+            run_job(es, item[1].decode())
+
+
+def run_workers(count=None):
+    """
+    Start a pool of worker processes and wait for them.
+    """
+    count = count or Config.JOB_WORKERS
+    processes = [multiprocessing.Process(target=work, name=f"ingest-worker-{i}") for i in range(count)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
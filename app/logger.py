@@ -1,4 +1,5 @@
 import logging
+import os
 from flask import request
 from app.config import Config 
 
@@ -20,7 +21,9 @@ def setup_logging():
         logger.setLevel(Config.LOG_LEVEL)
         
         # Create file and stream handlers
-        file_handler = logging.FileHandler('logs/app.log', encoding='utf-8')
+        # Resolve the log file from the project root so the CLI tools can share it
+        log_path = os.path.join(os.path.dirname(Config.BASE_DIR), 'logs', 'app.log')
+        file_handler = logging.FileHandler(log_path, encoding='utf-8')
         stream_handler = logging.StreamHandler()
         
         # Add handlers to logger
@@ -0,0 +1,94 @@
+from .config import Config
+
+# Approximate bytes per dimension kept in memory for kNN search, by index type
+VECTOR_BYTES = {"hnsw": 4, "int8_hnsw": 1, "int4_hnsw": 0.5, "bbq_hnsw": 0.125}
+
+
+def vector_field(dims=None, index_type=None):
+    """
+    dense_vector mapping for embeddings, with the configured quantization and HNSW parameters.
+    """
+    index_type = index_type or Config.VECTOR_INDEX_TYPE
+    if index_type not in VECTOR_BYTES:
+        raise ValueError(f"Unsupported vector index type: {index_type}")
+
+    index_options = {"type": index_type, "m": Config.VECTOR_HNSW_M, "ef_construction": Config.VECTOR_HNSW_EF_CONSTRUCTION}
+    if index_type in ("int8_hnsw", "int4_hnsw") and Config.VECTOR_CONFIDENCE_INTERVAL is not None:
+        index_options["confidence_interval"] = Config.VECTOR_CONFIDENCE_INTERVAL
+    return {
+        "type": "dense_vector",
+        "dims": dims or Config.EMBEDDING_DIMS,
+        "index": True,
+        "similarity": Config.VECTOR_SIMILARITY,
+        "index_options": index_options
+    }
+
+
+def document_mapping(dims=None, index_type=None):
+    """
+    Mapping of the document index (Config.DOCUMENT_INDEX).
+    """
+    return {
+        "mappings": {
+            "properties": {
+                "tc_doc_id": {"type": "keyword"},
+                "title": {"type": "text"},
+                "content": {"type": "text"},
+                "hash": {"type": "keyword"},
+                "content_digest": {"type": "keyword"},  # SHA-256 of the raw PDF bytes
+                "timestamp": {"type": "date"},
+                "embedding": vector_field(dims, index_type)
+            }
+        }
+    }
+
+
+def chunk_mapping(dims=None, index_type=None):
+    """
+    Mapping of the passage index used by chunked ingestion.
+    """
+    return {
+        "mappings": {
+            "properties": {
+                "tc_doc_id": {"type": "keyword"},
+                "title": {"type": "text"},
+                "content": {"type": "text"},
+                "hash": {"type": "keyword"},
+                "chunk_id": {"type": "integer"},
+                "page_start": {"type": "integer"},
+                "page_end": {"type": "integer"},
+                "timestamp": {"type": "date"},
+                "embedding": vector_field(dims, index_type)
+            }
+        }
+    }
+
+
+def answer_cache_mapping(dims=None, index_type=None):
+    """
+    Mapping of the semantic answer cache index.
+    """
+    return {
+        "mappings": {
+            "properties": {
+                "query": {"type": "text"},
+                "answer": {"type": "text", "index": False},
+                "doc_hash": {"type": "keyword"},
+                "tc_doc_id": {"type": "keyword"},
+                "embedding_model": {"type": "keyword"},
+                "chat_model": {"type": "keyword"},
+                "timestamp": {"type": "date"},
+                "embedding": vector_field(dims, index_type)
+            }
+        }
+    }
+
+
+def vector_memory_mb(docs, dims=None, index_type=None):
+    """
+    Rough off-heap memory needed to search docs vectors: quantized vectors plus the HNSW graph.
+    """
+    dims = dims or Config.EMBEDDING_DIMS
+    index_type = index_type or Config.VECTOR_INDEX_TYPE
+    per_vector = dims * VECTOR_BYTES[index_type] + Config.VECTOR_HNSW_M * 2 * 4
+    return round(docs * per_vector / 1024 / 1024, 1)
@@ -0,0 +1,123 @@
+import os
+import time
+from contextlib import contextmanager
+from flask import Response, g, request
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client import multiprocess
+from .config import Config
+from . import tracing
+
+# Prometheus metrics. With PROMETHEUS_MULTIPROC_DIR set (api.sh sets it for the gunicorn
+# workers, the async server and the ingestion workers), every process writes its values to
+# that directory and /metrics aggregates them, so one scrape covers all processes.
+
+# Seconds; spans cache lookups through OCR of large scans
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+STAGE_SECONDS = Histogram(
+    "sla_stage_duration_seconds", "Latency of a pipeline stage: embedding, redis, es_search, es_fetch, "
+    "semantic_cache, prompt, llm, llm_first_token, serialize, extraction or ocr", ["stage"], buckets=STAGE_BUCKETS)
+REQUEST_SECONDS = Histogram(
+    "sla_request_duration_seconds", "Latency of API requests", ["endpoint", "status"], buckets=STAGE_BUCKETS)
+REQUESTS_IN_FLIGHT = Gauge(
+    "sla_requests_in_flight", "Requests being served", ["endpoint"], multiprocess_mode="livesum")
+CACHE_LOOKUPS = Counter(
+    "sla_cache_lookups", "Cache lookups by layer (embedding_memory, embedding_redis, search, semantic, extraction)",
+    ["layer", "result"])
+LLM_TOKENS = Counter("sla_llm_tokens", "LLM tokens used", ["model", "kind"])
+INGESTED_DOCUMENTS = Counter("sla_ingested_documents", "Ingested PDFs by outcome (indexed, reused, unchanged)", ["result"])
+INGESTED_PAGES = Counter("sla_ingested_pages", "Extracted pages by source (text layer or OCR)", ["source"])
+INGESTED_BYTES = Counter("sla_ingested_bytes", "Bytes of ingested PDFs")
+
+
+@contextmanager
+def observe(stage):
+    """
+    Context manager (or decorator) recording the duration of a stage, in the
+    histogram and in the current request's trace.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_seconds(stage, time.perf_counter() - started)
+
+
+def observe_seconds(stage, seconds):
+    STAGE_SECONDS.labels(stage=stage).observe(seconds)
+    tracing.record(stage, seconds)
+
+
+def cache_lookup(layer, hit):
+    CACHE_LOOKUPS.labels(layer=layer, result="hit" if hit else "miss").inc()
+
+
+def record_tokens(model, usage):
+    for kind in ("prompt", "completion"):
+        tokens = (usage or {}).get(f"{kind}_tokens")
+        if tokens:
+            LLM_TOKENS.labels(model=model, kind=kind).inc(tokens)
+
+
+def record_ingestion(result, pages=None, size=0):
+    INGESTED_DOCUMENTS.labels(result=result).inc()
+    for page in pages or []:
+        INGESTED_PAGES.labels(source=page.get("source", "text")).inc()
+    if size:
+        INGESTED_BYTES.inc(size)
+
+
+def request_started(endpoint):
+    REQUESTS_IN_FLIGHT.labels(endpoint=endpoint).inc()
+    return time.time()
+
+
+def request_finished(endpoint, status, started):
+    REQUESTS_IN_FLIGHT.labels(endpoint=endpoint).dec()
+    REQUEST_SECONDS.labels(endpoint=endpoint, status=str(status)).observe(time.time() - started)
+
+
+def registry():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        collected = CollectorRegistry()
+        multiprocess.MultiProcessCollector(collected)
+        return collected
+    return REGISTRY
+
+
+def metrics_view():
+    return Response(generate_latest(registry()), mimetype=CONTENT_TYPE_LATEST)
+
+
+def _endpoint():
+    # The route pattern, not the path, keeps label cardinality bounded
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+def init_app(app):
+    """
+    Track latency and in-flight requests of every route and serve /metrics (unauthenticated,
+    for the scraper; restrict it at the reverse proxy).
+    """
+    if not Config.METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = request_started(_endpoint())
+
+    @app.after_request
+    def stop_timer(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            request_finished(_endpoint(), response.status_code, started)
+        return response
+
+    @app.teardown_request
+    def drop_timer(error=None):
+        # after_request does not run when a view raised
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            request_finished(_endpoint(), 500, started)
+
+    app.add_url_rule(Config.METRICS_PATH, "metrics", metrics_view)
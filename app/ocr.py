@@ -0,0 +1,145 @@
+import logging
+import os
+import resource
+import subprocess
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import nullcontext
+from pdf2image import convert_from_path, pdfinfo_from_path
+import pytesseract
+from .config import Config
+
+logger = logging.getLogger()
+
+# A4 page size in inches, used to estimate raster sizes
+PAGE_WIDTH_IN = 8.27
+PAGE_HEIGHT_IN = 11.69
+
+
+def estimate_worker_memory(dpi):
+    """
+    Estimate the peak memory (bytes) of one OCR worker for a grayscale page at dpi.
+    Tesseract keeps several working copies of the image next to its language models.
+    """
+    page_bytes = int(PAGE_WIDTH_IN * dpi) * int(PAGE_HEIGHT_IN * dpi)
+    return Config.OCR_WORKER_BASE_MB * 1024 * 1024 + page_bytes * Config.OCR_IMAGE_COPIES
+
+
+def plan_workers(max_memory_mb=None, dpi=None, workers=None):
+    """
+    Decide how many OCR processes fit in the memory ceiling.
+    Returns (workers, per-worker memory limit in bytes).
+    """
+    max_memory = (max_memory_mb or Config.OCR_MAX_MEMORY_MB) * 1024 * 1024
+    dpi = dpi or Config.OCR_DPI
+    workers = workers or Config.OCR_WORKERS or os.cpu_count() or 1
+
+    fitting = max(1, max_memory // estimate_worker_memory(dpi))
+    workers = max(1, min(workers, fitting))
+    return workers, max_memory // workers
+
+
+def _run_tesseract(image_path, lang, memory_limit=None):
+    # The limit is applied in the forked Tesseract process only; the caller's address space is not limited
+    def limit_memory():
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    result = subprocess.run(
+        [pytesseract.pytesseract.tesseract_cmd, image_path, "stdout", "-l", lang],
+        capture_output=True, env=dict(os.environ, OMP_THREAD_LIMIT="1"),
+        preexec_fn=limit_memory if memory_limit else None
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"tesseract exited with {result.returncode}: {result.stderr.decode('utf-8', 'replace').strip()}")
+    return result.stdout.decode("utf-8").strip()
+
+
+def _ocr_page(image_path, lang, memory_limit=None):
+    try:
+        return _run_tesseract(image_path, lang, memory_limit)
+    except MemoryError:
+        # Out of memory in the worker itself is not an empty page; fail the whole OCR run
+        raise
+    except Exception as e:
+        logger.error(f"OCR failed for {image_path}: {e}")
+        return None
+    finally:
+        os.remove(image_path)
+
+
+def _run_inline(fn, *args):
+    """
+    Call fn now and wrap the outcome in a completed Future, standing in for pool.submit.
+    """
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except BaseException as e:
+        future.set_exception(e)
+    return future
+
+
+def _windows(page_numbers, size):
+    """
+    Group page numbers into runs of consecutive pages, at most size pages each.
+    """
+    window = []
+    for number in page_numbers:
+        if window and (number != window[-1] + 1 or len(window) >= size):
+            yield window
+            window = []
+        window.append(number)
+    if window:
+        yield window
+
+
+def ocr_pdf(pdf_path, page_numbers=None, lang=None, dpi=None):
+    """
+    OCR a PDF with bounded memory: pages are rasterized in small windows to grayscale
+    temp files and recognized on a process pool, while the next window is rasterized.
+    Returns a list of {"page": number, "text": text} records in page order; pages
+    Tesseract failed on have empty text and "failed": True.
+    With a single worker Tesseract runs straight from this process, so callers that are
+    pool workers themselves (bulk_ingest) do not nest a second pool.
+    """
+    lang = lang or Config.OCR_LANG
+    dpi = dpi or Config.OCR_DPI
+    if page_numbers is None:
+        page_numbers = range(1, pdfinfo_from_path(pdf_path)["Pages"] + 1)
+    page_numbers = sorted(set(page_numbers))
+    if not page_numbers:
+        return []
+
+    workers, memory_limit = plan_workers(dpi=dpi)
+    window_size = max(workers, Config.OCR_WINDOW_PAGES)
+    hard_limit = memory_limit if Config.OCR_HARD_MEMORY_LIMIT else None
+    logger.info(f"OCR of {len(page_numbers)} page(s) from {pdf_path} with {workers} worker(s), window {window_size}")
+
+    results = {}
+    pending = deque()
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    submit = pool.submit if pool else _run_inline
+    with tempfile.TemporaryDirectory(prefix="ocr_") as tmp_dir, pool or nullcontext():
+        for window in _windows(page_numbers, window_size):
+            image_paths = convert_from_path(
+                pdf_path, dpi=dpi, first_page=window[0], last_page=window[-1],
+                grayscale=True, fmt="png", output_folder=tmp_dir, paths_only=True, thread_count=1
+            )
+            pending.append([(number, submit(_ocr_page, path, lang, hard_limit)) for number, path in zip(window, image_paths)])
+
+            # Keep at most two windows in flight so temp files stay bounded
+            while len(pending) > 1:
+                for number, future in pending.popleft():
+                    results[number] = future.result()
+
+        while pending:
+            for number, future in pending.popleft():
+                results[number] = future.result()
+
+    records = []
+    for number in page_numbers:
+        text = results.get(number)
+        records.append({"page": number, "text": text or ""} if text is not None
+                       else {"page": number, "text": "", "failed": True})
+    return records
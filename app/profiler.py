@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from .config import Config
+
+logger = logging.getLogger()
+
+_MAX_DEPTH = 128
+
+
+def _collapse(frame):
+    """
+    Fold a thread's stack into one collapsed-stack line, outermost frame first.
+    """
+    names = []
+    while frame is not None and len(names) < _MAX_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _file_name(endpoint):
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", endpoint).strip("_") or "root"
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for a sample of requests. While a sampled request runs, a
+    background thread snapshots the stack of the thread serving it every interval_ms
+    and counts identical stacks. Counts are written as collapsed stacks
+    ("frame;frame;frame count"), one file per endpoint and process, ready for
+    flamegraph.pl or speedscope.
+
+    Settings live in a file in the profile directory so an admin can switch every
+    worker process at once, without a restart.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or Config.PROFILE_DIR
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._threads = {}  # thread id -> endpoint
+        self._stacks = {}  # endpoint -> Counter of collapsed stacks
+        self._pid = None
+        self._settings = {"sample_percent": 0.0, "interval_ms": Config.PROFILE_INTERVAL_MS}
+        self._settings_mtime = None
+        self._settings_checked = 0.0
+
+    def settings_path(self):
+        return os.path.join(self.directory, "settings.json")
+
+    def settings(self):
+        """
+        Current settings, re-read from disk at most once per second.
+        """
+        now = time.time()
+        if now - self._settings_checked < 1:
+            return self._settings
+        self._settings_checked = now
+        try:
+            mtime = os.path.getmtime(self.settings_path())
+            if mtime != self._settings_mtime:
+                with open(self.settings_path()) as f:
+                    self._settings = dict(self._settings, **json.load(f))
+                self._settings_mtime = mtime
+        except FileNotFoundError:
+            self._settings = dict(self._settings, sample_percent=0.0)
+            self._settings_mtime = None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable profiler settings: {e}")
+        return self._settings
+
+    def configure(self, sample_percent, interval_ms=None):
+        """
+        Write new settings for every process; sample_percent 0 switches profiling off.
+        """
+        settings = {
+            "sample_percent": min(100.0, max(0.0, float(sample_percent))),
+            "interval_ms": max(1, int(interval_ms or Config.PROFILE_INTERVAL_MS))
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.settings_path()}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(settings, f)
+        os.replace(tmp_path, self.settings_path())
+        self._settings_checked = 0.0
+        logger.info(f"Profiler settings changed: {settings}")
+        return settings
+
+    def should_sample(self):
+        percent = self.settings()["sample_percent"]
+        return percent > 0 and random.random() * 100 < percent
+
+    def start(self, endpoint):
+        self._ensure_started()
+        with self._lock:
+            self._threads[threading.get_ident()] = endpoint
+            self._active.set()
+
+    def stop(self):
+        with self._lock:
+            endpoint = self._threads.pop(threading.get_ident(), None)
+            if not self._threads:
+                self._active.clear()
+            stacks = dict(self._stacks.get(endpoint, {}))
+        if endpoint and stacks:
+            self._write(endpoint, stacks)
+
+    def files(self):
+        """
+        Collapsed-stack files written so far, by every process.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        return [
+            {"name": name, "bytes": os.path.getsize(os.path.join(self.directory, name))}
+            for name in sorted(os.listdir(self.directory)) if name.endswith(".collapsed")
+        ]
+
+    def _ensure_started(self):
+        # The sampler thread does not survive a fork, so it is started per process
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._threads = {}
+            self._stacks = {}
+            threading.Thread(target=self._sample, name="profiler", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _sample(self):
+        while True:
+            self._active.wait()
+            time.sleep(self._settings["interval_ms"] / 1000.0)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, endpoint in self._threads.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        self._stacks.setdefault(endpoint, Counter())[_collapse(frame)] += 1
+
+    def _write(self, endpoint, stacks):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{_file_name(endpoint)}.{os.getpid()}.collapsed")
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for stack, count in stacks.items():
+                    f.write(f"{stack} {count}\n")
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write profile {path}: {e}")
+
+
+profiler = SamplingProfiler()
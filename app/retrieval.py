@@ -0,0 +1,287 @@
+import logging
+from .config import Config
+from .metrics import observe
+
+logger = logging.getLogger()
+
+# Set when the cluster rejects the rrf retriever (e.g. license level); weighted fusion is used instead
+_rrf_unavailable = False
+
+
+def fusion():
+    if Config.RETRIEVAL_FUSION == "rrf" and not _rrf_unavailable:
+        return "rrf"
+    return "weighted"
+
+
+def target():
+    """
+    Index searched and number of hits kept: passages in chunked mode, documents otherwise.
+    """
+    if Config.CHUNKED_INGESTION:
+        return Config.CHUNK_INDEX, Config.CHUNK_SEARCH_SIZE
+    return Config.DOCUMENT_INDEX, Config.RETRIEVAL_SIZE
+
+
+def candidate_source():
+    """
+    _source fields returned for candidate hits; content and embeddings are only fetched for the winners.
+    """
+    if Config.CHUNKED_INGESTION:
+        return Config.RETRIEVAL_SOURCE_FIELDS + ["chunk_id", "page_start", "page_end"]
+    return Config.RETRIEVAL_SOURCE_FIELDS
+
+
+def lexical_query(query, filters=None):
+    return {
+        "bool": {
+            "must": [{"multi_match": {
+                "query": query,
+                "fields": Config.RETRIEVAL_LEXICAL_FIELDS,
+                "fuzziness": Config.RETRIEVAL_FUZZINESS
+            }}],
+            "filter": filters or []
+        }
+    }
+
+
+def knn_query(embedding, k, filters=None):
+    knn = {
+        "field": "embedding",  # The query_vector is compared to the document embeddings in the embedding field
+        "query_vector": embedding,
+        "k": k,
+        "num_candidates": max(Config.RETRIEVAL_NUM_CANDIDATES, k)
+    }
+    if filters:
+        knn["filter"] = filters
+    return knn
+
+
+def search_requests(query, embedding, filters=None, method=None):
+    """
+    The (index, body) searches that retrieve candidates for a query: a single rrf
+    retriever search, or a lexical and a kNN search for weighted fusion.
+    """
+    index_name, size = target()
+    window = max(Config.RETRIEVAL_WINDOW, size)
+
+    if (method or fusion()) == "rrf":
+        body = {
+            "retriever": {"rrf": {
+                "retrievers": [
+                    {"standard": {"query": lexical_query(query, filters)}},
+                    {"knn": knn_query(embedding, window, filters)}
+                ],
+                "rank_window_size": window,
+                "rank_constant": Config.RETRIEVAL_RANK_CONSTANT
+            }},
+            "_source": candidate_source(),
+            "size": size
+        }
+        return [(index_name, body)]
+
+    return [
+        (index_name, {"query": lexical_query(query, filters), "_source": candidate_source(), "size": window}),
+        (index_name, {"knn": knn_query(embedding, window, filters), "_source": candidate_source(), "size": window})
+    ]
+
+
+def _normalized(hits):
+    scores = [hit["_score"] or 0.0 for hit in hits]
+    if not scores:
+        return {}
+    low, high = min(scores), max(scores)
+    span = (high - low) or 1.0
+    return {hit["_id"]: ((hit["_score"] or 0.0) - low) / span if high > low else 1.0 for hit in hits}
+
+
+def fuse(responses):
+    """
+    Combine the responses of search_requests into one ranked hit list.
+    Weighted fusion min-max normalizes each list before blending, so lexical and
+    vector scores are on the same scale.
+    """
+    if len(responses) == 1:
+        return responses[0]["hits"]["hits"]
+
+    _, size = target()
+    lexical, vector = (response["hits"]["hits"] for response in responses)
+    lexical_scores, vector_scores = _normalized(lexical), _normalized(vector)
+    hits = {hit["_id"]: hit for hit in lexical + vector}
+    scored = []
+    for hit_id, hit in hits.items():
+        score = Config.RETRIEVAL_LEXICAL_WEIGHT * lexical_scores.get(hit_id, 0.0) \
+            + Config.RETRIEVAL_VECTOR_WEIGHT * vector_scores.get(hit_id, 0.0)
+        scored.append(dict(hit, _score=score))
+    scored.sort(key=lambda hit: hit["_score"], reverse=True)
+    return scored[:size]
+
+
+def _error_cause(error):
+    """
+    (type, reason) of the root cause of an Elasticsearch error: an ApiError, or the
+    error object of a failed _msearch item.
+    """
+    body = error if isinstance(error, dict) else getattr(error, "body", None)
+    if not isinstance(body, dict):
+        return None, str(error)
+    cause = body.get("error", body)
+    if not isinstance(cause, dict):
+        return None, str(cause)
+    cause = (cause.get("root_cause") or [cause])[0]
+    return cause.get("type"), cause.get("reason") or ""
+
+
+def _rrf_rejected(error):
+    """
+    Whether an error means this cluster cannot run the rrf retriever at all (license
+    level, or a version without retrievers); if so, stop using it in this process.
+    Any other failure only falls back for the request that hit it.
+    """
+    global _rrf_unavailable
+    error_type, reason = _error_cause(error)
+    folded = reason.lower()
+    unlicensed = error_type == "security_exception" and "non-compliant" in folded
+    unsupported = error_type in ("parsing_exception", "x_content_parse_exception", "named_object_not_found_exception") \
+        and "retriever" in folded and "unknown" in folded
+    if unlicensed or unsupported:
+        logger.warning(f"rrf retriever unavailable, falling back to weighted fusion: {error_type}: {reason}")
+        _rrf_unavailable = True
+        return True
+    logger.warning(f"rrf search failed, retrying this request with weighted fusion: {error}")
+    return False
+
+
+def _msearch_body(requests):
+    searches = []
+    for index_name, body in requests:
+        searches.extend([{"index": index_name}, body])
+    return searches
+
+
+def retrieve(es, query, embedding, filters=None, method=None):
+    """
+    Hybrid lexical + vector retrieval in one Elasticsearch request. Returns the fused hits.
+    """
+    method = method or fusion()
+    requests = search_requests(query, embedding, filters, method)
+    try:
+        with observe("es_search"):
+            if len(requests) == 1:
+                index_name, body = requests[0]
+                return fuse([es.search(index=index_name, body=body)])
+            return fuse(es.msearch(searches=_msearch_body(requests))["responses"])
+    except Exception as e:
+        if method == "rrf":
+            _rrf_rejected(e)
+            return retrieve(es, query, embedding, filters, "weighted")
+        raise
+
+
+async def aretrieve(es, query, embedding, filters=None, method=None):
+    """
+    retrieve() for the async serving path, with an AsyncElasticsearch client.
+    """
+    method = method or fusion()
+    requests = search_requests(query, embedding, filters, method)
+    try:
+        with observe("es_search"):
+            if len(requests) == 1:
+                index_name, body = requests[0]
+                return fuse([await es.search(index=index_name, body=body)])
+            return fuse((await es.msearch(searches=_msearch_body(requests)))["responses"])
+    except Exception as e:
+        if method == "rrf":
+            _rrf_rejected(e)
+            return await aretrieve(es, query, embedding, filters, "weighted")
+        raise
+
+
+def retrieve_many(es, queries, embeddings, method=None):
+    """
+    Retrieve for many queries with a single _msearch. Returns one hit list per query,
+    or the error for queries whose search failed.
+    """
+    method = method or fusion()
+    plans = [search_requests(query, embedding, method=method) for query, embedding in zip(queries, embeddings)]
+    with observe("es_search"):
+        responses = es.msearch(searches=_msearch_body([request for plan in plans for request in plan]))["responses"]
+
+    results = []
+    offset = 0
+    for plan in plans:
+        parts = responses[offset:offset + len(plan)]
+        offset += len(plan)
+        errors = [response["error"] for response in parts if "error" in response]
+        results.append(errors[0] if errors else fuse(parts))
+
+    # Queries whose rrf search failed are retried with weighted fusion
+    failed = [i for i, result in enumerate(results) if isinstance(result, dict)]
+    if method == "rrf" and failed:
+        _rrf_rejected(results[failed[0]])
+        retried = retrieve_many(es, [queries[i] for i in failed], [embeddings[i] for i in failed], "weighted")
+        for i, result in zip(failed, retried):
+            results[i] = result
+    return results
+
+
+def winners(hits):
+    """
+    The hits whose full source is needed for the prompt: the top document, or in
+    chunked mode every retrieved passage of the top document.
+    """
+    if not hits:
+        return []
+    for hit in hits:
+        logger.info(f"Document Title: {hit['_source'].get('title', 'No Title Available')}, Score: {hit.get('_score')}")
+    if not Config.CHUNKED_INGESTION:
+        return [max(hits, key=lambda hit: hit.get("_score") or 0.0)]
+    top = hits[0]["_source"]
+    return [
+        hit for hit in hits
+        if hit["_source"].get("tc_doc_id") == top.get("tc_doc_id") and hit["_source"].get("title") == top.get("title")
+    ]
+
+
+def _mget_docs(hit_lists):
+    # Passages keep their embedding for context ranking; whole documents drop it
+    excludes = [] if Config.CHUNKED_INGESTION else ["embedding"]
+    return [{"_index": hit["_index"], "_id": hit["_id"], "_source": {"excludes": excludes}}
+            for hits in hit_lists for hit in hits]
+
+
+def _merge_sources(hit_lists, docs):
+    sources = {(doc["_index"], doc["_id"]): doc["_source"] for doc in docs if doc.get("found")}
+    return [
+        [dict(hit, _source=sources[(hit["_index"], hit["_id"])]) for hit in hits if (hit["_index"], hit["_id"]) in sources]
+        for hits in hit_lists
+    ]
+
+
+def hydrate_many(es, hit_lists):
+    """
+    Fetch the full source of each list's winners with one mget. Returns the winner
+    hits of each list, with their scores, in the same order.
+    """
+    hit_lists = [winners(hits) for hits in hit_lists]
+    if not any(hit_lists):
+        return hit_lists
+    with observe("es_fetch"):
+        docs = es.mget(docs=_mget_docs(hit_lists))["docs"]
+    return _merge_sources(hit_lists, docs)
+
+
+def hydrate(es, hits):
+    return hydrate_many(es, [hits])[0]
+
+
+async def ahydrate(es, hits):
+    """
+    hydrate() for the async serving path, with an AsyncElasticsearch client.
+    """
+    hit_lists = [winners(hits)]
+    if not hit_lists[0]:
+        return []
+    with observe("es_fetch"):
+        docs = (await es.mget(docs=_mget_docs(hit_lists)))["docs"]
+    return _merge_sources(hit_lists, docs)[0]
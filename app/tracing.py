@@ -0,0 +1,111 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from .config import Config
+
+# Stage timings of the request being served, returned as a Server-Timing header and,
+# on request, as a "timings" block in the response. Each Flask request and each aiohttp
+# handler task has its own context, so concurrent requests never share a trace.
+# Stages are recorded by metrics.observe(); code running on pool threads is not traced.
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}  # stage -> [seconds, calls]
+
+    def record(self, stage, seconds):
+        entry = self.stages.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def timings(self):
+        """
+        Milliseconds spent per stage, plus the total so far.
+        """
+        timings = {stage: round(seconds * 1000, 1) for stage, (seconds, _) in self.stages.items()}
+        timings["total"] = round((time.perf_counter() - self.started) * 1000, 1)
+        return timings
+
+    def server_timing(self):
+        parts = []
+        for stage, (seconds, calls) in self.stages.items():
+            parts.append(f"{stage};dur={seconds * 1000:.1f}" + (f';desc="{calls} calls"' if calls > 1 else ""))
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def start():
+    trace = Trace()
+    _trace.set(trace)
+    return trace
+
+
+def finish():
+    _trace.set(None)
+
+
+def current():
+    return _trace.get()
+
+
+def record(stage, seconds):
+    trace = _trace.get()
+    if trace is not None:
+        trace.record(stage, seconds)
+
+
+@contextmanager
+def stage(name):
+    """
+    Trace a stage without a latency histogram, e.g. the caller-side wait for work done on another thread.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def timings():
+    trace = _trace.get()
+    return trace.timings() if trace is not None else {}
+
+
+def requested(args, data=None):
+    """
+    Whether the client asked for the timings block (?timings=true or "timings": true in the body).
+    """
+    value = args.get("timings", (data or {}).get("timings", False))
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def init_app(app):
+    """
+    Trace every request, add the Server-Timing header and run the sampling profiler on sampled requests.
+    """
+    from flask import g, request
+    from .profiler import profiler
+
+    @app.before_request
+    def start_trace():
+        start()
+        endpoint = request.url_rule.rule if request.url_rule else None
+        if endpoint and endpoint != Config.METRICS_PATH and profiler.should_sample():
+            profiler.start(endpoint)
+            g.profiled = True
+
+    @app.after_request
+    def add_server_timing(response):
+        trace = current()
+        # Streamed responses send their headers before any stage runs
+        if Config.SERVER_TIMING_ENABLED and trace is not None and not response.is_streamed:
+            response.headers["Server-Timing"] = trace.server_timing()
+        return response
+
+    @app.teardown_request
+    def finish_trace(error=None):
+        if g.pop("profiled", False):
+            profiler.stop()
+        finish()
@@ -6,10 +6,17 @@ import logging
 import json
 from .config import Config
 from . import redis_client
-from elasticsearch import Elasticsearch
+from concurrent.futures import ThreadPoolExecutor
+from .cache import embedding_cache, search_cache, semantic_cache, normalize_query
+from .embedding_client import embedding_client, EmbeddingError
+from .chunking import chunk_pages, create_chunk_index, build_chunk_actions, mean_embedding, merge_passages
+from elasticsearch import Elasticsearch, helpers
 from PyPDF2 import PdfReader
-from pdf2image import convert_from_path
-import pytesseract
+from .ocr import ocr_pdf
+from .context import build_context
+from .retrieval import retrieve, retrieve_many, hydrate, hydrate_many
+from .extraction_cache import extraction_cache, file_digest
+from .metrics import observe, observe_seconds, cache_lookup, record_tokens
 import hashlib
 import requests
 
@@ -17,45 +24,131 @@ openai.api_key = Config.OPENAI_API_KEY
 
 logger = logging.getLogger()
 
+# Answer returned by find_sla when the LLM call fails; never cached semantically
+NO_SOLUTION = "No feasible solution found"
+
 logger.info("Application started and logging configured with Redis.")
 
 
 
-def extract_text_from_pdf(pdf_path):
+def needs_ocr(text):
     """
-    Extract text from a PDF file, with OCR fallback if necessary.
+    Classify a page's text layer as deficient: too little text, or mostly
+    symbols (broken font encodings), means the page is probably scanned.
+    """
+    characters = [c for c in text if not c.isspace()]
+    if len(characters) < Config.OCR_MIN_PAGE_CHARS:
+        return True
+    alphanumeric = sum(1 for c in characters if c.isalnum())
+    return alphanumeric / len(characters) < Config.OCR_MIN_ALNUM_RATIO
+
+
+def extract_pages_from_pdf(pdf_path, digest=None):
+    """
+    Extract text per page from a PDF file. Only pages without a usable text layer
+    (e.g. scanned annexes) go through OCR.
+    Returns a list of {"page": number, "text": text, "source": "text" | "ocr"} records.
+    Results are cached on disk by the SHA-256 of the PDF bytes (pass digest if already known).
+    """
+    digest = digest or file_digest(pdf_path)
+    pages = extraction_cache.load(digest)
+    cache_lookup("extraction", pages is not None)
+    if pages is not None:
+        logger.info(f"Extraction cache hit for {pdf_path}")
+        return pages
+
+    with observe("extraction"):
+        pages = extract_pages_uncached(pdf_path)
+    # A run where OCR failed on some page would be served from the cache forever; retry it next time
+    if pages and any(page["text"] for page in pages) and not any(page.get("failed") for page in pages):
+        extraction_cache.store(digest, pages)
+    return pages
+
+
+def extract_pages_uncached(pdf_path):
+    """
+    Page-level extraction without the cache: text layer first, OCR for deficient pages.
     """
     try:
         reader = PdfReader(pdf_path)
-        text = ""
-        for page in reader.pages:
-            extracted_text = page.extract_text()
-            if extracted_text:
-                text += extracted_text
-        if not text.strip():
-            print(f"No selectable text found in {pdf_path}. Falling back to OCR.")
-            return extract_text_with_ocr(pdf_path)
-        return text.strip()
+        pages = [
+            {"page": number, "text": (page.extract_text() or "").strip(), "source": "text"}
+            for number, page in enumerate(reader.pages, start=1)
+        ]
     except Exception as e:
         print(f"Failed to extract text from {pdf_path}: {e}")
         return None
 
-
-def extract_text_with_ocr(pdf_path):
+    deficient = [page["page"] for page in pages if needs_ocr(page["text"])]
+    if deficient:
+        print(f"{len(deficient)} of {len(pages)} page(s) in {pdf_path} have no usable text. Falling back to OCR for them.")
+        try:
+            by_number = {page["page"]: page for page in pages}
+            with observe("ocr"):
+                records = ocr_pdf(pdf_path, deficient)
+            for record in records:
+                page = by_number[record["page"]]
+                if record.get("failed"):
+                    page["failed"] = True
+                # Keep the text layer if OCR did not recover more text
+                elif len(record["text"]) > len(page["text"]):
+                    page["text"] = record["text"]
+                    page["source"] = "ocr"
+        except Exception as e:
+            print(f"Failed to extract text using OCR from {pdf_path}: {e}")
+            for page in pages:
+                if page["page"] in deficient:
+                    page["failed"] = True
+
+    return pages
+
+
+def extract_pages_with_ocr(pdf_path):
     """
-    Extract text from PDF using OCR as a fallback with support for Greek and English.
+    Extract text per page using OCR with support for Greek and English.
     """
     try:
-        pages = convert_from_path(pdf_path, dpi=300)
-        text = ""
-        for page in pages:
-            text += pytesseract.image_to_string(page, lang="ell+eng")
-        return text.strip()
+        return [dict(page, source="ocr") for page in ocr_pdf(pdf_path)]
     except Exception as e:
         print(f"Failed to extract text using OCR from {pdf_path}: {e}")
         return None
 
 
+def pages_to_text(pages):
+    """
+    Join per-page text records into the full document text.
+    """
+    if not pages:
+        return None
+    return "\n".join(page["text"] for page in pages if page["text"]).strip()
+
+
+def extract_text_from_pdf(pdf_path):
+    """
+    Extract text from a PDF file, with OCR fallback if necessary.
+    """
+    return pages_to_text(extract_pages_from_pdf(pdf_path))
+
+
+def extract_text_with_ocr(pdf_path):
+    """
+    Extract text from PDF using OCR as a fallback with support for Greek and English.
+    """
+    return pages_to_text(extract_pages_with_ocr(pdf_path))
+
+
+def save_upload(file, file_path, block_size=1024 * 1024):
+    """
+    Save an uploaded file while computing the SHA-256 of its bytes in the same pass.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "wb") as f:
+        for block in iter(lambda: file.stream.read(block_size), b""):
+            digest.update(block)
+            f.write(block)
+    return digest.hexdigest()
+
+
 def generate_document_hash(doc):
     """
     Generate a hash for deduplication based on document title and content.
@@ -64,12 +157,77 @@ def generate_document_hash(doc):
     return hashlib.sha256(hash_source.encode()).hexdigest()
 
 
+def index_document_chunks(es, tc_doc_id, title, doc_hash, pages):
+    """
+    Split a document into passages, embed each passage and index them as child docs.
+    Returns the averaged passage embedding to store on the parent document.
+    """
+    passages = chunk_pages(pages)
+    if not passages:
+        logger.warning(f"No passages produced for {title}")
+        return None
+
+    embeddings = get_embeddings([passage["content"] for passage in passages])
+    if not embeddings:
+        logger.error(f"Failed to embed passages of {title}")
+        return None
+
+    create_chunk_index(es)
+    helpers.bulk(es, build_chunk_actions(tc_doc_id, title, doc_hash, passages, embeddings))
+    logger.info(f"Indexed {len(passages)} passages for {title} (tc_doc_id: {tc_doc_id})")
+
+    return mean_embedding(embeddings)
+
+
+
+
+def retrieve_document(query, embedding, es):
+    """
+    Search Elasticsearch and return the highest scoring document, or None.
+    In chunked mode this is the best passages of the top document merged together.
+    """
+    return best_document(hydrate(es, retrieve(es, query, embedding)))
+
+
+def best_document(hits):
+    """
+    Pick the document sent to the LLM from the hydrated winner hits.
+    """
+    highest_score_document = None
+    highest_score = float('-inf')
+
+    for hit in hits:
+        score = hit.get('_score', float('-inf'))
+
+        # Track the document with the highest score
+        if score > highest_score:
+            highest_score = score
+            highest_score_document = hit['_source']
+
+    # Only the best passages of the top document go to the LLM
+    if Config.CHUNKED_INGESTION:
+        highest_score_document = merge_passages(hits)
+
+    if highest_score_document:
+        # Log the highest scoring document
+        logger.debug(f"Highest score document: {highest_score_document}")
+        logger.info(f"Highest score document title: {highest_score_document.get('title', 'No Title Available')}")
+        logger.info(f"Highest score document score: {highest_score}")
+
+    return highest_score_document
 
 
 def search_sla(query, es):
     start_time = time.time()
     logger.debug(f"Searching text: {query}")
 
+    # Look up the result cache first so a hit skips the embedding round-trip
+    cached_result = search_cache.get(query)
+    if cached_result is not None:
+        logger.info("Cache hit, returning cached result")
+        elapsed_time = round(time.time() - start_time, 3)
+        return cached_result, True, elapsed_time
+
     # Generate embedding for the query using semantic model (Ollama API or OpenAI embeddings)
     embedding = get_embedding(query)
     
@@ -79,84 +237,33 @@ def search_sla(query, es):
     else:
         logger.info("Created embedding for input query. Success!")
 
-    # Skip Redis cache lookup if USE_REDIS is False
     result = {}
 
-    if Config.USE_REDIS:
-        cache_key = f"Search:{query}"
-        cached_result = redis_client.get(cache_key)
-
-        if cached_result:
-            logger.info("Cache hit, returning cached result")
-            result = json.loads(cached_result)
-            elapsed_time = round(time.time() - start_time, 2)
-            return result, True, elapsed_time
-
-    # If no cache or USE_REDIS is False, proceed with the search
-    search_query = {
-        "query": {
-            "bool": {
-                "should": [
-                    {"multi_match": {
-                        "query": query,
-                        "fields": ["title", "content"],
-                        "fuzziness": "AUTO"
-                    }},
-                    {"knn": {
-                        "field": "embedding",  # The query_vector is compared to the document embeddings in the embedding field to calculate similarity.
-                        "query_vector": embedding,
-                        "k": 5,
-                        "num_candidates": 10
-                    }}
-                ],
-                "minimum_should_match": 1
-            }
-        }
-    }
-
     try:
-        # Perform Elasticsearch search
-        response = es.search(index="pdf_documents", body=search_query)
-
-        # Process the search response
-        documents = []
-        highest_score_document = None
-        highest_score = float('-inf')
-
-        for hit in response['hits']['hits']:
-            score = hit.get('_score', float('-inf'))
-            title = hit['_source'].get('title', 'No Title Available')
-            
-            # Log each document's score and title
-            logger.info(f"Document Title: {title}, Score: {score}")           
-
-            # Track the document with the highest score
-            if score > highest_score:
-                highest_score = score
-                highest_score_document = hit['_source']
-
-            documents.append(hit['_source'])
+        # No cached result, proceed with the search
+        highest_score_document = retrieve_document(query, embedding, es)
 
         # If no results are found
         if not highest_score_document:
             logger.warning("No results found in Elasticsearch")
             return {"msg": "No results found"}, False, round(time.time() - start_time, 2)
 
-        # Log the highest scoring document
-        logger.debug(f"Highest score document: {highest_score_document}")
-        logger.info(f"Highest score document title: {highest_score_document.get('title', 'No Title Available')}")
-        logger.info(f"Highest score document score: {highest_score}")
-
+        # Reuse the answer of a near-identical question about the same document
+        cached_answer = semantic_cache.lookup(es, embedding, highest_score_document)
+        if cached_answer is not None:
+            result = {"solution": cached_answer}
+            search_cache.set(query, result)
+            return result, True, round(time.time() - start_time, 2)
 
         # Get the SLA solution 
-        solution = find_sla(query, [highest_score_document])
+        solution = find_sla(query, [highest_score_document], embedding)
         
         result = {"solution": solution}
+        if solution != NO_SOLUTION:
+            semantic_cache.store(es, query, embedding, highest_score_document, solution)
 
-        # Cache the result if required
-        if Config.USE_REDIS:
-            result = {"solution": solution}
-            redis_client.set(cache_key, json.dumps(result))
+        # Cache the result (no-op unless USE_REDIS is enabled)
+        search_cache.set(query, result)
 
     except Exception as e:
         # Handle errors and log them
@@ -169,12 +276,222 @@ def search_sla(query, es):
     return result, False, elapsed_time
 
 
-def find_sla(query, documents):
+def stream_sla(query, es):
+    """
+    Streaming variant of search_sla. Yields (event, data) tuples: "meta" with the
+    matched document and cache status as soon as retrieval is done, "token" for each
+    piece of the answer as the model generates it, then "done" (or "error").
+    The answer is cached like in search_sla once the model has finished it.
+    """
+    start_time = time.time()
+    logger.debug(f"Streaming search for text: {query}")
+
+    cached_result = search_cache.get(query)
+    if cached_result is not None:
+        logger.info("Cache hit, streaming cached result")
+        yield "meta", {"document": None, "cache_hit": True, "cache": "search"}
+        yield "token", {"content": cached_result.get("solution", "")}
+        yield "done", {"elapsed_time": round(time.time() - start_time, 3)}
+        return
+
+    embedding = get_embedding(query)
+    if not embedding:
+        yield "error", {"msg": "Failed to generate query embedding"}
+        return
+
+    try:
+        document = retrieve_document(query, embedding, es)
+    except Exception as e:
+        logger.error(f"Error during Elasticsearch query: {e}")
+        yield "error", {"msg": "Error during Elasticsearch query"}
+        return
+
+    if not document:
+        logger.warning("No results found in Elasticsearch")
+        yield "error", {"msg": "No results found"}
+        return
+
+    meta = {
+        "document": {"tc_doc_id": document.get("tc_doc_id"), "title": document.get("title")},
+        "cache_hit": False,
+        "cache": None,
+        "retrieval_time": round(time.time() - start_time, 3)
+    }
+
+    cached_answer = semantic_cache.lookup(es, embedding, document)
+    if cached_answer is not None:
+        meta.update(cache_hit=True, cache="semantic")
+        yield "meta", meta
+        yield "token", {"content": cached_answer}
+        search_cache.set(query, {"solution": cached_answer})
+        yield "done", {"elapsed_time": round(time.time() - start_time, 3)}
+        return
+
+    yield "meta", meta
+
+    parts = []
+    finished = False
+    usage_info = {}
+    try:
+        with observe("prompt"):
+            messages = build_sla_messages(query, [document], embedding)
+        started = time.time()
+        response = openai.ChatCompletion.create(
+            model=Config.MODEL,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        for chunk in response:
+            content, finish_reason, usage = read_stream_chunk(chunk)
+            finished = finished or finish_reason is not None
+            usage_info = usage or usage_info
+            if content:
+                if not parts:
+                    observe_seconds("llm_first_token", time.time() - started)
+                parts.append(content)
+                yield "token", {"content": content}
+        observe_seconds("llm", time.time() - started)
+    except Exception as e:
+        logger.error(f"Error in OpenAI solution search: {e}")
+        yield "error", {"msg": NO_SOLUTION}
+        return
+    finally:
+        record_tokens(Config.MODEL, usage_info)
+
+    solution = "".join(parts)
+    logger.info(f"Solution streamed for query: {query}")
+    logger.info(f"Total tokens used: {usage_info.get('total_tokens', 'N/A')}")
+    if cacheable_stream(query, solution, finished):
+        semantic_cache.store(es, query, embedding, document, solution)
+        search_cache.set(query, {"solution": solution})
+
+    yield "done", {"elapsed_time": round(time.time() - start_time, 3)}
+
+
+def read_stream_chunk(chunk):
+    """
+    (content, finish_reason, usage) of one streamed chat completion chunk. The usage
+    chunk requested with include_usage comes last and has no choices.
+    """
+    choices = chunk.get('choices') or [{}]
+    content = choices[0].get('delta', {}).get('content')
+    return content, choices[0].get('finish_reason'), chunk.get('usage')
+
+
+def cacheable_stream(query, solution, finished):
+    """
+    Whether a streamed answer may be cached: the model finished it and it is not empty.
+    """
+    if not finished or not solution.strip():
+        logger.warning(f"Not caching incomplete streamed answer for query: {query}")
+        return False
+    return True
+
+
+def search_sla_batch(queries, es):
+    """
+    Batch variant of search_sla for many queries at once. Queries that normalize to the
+    same text are answered once; cache misses are embedded in one batched call and
+    retrieved with a single _msearch, and the LLM calls run with bounded concurrency.
+    Returns (results, timings): one {"result", "cache_hit", "cache", "elapsed_time"}
+    dict per query, in order, and the seconds spent in each stage. A query's elapsed_time
+    runs from the start of the batch until its own answer was ready.
+    """
+    start_time = time.time()
+    timings = {}
+
+    def settle(entry, result, cache=None, finished=None):
+        entry["result"], entry["cache"] = result, cache
+        entry["elapsed_time"] = round((finished or time.time()) - start_time, 3)
+
+    # One entry per distinct normalized query, answering every item that maps to it
+    unique = {}
+    for query in queries:
+        unique.setdefault(normalize_query(query), {"query": query, "result": None, "cache": None, "elapsed_time": None})
+    entries = list(unique.values())
+    logger.info(f"Batch of {len(queries)} queries, {len(entries)} distinct")
+
+    stage = time.time()
+    for entry in entries:
+        cached_result = search_cache.get(entry["query"])
+        if cached_result is not None:
+            settle(entry, cached_result, "search")
+    pending = [entry for entry in entries if entry["result"] is None]
+    timings["cache"] = round(time.time() - stage, 3)
+
+    if pending:
+        stage = time.time()
+        embeddings = get_embeddings([entry["query"] for entry in pending])
+        timings["embedding"] = round(time.time() - stage, 3)
+        if embeddings is None:
+            for entry in pending:
+                settle(entry, {"msg": "Failed to generate query embedding"})
+            pending = []
+        else:
+            for entry, embedding in zip(pending, embeddings):
+                entry["embedding"] = embedding
+
+    if pending:
+        stage = time.time()
+        responses = retrieve_many(es, [entry["query"] for entry in pending], [entry["embedding"] for entry in pending])
+        for entry, hits in zip(pending, responses):
+            if isinstance(hits, dict):
+                logger.error(f"Batch retrieval failed for {entry['query']}: {hits}")
+                settle(entry, {"msg": "Error during Elasticsearch query"})
+        retrieved = [entry for entry in pending if entry["result"] is None]
+        # Content is fetched for every query's winners with a single mget
+        hydrated = hydrate_many(es, [hits for entry, hits in zip(pending, responses) if entry["result"] is None])
+        for entry, hits in zip(retrieved, hydrated):
+            entry["document"] = best_document(hits)
+            if not entry["document"]:
+                settle(entry, {"msg": "No results found"})
+                continue
+            cached_answer = semantic_cache.lookup(es, entry["embedding"], entry["document"])
+            if cached_answer is not None:
+                settle(entry, {"solution": cached_answer}, "semantic")
+                search_cache.set(entry["query"], entry["result"])
+        pending = [entry for entry in pending if entry["result"] is None]
+        timings["retrieval"] = round(time.time() - stage, 3)
+
+    if pending:
+        stage = time.time()
+        with ThreadPoolExecutor(max_workers=Config.BATCH_LLM_CONCURRENCY) as pool:
+            # Each answer is timed when its own LLM call returns, not when map yields it
+            solutions = pool.map(lambda entry: (find_sla(entry["query"], [entry["document"]], entry["embedding"]), time.time()), pending)
+            for entry, (solution, finished) in zip(pending, solutions):
+                settle(entry, {"solution": solution}, finished=finished)
+                if solution != NO_SOLUTION:
+                    semantic_cache.store(es, entry["query"], entry["embedding"], entry["document"], solution)
+                search_cache.set(entry["query"], entry["result"])
+        timings["llm"] = round(time.time() - stage, 3)
+
+    elapsed_time = round(time.time() - start_time, 3)
+    timings["total"] = elapsed_time
+    logger.info(f"Batch search completed in {elapsed_time} seconds: {timings}")
+
+    results = []
+    for query in queries:
+        entry = unique[normalize_query(query)]
+        results.append({
+            "result": entry["result"],
+            "cache_hit": entry["cache"] is not None,
+            "cache": entry["cache"],
+            "elapsed_time": entry["elapsed_time"]
+        })
+    return results, timings
+
+
+def build_sla_messages(query, documents, embedding=None):
+    """
+    Build the chat messages asking the model to summarize the SLAs of the given documents.
+    Each document's text is cut down to the model's token budget by build_context.
+    """
     # Modify context to include both title and content embeddings for solution finding
     context = [
         {
             "Title": doc["title"],
-            "Context": doc["content"]
+            "Context": build_context(query, doc, embedding)
 
         }
         for doc in documents
@@ -197,20 +514,26 @@ def find_sla(query, documents):
     **Σύνοψη SLA**: [Περίληψη όλων των SLA με τα βασικά σημεία, διατυπωμένα με συνοπτικό τρόπο για τον συγκεκριμένο συνεργάτη].
 """
 
+    return [{"role": "system", "content": "Είσαι ένας βοηθός που παρακολουθεί τις συμβάσεις με τους συνεργάτες μας."},
+            {"role": "user", "content": prompt}]
 
 
-
+def find_sla(query, documents, embedding=None):
     try:
+        with observe("prompt"):
+            messages = build_sla_messages(query, documents, embedding)
+
         # Assuming `Config.MODEL` contains the correct OpenAI model name
         model = Config.MODEL
-        response = openai.ChatCompletion.create(
-            model=model,
-            messages=[{"role": "system", "content": "Είσαι ένας βοηθός που παρακολουθεί τις συμβάσεις με τους συνεργάτες μας."},
-                      {"role": "user", "content": prompt}]
-        )
+        with observe("llm"):
+            response = openai.ChatCompletion.create(
+                model=model,
+                messages=messages
+            )
 
         # Log the response details
         usage_info = response.get('usage', {})
+        record_tokens(model, usage_info)
         logger.info(f"Response from OpenAI received for query: {query}")
         logger.info(
             f"Total tokens used: {usage_info.get('total_tokens', 'N/A')}")
@@ -225,7 +548,7 @@ def find_sla(query, documents):
         logger.info(f"Solution found: {sla}")
     except Exception as e:
         logger.error(f"Error in OpenAI solution search: {e}")
-        sla = "No feasible solution found"
+        sla = NO_SOLUTION
 
     return sla
 
@@ -233,16 +556,38 @@ def find_sla(query, documents):
 
 
 def get_embedding(text):
-    headers = {"Content-Type": "application/json; charset=utf-8"}
-    payload = {"model": Config.OLLAMA_MODEL, "prompt": text}
+    cached = embedding_cache.get(text)
+    if cached is not None:
+        logger.debug("Embedding cache hit")
+        return cached
+
     try:
-        response = requests.post(
-            Config.OLLAMA_API_URL, headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
+        embedding = embedding_client.embed(text)
         logger.info(f"Successfully fetched embedding for text: {text}")
-        return response.json().get("embedding", None)
-    except requests.RequestException as e:
+        embedding_cache.set(text, embedding)
+        return embedding
+    except EmbeddingError as e:
         logger.error(f"Request failed: {e}")
         return None
-    
-    
+
+
+def get_embeddings(texts):
+    """
+    Embed many texts at once, sending only cache misses to the backend in batches.
+    Returns None if any text could not be embedded.
+    """
+    embeddings = [embedding_cache.get(text) for text in texts]
+    missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+    if not missing:
+        return embeddings
+
+    try:
+        fetched = dict(zip(missing, embedding_client.embed_batch(missing)))
+    except EmbeddingError as e:
+        logger.error(f"Batch embedding failed: {e}")
+        return None
+
+    logger.info(f"Fetched {len(missing)} embeddings ({len(texts) - len(missing)} from cache)")
+    for text, embedding in fetched.items():
+        embedding_cache.set(text, embedding)
+    return [embedding if embedding is not None else fetched[text] for text, embedding in zip(texts, embeddings)]
@@ -0,0 +1,267 @@
+import argparse
+import os
+import random
+import unicodedata
+import zlib
+
+# Synthetic Greek/English support contracts and PDF fixtures for the benchmarks. Everything is
+# derived from a seed, so two runs with the same settings upload the same bytes and ask the
+# same questions.
+
+CLIENTS = [
+    ("Αθηναϊκή Διανομή Α.Ε.", "Athens Distribution S.A."), ("Ιόνιο Εμπόριο Ο.Ε.", "Ionian Trading"),
+    ("Θεσσαλική Τροφοδοσία", "Thessaly Supplies"), ("Κρητικά Καταστήματα", "Cretan Stores"),
+    ("Μακεδονικές Μεταφορές", "Macedonian Logistics"), ("Αιγαίο Λιανική", "Aegean Retail"),
+    ("Ηπειρωτικά Φαρμακεία", "Epirus Pharmacies"), ("Πελοπόννησος Καύσιμα", "Peloponnese Fuels"),
+]
+EQUIPMENT = [
+    ("ταμειακές μηχανές", "cash registers"), ("εκτυπωτές αποδείξεων", "receipt printers"),
+    ("τερματικά POS", "POS terminals"), ("διακομιστές καταστήματος", "store servers"),
+    ("ζυγαριές", "scales"), ("σαρωτές barcode", "barcode scanners"), ("δίκτυο καταστήματος", "store network"),
+]
+PRIORITIES = [("Κρίσιμη", "Critical"), ("Υψηλή", "High"), ("Μέτρια", "Medium"), ("Χαμηλή", "Low")]
+ISSUES = [
+    ("Διακοπή λειτουργίας", "δεν λειτουργεί από το πρωί και το κατάστημα δεν μπορεί να εξυπηρετήσει πελάτες",
+     "is down since this morning and the store cannot serve customers"),
+    ("Αργή απόκριση", "ανταποκρίνεται πολύ αργά μετά την τελευταία ενημέρωση",
+     "responds very slowly after the last update"),
+    ("Σφάλμα εκτύπωσης", "εμφανίζει σφάλμα κατά την έκδοση αποδείξεων",
+     "shows an error while issuing receipts"),
+    ("Αίτημα αντικατάστασης", "χρειάζεται αντικατάσταση λόγω βλάβης στο υλικό",
+     "needs replacement because of a hardware fault"),
+]
+
+
+def contract(index, rng):
+    """
+    One contract: a tc_doc_id, a title and pages of text lines with the SLA terms.
+    About a third of the contracts are in English.
+    """
+    client_el, client_en = rng.choice(CLIENTS)
+    equipment = rng.sample(EQUIPMENT, 3)
+    english = rng.random() < 0.33
+    response = sorted(rng.sample([1, 2, 4, 6, 8, 12, 24, 48], len(PRIORITIES)))
+    resolution = [hours * rng.choice([2, 3, 4]) for hours in response]
+    availability = rng.choice(["99.5", "99.8", "99.9", "98.0"])
+    penalty = rng.choice([2, 5, 10])
+    tc_doc_id = f"TC-{index:05d}"
+
+    if english:
+        title = f"Support Agreement {client_en} {tc_doc_id}"
+        lines = [title, "", f"Between the provider and {client_en} (the Customer).", "",
+                 "1. Scope of services",
+                 f"The provider supports the {', '.join(e for _, e in equipment)} of the Customer's stores."]
+        lines += ["", "2. Service levels"]
+        for (_, priority), hours, fix in zip(PRIORITIES, response, resolution):
+            lines.append(f"Priority {priority}: response within {hours} hours, restoration within {fix} hours.")
+        lines += ["", "3. Availability",
+                  f"Monthly availability of the central systems shall be at least {availability} %.",
+                  "", "4. Penalties",
+                  f"For every hour of delay beyond the restoration time a penalty of {penalty} % of the monthly fee applies."]
+    else:
+        title = f"Σύμβαση Υποστήριξης {client_el} {tc_doc_id}"
+        lines = [title, "", f"Μεταξύ του αναδόχου και της εταιρείας {client_el} (ο Πελάτης).", "",
+                 "1. Αντικείμενο",
+                 f"Ο ανάδοχος υποστηρίζει τα εξής: {', '.join(g for g, _ in equipment)} των καταστημάτων του Πελάτη."]
+        lines += ["", "2. Επίπεδα εξυπηρέτησης"]
+        for (priority, _), hours, fix in zip(PRIORITIES, response, resolution):
+            lines.append(f"Προτεραιότητα {priority}: απόκριση εντός {hours} ώρες, αποκατάσταση εντός {fix} ώρες.")
+        lines += ["", "3. Διαθεσιμότητα",
+                  f"Η μηνιαία διαθεσιμότητα των κεντρικών συστημάτων είναι τουλάχιστον {availability} %.",
+                  "", "4. Ρήτρες",
+                  f"Για κάθε ώρα καθυστέρησης πέραν του χρόνου αποκατάστασης εφαρμόζεται ρήτρα {penalty} % του μηνιαίου τιμήματος."]
+
+    # Boilerplate clauses pad contracts to a realistic, varying length
+    for clause in range(rng.randint(8, 40)):
+        lines += ["", f"{5 + clause}. {'General terms' if english else 'Γενικοί όροι'}"]
+        lines += [rng.choice(_BOILERPLATE_EN if english else _BOILERPLATE_EL) for _ in range(rng.randint(3, 8))]
+
+    return {
+        "tc_doc_id": tc_doc_id,
+        "title": title,
+        "client": client_en if english else client_el,
+        "equipment": [e if english else g for g, e in equipment],
+        "english": english,
+        "pages": [lines[i:i + 50] for i in range(0, len(lines), 50)],
+    }
+
+
+_BOILERPLATE_EL = [
+    "Ο ανάδοχος τηρεί αρχείο αιτημάτων με την ημερομηνία και ώρα καταγραφής κάθε βλάβης.",
+    "Τα αιτήματα υποβάλλονται τηλεφωνικά ή μέσω της πύλης υποστήριξης όλο το εικοσιτετράωρο.",
+    "Οι χρόνοι μετρώνται σε εργάσιμες ώρες, εκτός αν ορίζεται διαφορετικά για την προτεραιότητα.",
+    "Η προληπτική συντήρηση γίνεται εκτός ωραρίου λειτουργίας των καταστημάτων.",
+    "Ο Πελάτης εξασφαλίζει την πρόσβαση των τεχνικών στους χώρους εγκατάστασης.",
+    "Ανταλλακτικά που δεν καλύπτονται από την εγγύηση χρεώνονται σύμφωνα με τον τιμοκατάλογο.",
+    "Η σύμβαση ανανεώνεται αυτόματα για ένα έτος, εφόσον δεν καταγγελθεί εγγράφως.",
+]
+_BOILERPLATE_EN = [
+    "The provider keeps a log of every request with the date and time the fault was reported.",
+    "Requests are submitted by phone or through the support portal around the clock.",
+    "Times are measured in business hours unless stated otherwise for the priority.",
+    "Preventive maintenance is carried out outside the opening hours of the stores.",
+    "The Customer grants the technicians access to the installation premises.",
+    "Spare parts not covered by the warranty are charged according to the price list.",
+    "The agreement renews automatically for one year unless terminated in writing.",
+]
+
+
+def contracts(count, seed=0):
+    rng = random.Random(seed)
+    return [contract(index, rng) for index in range(1, count + 1)]
+
+
+def queries(documents, count, seed=0):
+    """
+    SLA questions ({"title", "message"}) about the given contracts, in the contract's language.
+    """
+    rng = random.Random(seed + 1)
+    result = []
+    for _ in range(count):
+        document = rng.choice(documents)
+        title, problem_el, problem_en = rng.choice(ISSUES)
+        equipment = rng.choice(document["equipment"])
+        store = rng.randint(1, 120)
+        if document["english"]:
+            message = f"At {document['client']} store {store} the {equipment} {problem_en}. What is the response time?"
+        else:
+            message = f"Στο κατάστημα {store} της {document['client']} το σύστημα ({equipment}) {problem_el}. Ποιος είναι ο χρόνος απόκρισης;"
+        result.append({"title": title, "message": message})
+    return result
+
+
+# Text PDFs use the standard Helvetica font with Greek glyph names mapped onto codes 128-255
+# through a /Differences array, so text extraction recovers the Unicode text. (Helvetica has
+# no Greek outlines; viewers show placeholders, which does not matter for ingestion.)
+_GLYPH_NAMES = {"LAMDA": "lambda", "FINAL SIGMA": "sigma1"}
+# The plain names map to the math symbols (U+2206, U+2126, U+00B5) in the Adobe Glyph List
+_GREEK_ALIASES = {"Delta": "Deltagreek", "Omega": "Omegagreek", "mu": "mugreek"}
+
+
+def _glyph_name(char):
+    name = unicodedata.name(char)
+    capital = " CAPITAL " in name
+    base, _, accent = name.split(" LETTER ", 1)[1].partition(" WITH ")
+    glyph = _GLYPH_NAMES.get(base, base.lower())
+    glyph = glyph.capitalize() if capital else glyph
+    if not accent:
+        return _GREEK_ALIASES.get(glyph, glyph)
+    return glyph + {"TONOS": "tonos", "DIALYTIKA": "dieresis",
+                    "DIALYTIKA AND TONOS": "dieresistonos"}[accent]
+
+
+_GREEK = [chr(code) for code in range(0x0386, 0x03CF)
+          if unicodedata.category(chr(code)).startswith("L")]
+_CODES = {char: 128 + index for index, char in enumerate(_GREEK)}
+
+
+def _encode(text):
+    return bytes(_CODES.get(char, ord(char) if ord(char) < 128 else ord("?")) for char in text)
+
+
+def _pdf_string(text):
+    return "<" + _encode(text).hex() + ">"
+
+
+def write_text_pdf(path, pages, font_size=10):
+    """
+    Write an A4 PDF with one text-layer page per list of lines.
+    """
+    differences = "[128 " + " ".join(f"/{_glyph_name(char)}" for char in _GREEK) + "]"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages, filled in once the page objects are numbered
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+        f"/Encoding << /Type /Encoding /BaseEncoding /WinAnsiEncoding /Differences {differences} >> >>",
+    ]
+    page_refs = []
+    for lines in pages:
+        content = [f"BT /F1 {font_size} Tf {font_size * 1.4:.1f} TL 50 790 Td"]
+        content += [f"{_pdf_string(line)} Tj T*" for line in lines]
+        content.append("ET")
+        stream = zlib.compress("\n".join(content).encode("ascii"))
+        objects.append((f"<< /Length {len(stream)} /Filter /FlateDecode >>", stream))
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_refs.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(page_refs)}] /Count {len(page_refs)} >>"
+
+    data = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(data))
+        if isinstance(obj, tuple):
+            data += f"{number} 0 obj\n{obj[0]}\nstream\n".encode("ascii") + obj[1] + b"\nendstream\nendobj\n"
+        else:
+            data += f"{number} 0 obj\n{obj}\nendobj\n".encode("ascii")
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("ascii")
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("ascii")
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii")
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+_FONTS = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/freefont/FreeSans.ttf",
+]
+
+
+def write_scanned_pdf(path, pages, dpi=150):
+    """
+    Write a PDF of page images without a text layer, like a scanner does, so ingestion takes
+    the OCR path. Needs Pillow and, for Greek text, a DejaVu or FreeSans font; returns False
+    when Pillow is missing.
+    """
+    try:
+        from PIL import Image, ImageDraw, ImageFont
+    except ImportError:
+        return False
+
+    font_path = next((font for font in _FONTS if os.path.exists(font)), None)
+    font_size = int(dpi / 72 * 11)
+    font = ImageFont.truetype(font_path, font_size) if font_path else ImageFont.load_default()
+    images = []
+    for lines in pages:
+        image = Image.new("L", (int(8.27 * dpi), int(11.69 * dpi)), 255)
+        draw = ImageDraw.Draw(image)
+        y = dpi // 2
+        for line in lines:
+            draw.text((dpi // 2, y), line if font_path else line.encode("ascii", "replace").decode(), fill=0, font=font)
+            y += int(font_size * 1.4)
+        images.append(image)
+    images[0].save(path, "PDF", resolution=dpi, save_all=True, append_images=images[1:])
+    return True
+
+
+def build(directory, count, scanned=0, seed=0):
+    """
+    Generate count contracts as PDFs in directory; the last `scanned` of them as image-only
+    scans. Returns the contracts with their "path" and "scanned" flag.
+    """
+    os.makedirs(directory, exist_ok=True)
+    documents = contracts(count, seed)
+    for index, document in enumerate(documents):
+        document["scanned"] = index >= count - scanned
+        document["path"] = os.path.join(directory, f"{document['tc_doc_id']}.pdf")
+        if document["scanned"] and write_scanned_pdf(document["path"], document["pages"]):
+            continue
+        document["scanned"] = False
+        write_text_pdf(document["path"], document["pages"])
+    return documents
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the synthetic contract PDFs used by the benchmarks.")
+    parser.add_argument("directory", help="Output directory")
+    parser.add_argument("--docs", type=int, default=20, help="Number of contracts")
+    parser.add_argument("--scanned", type=int, default=0, help="How many of them to render as scans (needs Pillow)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    built = build(args.directory, args.docs, args.scanned, args.seed)
+    print(f"Wrote {len(built)} PDFs ({sum(d['scanned'] for d in built)} scanned) to {args.directory}")
@@ -0,0 +1,545 @@
+import base64
+import copy
+import itertools
+import json
+import math
+import threading
+import uuid
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs, unquote
+from fakes import FakeServer, Latency, _Handler, tokens
+
+# Minimal in-memory Elasticsearch for benchmarks: the subset of the REST API the application
+# uses (index and alias admin, document CRUD, bulk, mget, search with bool/term/terms/range/
+# multi_match queries, kNN, the rrf retriever, msearch, count, delete/update by query, and
+# point-in-time and scroll paging). It is single-node, always "refreshed" and brute-forces
+# kNN, so it measures the application's overhead rather than Elasticsearch's; run
+# loadtest.py with --es-url to use a real node.
+
+
+class ApiError(Exception):
+    def __init__(self, status, error_type, reason):
+        super().__init__(reason)
+        self.status = status
+        self.body = {"error": {"type": error_type, "reason": reason,
+                               "root_cause": [{"type": error_type, "reason": reason}]}, "status": status}
+
+
+def _get(source, field):
+    value = source
+    for part in field.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _values(source, field):
+    value = _get(source, field)
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _filter_source(source, spec):
+    """
+    Apply a _source spec: True/False, a field list, or {"includes", "excludes"}.
+    """
+    if spec is None or spec is True:
+        return source
+    if spec is False:
+        return None
+    if isinstance(spec, str):
+        spec = [spec]
+    includes, excludes = (spec, []) if isinstance(spec, list) else (spec.get("includes", []), spec.get("excludes", []))
+    result = {key: value for key, value in source.items() if not includes or key in includes}
+    return {key: value for key, value in result.items() if key not in excludes}
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class FakeElasticsearch(FakeServer):
+
+    def __init__(self, port=0, latency=None):
+        super().__init__(port)
+        self.latency = latency or Latency()
+        self.indices = {}  # name -> {"mappings", "settings", "docs": OrderedDict}
+        self.aliases = {}  # alias -> {index: {"is_write_index": bool}}
+        self.pits = {}  # pit id -> {index: [doc ids]}
+        self.scrolls = {}  # scroll id -> (remaining hits, page size, _source spec)
+        self.lock = threading.RLock()
+        self._ids = itertools.count(1)
+
+    # Index and alias resolution
+
+    def resolve(self, expression, must_exist=True):
+        names = []
+        for name in (expression or "_all").split(","):
+            if name in ("_all", "*"):
+                names.extend(self.indices)
+            elif name in self.aliases:
+                names.extend(self.aliases[name])
+            elif name in self.indices:
+                names.append(name)
+            elif must_exist:
+                raise ApiError(404, "index_not_found_exception", f"no such index [{name}]")
+        return list(dict.fromkeys(names))
+
+    def write_index(self, name):
+        if name in self.indices:
+            return name
+        if name in self.aliases:
+            targets = self.aliases[name]
+            writable = [index for index, options in targets.items() if options.get("is_write_index")]
+            if len(writable) == 1 or len(targets) == 1:
+                return (writable or list(targets))[0]
+            raise ApiError(400, "illegal_argument_exception", f"no write index is defined for alias [{name}]")
+        # Auto-create with dynamic mapping, like Elasticsearch
+        self.create_index(name, {})
+        return name
+
+    def create_index(self, name, body):
+        if name in self.indices or name in self.aliases:
+            raise ApiError(400, "resource_already_exists_exception", f"index [{name}] already exists")
+        self.indices[name] = {"mappings": body.get("mappings", {}), "settings": body.get("settings", {}), "docs": OrderedDict()}
+        for alias, options in (body.get("aliases") or {}).items():
+            self.aliases.setdefault(alias, {})[name] = options or {}
+        return {"acknowledged": True, "shards_acknowledged": True, "index": name}
+
+    def delete_index(self, expression):
+        for name in self.resolve(expression):
+            self.indices.pop(name, None)
+            for targets in self.aliases.values():
+                targets.pop(name, None)
+        self.aliases = {alias: targets for alias, targets in self.aliases.items() if targets}
+        return {"acknowledged": True}
+
+    def update_aliases(self, actions):
+        for action in actions:
+            (kind, spec), = action.items()
+            if kind == "add":
+                if spec["alias"] in self.indices:
+                    raise ApiError(400, "invalid_alias_name_exception", f"an index exists with the same name as the alias [{spec['alias']}]")
+                for index in self.resolve(spec["index"]):
+                    self.aliases.setdefault(spec["alias"], {})[index] = {"is_write_index": spec.get("is_write_index", False)}
+            elif kind == "remove":
+                for index in self.resolve(spec["index"]):
+                    self.aliases.get(spec["alias"], {}).pop(index, None)
+            elif kind == "remove_index":
+                self.delete_index(spec["index"])
+        self.aliases = {alias: targets for alias, targets in self.aliases.items() if targets}
+        return {"acknowledged": True}
+
+    # Documents
+
+    def put(self, index, doc_id, source, op_type="index"):
+        name = self.write_index(index)
+        docs = self.indices[name]["docs"]
+        doc_id = str(doc_id) if doc_id is not None else base64.urlsafe_b64encode(uuid.uuid4().bytes).decode()[:20]
+        if op_type == "create" and doc_id in docs:
+            raise ApiError(409, "version_conflict_engine_exception", f"[{doc_id}]: document already exists")
+        result = "updated" if doc_id in docs else "created"
+        docs[doc_id] = source
+        return {"_index": name, "_id": doc_id, "_version": 1, "result": result, "_shards": {"total": 1, "successful": 1, "failed": 0}}
+
+    def find(self, expression, doc_id):
+        for name in self.resolve(expression, must_exist=False):
+            if doc_id in self.indices[name]["docs"]:
+                return name, self.indices[name]["docs"][doc_id]
+        return None, None
+
+    def mget(self, default_index, body, source_spec=None):
+        docs = []
+        requests = body.get("docs") or [{"_id": doc_id} for doc_id in body.get("ids", [])]
+        for request in requests:
+            index = request.get("_index", default_index)
+            name, source = self.find(index, str(request["_id"]))
+            if source is None:
+                docs.append({"_index": index, "_id": request["_id"], "found": False})
+            else:
+                spec = request.get("_source", source_spec)
+                docs.append({"_index": name, "_id": request["_id"], "_version": 1, "found": True,
+                             "_source": _filter_source(source, spec)})
+        return {"docs": docs}
+
+    def bulk(self, default_index, lines):
+        items = []
+        errors = False
+        lines = iter(lines)
+        for action in lines:
+            (op, meta), = action.items()
+            index = meta.get("_index", default_index)
+            doc_id = meta.get("_id")
+            try:
+                if op == "delete":
+                    name, source = self.find(index, str(doc_id))
+                    if source is not None:
+                        del self.indices[name]["docs"][str(doc_id)]
+                    result = {"_index": name or index, "_id": doc_id, "result": "deleted" if source else "not_found", "status": 200 if source else 404}
+                elif op == "update":
+                    body = next(lines)
+                    name, source = self.find(index, str(doc_id))
+                    if source is None:
+                        raise ApiError(404, "document_missing_exception", f"[{doc_id}]: document missing")
+                    source.update(body.get("doc", {}))
+                    result = {"_index": name, "_id": doc_id, "result": "updated", "status": 200}
+                else:
+                    result = self.put(index, doc_id, next(lines), op)
+                    result["status"] = 201 if result["result"] == "created" else 200
+            except ApiError as e:
+                errors = True
+                result = {"_index": index, "_id": doc_id, "status": e.status, "error": e.body["error"]}
+            items.append({op: result})
+        return {"took": 1, "errors": errors, "items": items}
+
+    # Search
+
+    def matches(self, query, source):
+        if not query or "match_all" in query:
+            return True
+        (kind, spec), = query.items()
+        if kind == "term":
+            (field, value), = spec.items()
+            value = value.get("value") if isinstance(value, dict) else value
+            return value in _values(source, field)
+        if kind == "terms":
+            (field, values), = spec.items()
+            return any(value in values for value in _values(source, field))
+        if kind == "range":
+            (field, bounds), = spec.items()
+            values = _values(source, field)
+            if not values:
+                return False
+            value = values[0]
+            checks = {"gte": lambda b: value >= b, "gt": lambda b: value > b, "lte": lambda b: value <= b, "lt": lambda b: value < b}
+            return all(checks[op](bound) for op, bound in bounds.items() if op in checks and not str(bound).startswith("now"))
+        if kind == "exists":
+            return bool(_values(source, spec["field"]))
+        if kind == "bool":
+            as_list = lambda clause: clause if isinstance(clause, list) else [clause]
+            if not all(self.matches(q, source) for q in as_list(spec.get("must", [])) + as_list(spec.get("filter", []))):
+                return False
+            if any(self.matches(q, source) for q in as_list(spec.get("must_not", []))):
+                return False
+            should = as_list(spec.get("should", []))
+            required = spec.get("minimum_should_match", 0 if spec.get("must") or spec.get("filter") else 1)
+            return not should or not required or any(self.matches(q, source) for q in should)
+        if kind in ("match", "multi_match"):
+            return self.text_score(kind, spec, source) > 0
+        raise ApiError(400, "parsing_exception", f"unknown query [{kind}]")
+
+    def text_score(self, kind, spec, source):
+        if kind == "match":
+            (field, value), = spec.items()
+            fields, text = [field], value.get("query") if isinstance(value, dict) else value
+        else:
+            fields, text = spec.get("fields", ["*"]), spec["query"]
+        terms = set(tokens(str(text)))
+        score = 0.0
+        for field in fields:
+            name, _, boost = field.partition("^")
+            field_tokens = tokens(" ".join(str(value) for value in _values(source, name)))
+            if not field_tokens:
+                continue
+            present = terms.intersection(field_tokens)
+            score += float(boost or 1) * len(present) / math.sqrt(len(field_tokens))
+        return score
+
+    def score(self, query, source):
+        if not query or "match_all" in query:
+            return 1.0
+        (kind, spec), = query.items()
+        if kind in ("match", "multi_match"):
+            return self.text_score(kind, spec, source)
+        if kind == "bool":
+            must = spec.get("must", [])
+            must = must if isinstance(must, list) else [must]
+            return sum(self.score(q, source) for q in must) or 1.0
+        return 1.0
+
+    def candidates(self, names):
+        for name in names:
+            for doc_id, source in self.indices[name]["docs"].items():
+                yield name, doc_id, source
+
+    def lexical_hits(self, names, query):
+        hits = [{"_index": name, "_id": doc_id, "_score": self.score(query, source), "_source": source}
+                for name, doc_id, source in self.candidates(names) if self.matches(query, source)]
+        hits.sort(key=lambda hit: hit["_score"], reverse=True)
+        return hits
+
+    def knn_hits(self, names, knn):
+        hits = []
+        for name, doc_id, source in self.candidates(names):
+            vector = _get(source, knn["field"])
+            if not vector or (knn.get("filter") and not self.matches(
+                    knn["filter"] if isinstance(knn["filter"], dict) else {"bool": {"filter": knn["filter"]}}, source)):
+                continue
+            similarity = _cosine(knn["query_vector"], vector)
+            if knn.get("similarity") is not None and similarity < knn["similarity"]:
+                continue
+            # Elasticsearch's score for cosine similarity
+            hits.append({"_index": name, "_id": doc_id, "_score": (1 + similarity) / 2, "_source": source})
+        hits.sort(key=lambda hit: hit["_score"], reverse=True)
+        return hits[:knn.get("k", 10)]
+
+    def retriever_hits(self, names, retriever):
+        (kind, spec), = retriever.items()
+        if kind == "standard":
+            return self.lexical_hits(names, spec.get("query"))
+        if kind == "knn":
+            return self.knn_hits(names, spec)
+        if kind == "rrf":
+            window = spec.get("rank_window_size", 10)
+            constant = spec.get("rank_constant", 60)
+            fused = {}
+            for child in spec["retrievers"]:
+                for rank, hit in enumerate(self.retriever_hits(names, child)[:window], start=1):
+                    entry = fused.setdefault((hit["_index"], hit["_id"]), dict(hit, _score=0.0))
+                    entry["_score"] += 1.0 / (constant + rank)
+            return sorted(fused.values(), key=lambda hit: hit["_score"], reverse=True)
+        raise ApiError(400, "parsing_exception", f"unknown retriever [{kind}]")
+
+    def search(self, expression, body, params):
+        body = dict(body or {})
+        for key in ("size", "from"):
+            if key in params:
+                body[key] = int(params[key])
+        size = body.get("size", 10)
+        start = body.get("from", 0)
+
+        if "pit" in body:
+            return self.pit_search(body, size)
+
+        names = self.resolve(expression)
+        if "retriever" in body:
+            hits = self.retriever_hits(names, body["retriever"])
+        elif "knn" in body:
+            knn = body["knn"]
+            hits = self.knn_hits(names, knn if isinstance(knn, dict) else knn[0])
+        else:
+            hits = self.lexical_hits(names, body.get("query"))
+
+        spec = body.get("_source", params.get("_source_includes"))
+        response = self.page(hits[start:], size, spec, len(hits))
+        if params.get("scroll"):
+            scroll_id = base64.urlsafe_b64encode(uuid.uuid4().bytes).decode()
+            self.scrolls[scroll_id] = (hits[start + size:], size, spec)
+            response["_scroll_id"] = scroll_id
+        return response
+
+    def page(self, hits, size, spec, total):
+        page = [dict(hit, _source=_filter_source(hit["_source"], spec)) for hit in hits[:size]]
+        return {
+            "took": 1, "timed_out": False, "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {"total": {"value": total, "relation": "eq"}, "max_score": page[0]["_score"] if page else None, "hits": page}
+        }
+
+    def scroll(self, scroll_id):
+        if scroll_id not in self.scrolls:
+            raise ApiError(404, "search_context_missing_exception", "No search context found for id")
+        hits, size, spec = self.scrolls[scroll_id]
+        self.scrolls[scroll_id] = (hits[size:], size, spec)
+        return dict(self.page(hits, size, spec, len(hits)), _scroll_id=scroll_id)
+
+    def open_pit(self, expression):
+        pit_id = base64.urlsafe_b64encode(uuid.uuid4().bytes).decode()
+        self.pits[pit_id] = {name: list(self.indices[name]["docs"]) for name in self.resolve(expression)}
+        return {"id": pit_id}
+
+    def pit_search(self, body, size):
+        pit = self.pits.get(body["pit"]["id"])
+        if pit is None:
+            raise ApiError(404, "search_context_missing_exception", "No search context found for id")
+        slice_spec = body.get("slice")
+        after = (body.get("search_after") or [-1])[0]
+        hits = []
+        for ordinal, (name, doc_id) in enumerate((name, doc_id) for name, ids in pit.items() for doc_id in ids):
+            if ordinal <= after or (slice_spec and ordinal % slice_spec["max"] != slice_spec["id"]):
+                continue
+            source = self.indices.get(name, {}).get("docs", {}).get(doc_id)
+            if source is None:
+                continue
+            hits.append({"_index": name, "_id": doc_id, "_score": None, "sort": [ordinal],
+                         "_source": _filter_source(source, body.get("_source"))})
+            if len(hits) >= size:
+                break
+        return {"pit_id": body["pit"]["id"], "took": 1, "timed_out": False,
+                "hits": {"total": {"value": len(hits), "relation": "eq"}, "max_score": None, "hits": hits}}
+
+    def by_query(self, expression, body, update_fields=None):
+        names = self.resolve(expression)
+        changed = 0
+        for name, doc_id, source in list(self.candidates(names)):
+            if not self.matches(body.get("query"), source):
+                continue
+            if update_fields is None:
+                del self.indices[name]["docs"][doc_id]
+            else:
+                source.update(copy.deepcopy(update_fields))
+            changed += 1
+        return changed
+
+
+class _ElasticsearchHandler(_Handler):
+
+    def do_HEAD(self):
+        self.dispatch("HEAD")
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def send_json(self, body, status=200):
+        data = b"" if self.command == "HEAD" else json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def dispatch(self, method):
+        self.fake.count()
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path.split("/") if part]
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            self.fake.latency.sleep(1)
+            with self.fake.lock:
+                status, body = self.route(method, parts, params, raw)
+        except ApiError as e:
+            status, body = e.status, e.body
+        except (KeyError, ValueError, TypeError) as e:
+            status, body = 400, ApiError(400, "parsing_exception", f"{type(e).__name__}: {e}").body
+        self.send_json(body, status)
+
+    def route(self, method, parts, params, raw):
+        fake = self.fake
+        ndjson = lambda: [json.loads(line) for line in raw.splitlines() if line.strip()]
+        body = lambda: json.loads(raw) if raw else {}
+
+        if not parts:
+            return 200, {"name": "bench", "cluster_name": "bench", "cluster_uuid": "bench",
+                         "version": {"number": "8.16.0", "build_flavor": "default", "lucene_version": "9.12.0"},
+                         "tagline": "You Know, for Search"}
+
+        head, rest = parts[0], parts[1:]
+        if head == "_alias" and rest:
+            found = {index: {"aliases": {rest[0]: options}} for index, options in fake.aliases.get(rest[0], {}).items()}
+            return (200, found) if found else (404, {"error": f"alias [{rest[0]}] missing", "status": 404})
+        if head == "_aliases":
+            return 200, fake.update_aliases(body()["actions"])
+        if head == "_bulk":
+            return 200, fake.bulk(None, ndjson())
+        if head == "_mget":
+            return 200, fake.mget(None, body(), params.get("_source_includes") and params["_source_includes"].split(","))
+        if head == "_msearch":
+            return 200, self.msearch(None, ndjson(), params)
+        if head == "_search" and rest == ["scroll"]:
+            if method == "DELETE":
+                for scroll_id in body().get("scroll_id", []):
+                    fake.scrolls.pop(scroll_id, None)
+                return 200, {"succeeded": True, "num_freed": 1}
+            return 200, fake.scroll(body()["scroll_id"])
+        if head == "_search":
+            return 200, fake.search(None, body(), params)
+        if head == "_pit" and method == "DELETE":
+            fake.pits.pop(body().get("id"), None)
+            return 200, {"succeeded": True, "num_freed": 1}
+        if head == "_tasks":
+            return 200, {"completed": True, "task": {"status": {}}, "response": {}}
+        if head == "_cluster":
+            return 200, {"status": "green"}
+
+        index = head
+        action = rest[0] if rest else None
+        if action is None:
+            if method == "HEAD":
+                exists = index in fake.indices or index in fake.aliases
+                return (200 if exists else 404), {}
+            if method == "PUT":
+                return 200, fake.create_index(index, body())
+            if method == "DELETE":
+                return 200, fake.delete_index(index)
+            if method == "GET":
+                return 200, {name: {"mappings": fake.indices[name]["mappings"], "settings": fake.indices[name]["settings"]}
+                             for name in fake.resolve(index)}
+        if action in ("_doc", "_create"):
+            doc_id = rest[1] if len(rest) > 1 else None
+            if method in ("GET", "HEAD"):
+                name, source = fake.find(index, doc_id)
+                if source is None:
+                    return 404, {"_index": index, "_id": doc_id, "found": False}
+                return 200, {"_index": name, "_id": doc_id, "_version": 1, "found": True, "_source": source}
+            if method == "DELETE":
+                name, source = fake.find(index, doc_id)
+                if source is None:
+                    return 404, {"_index": index, "_id": doc_id, "result": "not_found"}
+                del fake.indices[name]["docs"][doc_id]
+                return 200, {"_index": name, "_id": doc_id, "result": "deleted"}
+            op_type = "create" if action == "_create" or params.get("op_type") == "create" else "index"
+            result = fake.put(index, doc_id, body(), op_type)
+            return (201 if result["result"] == "created" else 200), result
+        if action == "_search":
+            return 200, fake.search(index, body(), params)
+        if action == "_msearch":
+            return 200, self.msearch(index, ndjson(), params)
+        if action == "_count":
+            query = body().get("query")
+            return 200, {"count": sum(1 for _, _, source in fake.candidates(fake.resolve(index)) if fake.matches(query, source))}
+        if action == "_mget":
+            return 200, fake.mget(index, body(), params.get("_source_includes") and params["_source_includes"].split(","))
+        if action == "_bulk":
+            return 200, fake.bulk(index, ndjson())
+        if action == "_pit":
+            return 200, fake.open_pit(index)
+        if action == "_refresh":
+            return 200, {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+        if action == "_forcemerge":
+            return 200, {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+        if action == "_mapping":
+            return 200, {name: {"mappings": fake.indices[name]["mappings"]} for name in fake.resolve(index)}
+        if action == "_settings":
+            if method == "PUT":
+                for name in fake.resolve(index):
+                    fake.indices[name]["settings"].setdefault("index", {}).update(body().get("index", body()))
+                return 200, {"acknowledged": True}
+            return 200, {name: {"settings": {"index": dict(fake.indices[name]["settings"].get("index", {}),
+                                                           number_of_shards="1", number_of_replicas="0")}}
+                         for name in fake.resolve(index)}
+        if action in ("_delete_by_query", "_update_by_query"):
+            request = body()
+            fields = request.get("script", {}).get("params", {}).get("fields", {}) if action == "_update_by_query" else None
+            changed = fake.by_query(index, request, fields)
+            result = {"took": 1, "total": changed, "failures": [], "deleted" if fields is None else "updated": changed}
+            if params.get("wait_for_completion") == "false":
+                return 200, {"task": f"bench:{next(fake._ids)}"}
+            return 200, result
+        raise ApiError(400, "illegal_argument_exception", f"unsupported request [{method} /{'/'.join(parts)}]")
+
+    def msearch(self, default_index, lines, params):
+        responses = []
+        for header, body in zip(lines[::2], lines[1::2]):
+            try:
+                responses.append(dict(self.fake.search(header.get("index", default_index), body, {}), status=200))
+            except ApiError as e:
+                responses.append(dict(e.body))
+        return {"took": 1, "responses": responses}
+
+
+FakeElasticsearch.handler = _ElasticsearchHandler
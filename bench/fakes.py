@@ -0,0 +1,225 @@
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import unicodedata
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-ins for the Ollama embeddings API and the OpenAI chat API. Responses are
+# deterministic functions of the request; latency is a base plus per-item cost with
+# seeded jitter, so runs with the same settings put the same load on the application.
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokens(text):
+    text = "".join(c for c in unicodedata.normalize("NFD", text) if not unicodedata.combining(c))
+    return _TOKEN_RE.findall(text.casefold())
+
+
+def hashed_embedding(text, dims):
+    """
+    Feature-hashed bag of words, L2-normalized: texts sharing words get similar vectors,
+    so retrieval against the fake behaves like a (weak) real model.
+    """
+    vector = [0.0] * dims
+    for token in tokens(text):
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % dims
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector))
+    if not norm:
+        vector[0] = norm = 1.0
+    return [value / norm for value in vector]
+
+
+class Latency:
+    """
+    Simulated service time: base_ms + per_item_ms * items, plus uniform jitter of +/- jitter_ms.
+    """
+
+    def __init__(self, base_ms=0.0, per_item_ms=0.0, jitter_ms=0.0, seed=0):
+        self.base_ms = base_ms
+        self.per_item_ms = per_item_ms
+        self.jitter_ms = jitter_ms
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def seconds(self, items=1):
+        with self._lock:
+            jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.base_ms + self.per_item_ms * items + jitter) / 1000.0
+
+    def sleep(self, items=1):
+        time.sleep(self.seconds(items))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_json(self, body, status=200):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeServer:
+    """
+    A threaded HTTP server running in the background on 127.0.0.1.
+    """
+
+    handler = _Handler
+
+    def __init__(self, port=0):
+        handler = type(self.handler.__name__, (self.handler,), {"fake": self})
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.server.daemon_threads = True
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name=type(self).__name__, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _OllamaHandler(_Handler):
+    def do_POST(self):
+        self.fake.count()
+        body = self.read_json()
+        if self.path == "/api/embed":
+            inputs = body.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self.fake.latency.sleep(len(inputs))
+            self.send_json({"model": body.get("model"),
+                            "embeddings": [hashed_embedding(text, self.fake.dims) for text in inputs]})
+        elif self.path == "/api/embeddings":
+            self.fake.latency.sleep(1)
+            self.send_json({"embedding": hashed_embedding(body.get("prompt", ""), self.fake.dims)})
+        else:
+            self.send_json({"error": f"unknown path {self.path}"}, 404)
+
+
+class FakeOllama(FakeServer):
+    """
+    Ollama /api/embed (batch) and /api/embeddings (single).
+    """
+
+    handler = _OllamaHandler
+
+    def __init__(self, port=0, dims=768, latency=None):
+        super().__init__(port)
+        self.dims = dims
+        self.latency = latency or Latency()
+
+
+class _OpenAIHandler(_Handler):
+    def do_POST(self):
+        self.fake.count()
+        body = self.read_json()
+        if self.path.endswith("/chat/completions"):
+            self.chat(body)
+        elif self.path.endswith("/embeddings"):
+            inputs = body.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self.fake.embedding_latency.sleep(len(inputs))
+            self.send_json({
+                "object": "list",
+                "model": body.get("model"),
+                "data": [{"object": "embedding", "index": i, "embedding": hashed_embedding(text, self.fake.dims)}
+                         for i, text in enumerate(inputs)],
+                "usage": {"prompt_tokens": sum(len(tokens(text)) for text in inputs)}
+            })
+        else:
+            self.send_json({"error": {"message": f"unknown path {self.path}"}}, 404)
+
+    def chat(self, body):
+        prompt = "\n".join(message.get("content", "") for message in body.get("messages", []))
+        answer = self.fake.answer(prompt)
+        words = answer.split(" ")
+        usage = {"prompt_tokens": len(tokens(prompt)), "completion_tokens": len(words)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        # Time to first token, then the rest of the completion at the generation rate
+        first_token = self.fake.latency.seconds(0)
+        per_token = self.fake.token_ms / 1000.0
+
+        if not body.get("stream"):
+            time.sleep(first_token + per_token * len(words))
+            self.send_json({
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": usage
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(first_token)
+        for i, word in enumerate(words):
+            chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "model": body.get("model"),
+                     "choices": [{"index": 0, "delta": {"content": word if i == 0 else f" {word}"}, "finish_reason": None}]}
+            self.write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+            time.sleep(per_token)
+        last = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "model": body.get("model"),
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        self.write_chunk(f"data: {json.dumps(last)}\n\n")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self.write_chunk(f"data: {json.dumps(dict(last, choices=[], usage=usage))}\n\n")
+        self.write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeOpenAI(FakeServer):
+    """
+    OpenAI /v1/chat/completions (blocking and streamed) and /v1/embeddings.
+    The answer quotes the SLA figures found in the prompt, so it varies with the retrieved document.
+    """
+
+    handler = _OpenAIHandler
+    _FIGURES = re.compile(r"\d+(?:[.,]\d+)?\s*(?:ώρες|ωρών|hours|εργάσιμες|business|%)", re.IGNORECASE)
+
+    def __init__(self, port=0, dims=1536, latency=None, token_ms=0.0, embedding_latency=None):
+        super().__init__(port)
+        self.dims = dims
+        self.latency = latency or Latency()
+        self.token_ms = token_ms
+        self.embedding_latency = embedding_latency or Latency()
+
+    def answer(self, prompt):
+        figures = list(dict.fromkeys(self._FIGURES.findall(prompt)))[:6]
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        points = "; ".join(figures) if figures else "δεν βρέθηκαν συγκεκριμένοι χρόνοι"
+        return f"**Σύνοψη SLA**: Χρόνοι απόκρισης και αποκατάστασης: {points}. (ref {digest})"
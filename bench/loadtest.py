@@ -0,0 +1,495 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import requests
+import corpus
+from fakes import FakeOllama, FakeOpenAI, Latency
+from fake_es import FakeElasticsearch
+
+# Offline load test: starts local stand-ins for Ollama, OpenAI and Elasticsearch, runs the API
+# against them with gunicorn (or Flask's server when gunicorn is missing), drives
+# /upload-documents, /check-sla and /backup-index at a fixed concurrency and writes a JSON
+# report with throughput, latency percentiles, per-stage timings (from Server-Timing) and
+# server RSS. --compare checks the report against a baseline for regressions.
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+SCENARIOS = ("upload", "check-sla", "backup")
+USER = {"username": "bench", "password": "bench-password"}
+
+# The encodings the context builder loads (the same ones the Dockerfile prefetches); the first is gpt-4o-mini's
+ENCODINGS = ("o200k_base", "cl100k_base")
+SEED_TOKENIZER = f"import tiktoken; [tiktoken.get_encoding(name) for name in {ENCODINGS!r}]"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def tokenizer_cached(cache_dir):
+    """
+    Whether tiktoken can load the default model's encoding from cache_dir alone. The check runs
+    behind an unreachable proxy, so it never downloads anything.
+    """
+    env = dict(os.environ, TIKTOKEN_CACHE_DIR=cache_dir, HTTPS_PROXY="http://127.0.0.1:9", https_proxy="http://127.0.0.1:9")
+    check = f"import tiktoken; tiktoken.get_encoding({ENCODINGS[0]!r})"
+    try:
+        return subprocess.run([sys.executable, "-c", check], env=env, capture_output=True, timeout=60).returncode == 0
+    except subprocess.TimeoutExpired:
+        return False
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of a list of numbers.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(percent / 100.0 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summary(values, digits=1):
+    if not values:
+        return {}
+    return {
+        "p50": round(percentile(values, 50), digits),
+        "p95": round(percentile(values, 95), digits),
+        "p99": round(percentile(values, 99), digits),
+        "mean": round(sum(values) / len(values), digits),
+        "max": round(max(values), digits),
+    }
+
+
+def parse_server_timing(header):
+    """
+    {"embedding": 12.3, "llm": 420.0, "total": 450.1} from a Server-Timing header.
+    """
+    timings = {}
+    for metric in (header or "").split(","):
+        name, *params = [part.strip() for part in metric.split(";")]
+        for param in params:
+            if param.startswith("dur="):
+                timings[name] = float(param[4:])
+    return timings
+
+
+class RssSampler:
+    """
+    Samples the resident memory of a process and all of its descendants from /proc.
+    """
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss", daemon=True)
+
+    def _tree(self):
+        children = {}
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The command name may contain spaces; the ppid follows its closing parenthesis
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+        pids, pending = [], [self.pid]
+        while pending:
+            pid = pending.pop()
+            pids.append(pid)
+            pending.extend(children.get(pid, []))
+        return pids
+
+    def current(self):
+        """
+        Total RSS in MB.
+        """
+        total = 0
+        for pid in self._tree():
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            total += int(line.split()[1])
+                            break
+            except OSError:
+                continue
+        return round(total / 1024.0, 1)
+
+    def reset(self):
+        self.peak = self.current()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+class Stack:
+    """
+    The fake backends plus the API server under test.
+    """
+
+    def __init__(self, args, workdir):
+        self.args = args
+        self.workdir = workdir
+        self.server = None
+        self.port = free_port()
+        jitter = args.jitter_ms
+        self.ollama = FakeOllama(dims=args.dims, latency=Latency(args.embed_ms, args.embed_item_ms, jitter, args.seed))
+        self.openai = FakeOpenAI(latency=Latency(args.llm_ms, 0, jitter, args.seed + 1), token_ms=args.token_ms)
+        self.es = None if args.es_url else FakeElasticsearch(latency=Latency(args.es_ms, 0, jitter, args.seed + 2))
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def env(self):
+        metrics_dir = os.path.join(self.workdir, "metrics")
+        os.makedirs(metrics_dir, exist_ok=True)
+        env = dict(os.environ)
+        env.update({
+            "ELASTICSEARCH_URL": self.args.es_url or self.es.url,
+            "DOCUMENT_INDEX": self.args.index,
+            "CHUNK_INDEX": f"{self.args.index}_chunks",
+            "EMBEDDING_BACKEND": "ollama",
+            "EMBEDDING_DIMS": str(self.args.dims),
+            "OLLAMA_API_URL": f"{self.ollama.url}/api/embed",
+            "OPENAI_API_BASE": f"{self.openai.url}/v1",
+            "OPENAI_API_KEY": "bench",
+            "TIKTOKEN_CACHE_DIR": self.args.tiktoken_cache,
+            "DATABASE_URL": f"sqlite:///{os.path.join(self.workdir, 'bench.db')}",
+            "USE_REDIS": "false",
+            "ASYNC_INGESTION": "false",
+            "SEMANTIC_CACHE_ENABLED": "false",
+            "EXTRACTION_CACHE_ENABLED": "false",  # Every upload pays for extraction
+            "LOG_LEVEL": "WARNING",
+            "PROMETHEUS_MULTIPROC_DIR": metrics_dir,
+            "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])),
+        })
+        return env
+
+    def start(self):
+        for fake in (self.ollama, self.openai, self.es):
+            if fake is not None:
+                fake.start()
+
+        env = self.env()
+        # Create the index and the tables once, before several workers race to do it. create_app()
+        # only creates the index; the tables need the models, which it imports afterwards.
+        subprocess.run([sys.executable, "-c", "from run import app\nfrom app import db\n"
+                        "with app.app_context():\n    db.create_all()"], cwd=ROOT, env=env, check=True)
+
+        if self.args.server == "gunicorn":
+            command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-w", str(self.args.workers),
+                       "--threads", str(self.args.threads), "-b", f"127.0.0.1:{self.port}", "--timeout", "600", "run:app"]
+        else:
+            command = [sys.executable, "-c",
+                       f"from run import app; app.run(host='127.0.0.1', port={self.port}, threaded=True)"]
+        log = open(os.path.join(self.workdir, "server.log"), "wb")
+        self.server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+                                       start_new_session=True)
+        self._wait_ready()
+        return self
+
+    def _wait_ready(self, timeout=60):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.server.poll() is not None:
+                raise RuntimeError(f"Server exited with {self.server.returncode}, see {self.workdir}/server.log")
+            try:
+                # Any HTTP response means the server is up; /metrics may be disabled
+                requests.get(f"{self.url}/metrics", timeout=2)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise RuntimeError(f"Server did not start within {timeout}s, see {self.workdir}/server.log")
+
+    def upstream_calls(self):
+        fakes = {"ollama": self.ollama, "openai": self.openai, "elasticsearch": self.es}
+        return {name: fake.requests for name, fake in fakes.items() if fake is not None}
+
+    def stop(self):
+        if self.server is not None and self.server.poll() is None:
+            os.killpg(self.server.pid, signal.SIGTERM)
+            try:
+                self.server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                os.killpg(self.server.pid, signal.SIGKILL)
+        for fake in (self.ollama, self.openai, self.es):
+            if fake is not None:
+                fake.stop()
+
+
+class Client:
+    """
+    One HTTP session per thread, authenticated with the benchmark user's token.
+    """
+
+    def __init__(self, url):
+        self.url = f"{url}/api/v1"
+        self._local = threading.local()
+        requests.post(f"{self.url}/register", json=USER, timeout=30)
+        response = requests.post(f"{self.url}/login", json=USER, timeout=30)
+        response.raise_for_status()
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    def session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+            self._local.session.headers.update(self.headers)
+        return self._local.session
+
+    def timed(self, method, path, **kwargs):
+        """
+        Run one request, reading streamed bodies to the end. Returns a result record.
+        """
+        started = time.perf_counter()
+        try:
+            with self.session().request(method, f"{self.url}/{path}", stream=True, timeout=600, **kwargs) as response:
+                size = sum(len(chunk) for chunk in response.iter_content(65536)) if response.ok else len(response.content)
+                result = {
+                    "ms": (time.perf_counter() - started) * 1000,
+                    "status": response.status_code,
+                    "bytes": size,
+                    "stages": parse_server_timing(response.headers.get("Server-Timing")),
+                }
+                if not response.ok:
+                    result["error"] = f"{response.status_code}: {response.text[:300].strip()}"
+                return result
+        except requests.RequestException as e:
+            return {"ms": (time.perf_counter() - started) * 1000, "status": None, "bytes": 0, "stages": {}, "error": str(e)}
+
+
+def upload_requests(client, documents):
+    def upload(document):
+        with open(document["path"], "rb") as f:
+            return client.timed("POST", "upload-documents", data={"tc_doc_id": document["tc_doc_id"]},
+                                files=[("files", (os.path.basename(document["path"]), f, "application/pdf"))])
+    return [lambda document=document: upload(document) for document in documents]
+
+
+def check_sla_requests(client, questions):
+    return [lambda question=question: client.timed("POST", "check-sla", json=question) for question in questions]
+
+
+def backup_requests(client, index, count, fmt):
+    params = {"index": index, "format": fmt}
+    return [lambda: client.timed("GET", "backup-index", params=params) for _ in range(count)]
+
+
+def run_scenario(name, calls, concurrency, stack, rss):
+    """
+    Run the calls on a pool of `concurrency` threads and summarize them.
+    """
+    calls_before = stack.upstream_calls()
+    rss.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda call: call(), calls))
+    elapsed = time.perf_counter() - started
+
+    ok = [result for result in results if result["status"] is not None and result["status"] < 400]
+    errors = {}
+    for result in results:
+        if result["status"] is None or result["status"] >= 400:
+            key = str(result["status"] or "connection")
+            errors[key] = errors.get(key, 0) + 1
+
+    stages = {}
+    for result in ok:
+        for stage, ms in result["stages"].items():
+            stages.setdefault(stage, []).append(ms)
+
+    report = {
+        "requests": len(results),
+        "errors": errors,
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else 0.0,
+        "seconds": round(elapsed, 2),
+        "throughput": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": summary([result["ms"] for result in ok]),
+        "bytes_mean": int(sum(result["bytes"] for result in ok) / len(ok)) if ok else 0,
+        "stages_ms": {stage: summary(values) for stage, values in sorted(stages.items())},
+        "rss_mb": {"peak": max(rss.peak, rss.current()), "end": rss.current()},
+        "upstream_calls": {name: count - calls_before.get(name, 0) for name, count in stack.upstream_calls().items()},
+    }
+    print(f"{name}: {report['requests']} requests, {report['throughput']}/s, "
+          f"p50 {report['latency_ms'].get('p50')} ms, p95 {report['latency_ms'].get('p95')} ms, "
+          f"p99 {report['latency_ms'].get('p99')} ms, errors {errors or 0}, peak RSS {report['rss_mb']['peak']} MB")
+    for result in results:
+        if "error" in result:
+            print(f"  {result['error']}")
+            break
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """
+    Regressions of report against baseline: p95/p99 latency up, or throughput down, by more
+    than tolerance (a fraction), or a higher error rate.
+    """
+    regressions = []
+    for name, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for key in ("p95", "p99"):
+            new, old = current["latency_ms"].get(key), previous["latency_ms"].get(key)
+            if new is not None and old and new > old * (1 + tolerance):
+                regressions.append(f"{name}: {key} latency {old} -> {new} ms")
+        if previous["throughput"] and current["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['throughput']} -> {current['throughput']}/s")
+        if current["error_rate"] > previous["error_rate"]:
+            regressions.append(f"{name}: error rate {previous['error_rate']} -> {current['error_rate']}")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the SLA API against local fake backends.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight")
+    parser.add_argument("--requests", type=int, default=200, help="check-sla requests")
+    parser.add_argument("--warmup", type=int, default=10, help="check-sla requests run before measuring")
+    parser.add_argument("--docs", type=int, default=50, help="Contracts uploaded (one upload request each)")
+    parser.add_argument("--scanned", type=int, default=0, help="How many contracts are image-only scans "
+                                                               "(needs Pillow, tesseract and poppler)")
+    parser.add_argument("--backups", type=int, default=10, help="backup-index requests")
+    parser.add_argument("--backup-format", default="gzip")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--server", choices=("gunicorn", "flask"),
+                        default="gunicorn" if importlib.util.find_spec("gunicorn") else "flask")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=4, help="Threads per gunicorn worker")
+    parser.add_argument("--index", default="bench_documents", help="Document index alias the API is pointed at")
+    parser.add_argument("--es-url", help="Use this Elasticsearch instead of the in-process fake")
+    parser.add_argument("--dims", type=int, default=768, help="Embedding dimensions of the fake Ollama")
+    parser.add_argument("--embed-ms", type=float, default=15.0, help="Fake Ollama latency per request")
+    parser.add_argument("--embed-item-ms", type=float, default=2.0, help="Fake Ollama latency per input")
+    parser.add_argument("--llm-ms", type=float, default=300.0, help="Fake OpenAI time to first token")
+    parser.add_argument("--token-ms", type=float, default=2.0, help="Fake OpenAI time per generated token")
+    parser.add_argument("--es-ms", type=float, default=1.0, help="Fake Elasticsearch latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter added to every fake latency")
+    parser.add_argument("--out", help="Report path (default tmp/bench/report-<timestamp>.json)")
+    parser.add_argument("--compare", help="Baseline report; exit with status 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative change before a regression")
+    parser.add_argument("--keep", action="store_true", help="Keep the working directory (fixtures, server log)")
+    parser.add_argument("--tiktoken-cache", default=os.environ.get("TIKTOKEN_CACHE_DIR") or os.path.join(ROOT, "tmp", "bench", "tiktoken"),
+                        help="Tokenizer files the API loads instead of downloading them (default: $TIKTOKEN_CACHE_DIR or tmp/bench/tiktoken)")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    cached = tokenizer_cached(args.tiktoken_cache)
+    if not cached:
+        # The API then counts context tokens with its character estimate, so prompts differ from production
+        print(f"Note: no tokenizer files in {args.tiktoken_cache}; token budgets use the character estimate. "
+              f"Seed them once while online:\n  TIKTOKEN_CACHE_DIR={args.tiktoken_cache} python -c \"{SEED_TOKENIZER}\"")
+
+    workdir = tempfile.mkdtemp(prefix="sla-bench-")
+    documents = corpus.build(os.path.join(workdir, "fixtures"), args.docs, args.scanned, args.seed)
+    questions = corpus.queries(documents, args.warmup + args.requests, args.seed)
+    stack = Stack(args, workdir)
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "host": platform.node(),
+            "cpus": os.cpu_count(),
+            "tokenizer": "tiktoken" if cached else "estimate",
+            "settings": {key: value for key, value in vars(args).items() if key not in ("out", "compare", "keep")},
+        },
+        "scenarios": {},
+    }
+
+    try:
+        stack.start()
+        rss = RssSampler(stack.server.pid).start()
+        report["meta"]["rss_mb_idle"] = rss.current()
+        client = Client(stack.url)
+
+        # Uploads run first when selected: the other scenarios need an index with documents
+        if "upload" in scenarios:
+            report["scenarios"]["upload"] = run_scenario(
+                "upload", upload_requests(client, documents), args.concurrency, stack, rss)
+        if "check-sla" in scenarios:
+            for call in check_sla_requests(client, questions[:args.warmup]):
+                call()
+            report["scenarios"]["check-sla"] = run_scenario(
+                "check-sla", check_sla_requests(client, questions[args.warmup:]), args.concurrency, stack, rss)
+        if "backup" in scenarios:
+            report["scenarios"]["backup"] = run_scenario(
+                "backup", backup_requests(client, args.index, args.backups, args.backup_format),
+                args.concurrency, stack, rss)
+        rss.stop()
+    finally:
+        stack.stop()
+        if args.keep:
+            print(f"Working directory kept: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if not cached and tokenizer_cached(args.tiktoken_cache):
+        # The server was online and fetched the files itself
+        report["meta"]["tokenizer"] = "tiktoken"
+
+    out = args.out or os.path.join(ROOT, "tmp", "bench", f"report-{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Report written to {out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        changed = [key for key, value in report["meta"]["settings"].items()
+                   if key not in ("scenarios", "tolerance", "tiktoken_cache") and baseline["meta"]["settings"].get(key) != value]
+        if baseline["meta"].get("tokenizer", "tiktoken") != report["meta"]["tokenizer"]:
+            changed.append("tokenizer")
+        if changed or baseline["meta"].get("cpus") != report["meta"]["cpus"]:
+            print(f"Note: the baseline was run with different settings or hardware ({', '.join(changed) or 'cpus'})")
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
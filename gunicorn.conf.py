@@ -0,0 +1,9 @@
+import os
+from prometheus_client import multiprocess
+
+
+# Loaded by gunicorn from the working directory (api.sh passes it explicitly).
+def child_exit(server, worker):
+    # Drop the live gauges of a dead worker so in-flight counts do not include it
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,12 @@
+from aiohttp import web
+from app.aio import create_async_app
+from app.config import Config
+
+
+# Query endpoints only; run the Flask app (run.py) alongside it for everything else.
+# gunicorn run_async:app --worker-class aiohttp.GunicornWebWorker
+app = create_async_app()
+
+
+if __name__ == "__main__":
+    web.run_app(app, port=Config.ASYNC_PORT)
@@ -0,0 +1,315 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from elasticsearch import helpers
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app import es, create_index_with_mapping
+from app.config import Config
+from app.chunking import chunk_pages, create_chunk_index, build_chunk_actions, mean_embedding
+from app.extraction_cache import file_digest
+from app.utils import extract_pages_from_pdf, pages_to_text, generate_document_hash, get_embeddings
+
+
+def load_items(source):
+    """
+    Yield {"path", "tc_doc_id"} items from a directory tree or a manifest file.
+    Manifests are JSON lines or CSV with "path" and "tc_doc_id" columns;
+    for directories the tc_doc_id is the PDF's path relative to the directory, without extension.
+    """
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.lower().endswith(".pdf"):
+                    path = os.path.join(root, name)
+                    yield {"path": path, "tc_doc_id": os.path.splitext(os.path.relpath(path, source))[0]}
+        return
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, newline="", encoding="utf-8") as f:
+        rows = csv.DictReader(f) if source.endswith(".csv") else (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            path = row["path"] if os.path.isabs(row["path"]) else os.path.join(base, row["path"])
+            yield {"path": path, "tc_doc_id": row.get("tc_doc_id") or os.path.splitext(os.path.basename(path))[0]}
+
+
+def init_extractor(ocr_memory_mb):
+    # The process pool already uses every core, so each extraction OCRs on one worker;
+    # ocr_pdf then runs Tesseract from the extraction process instead of nesting a pool
+    Config.OCR_WORKERS = 1
+    Config.OCR_MAX_MEMORY_MB = ocr_memory_mb
+
+
+def document_id(item):
+    return f"{item['tc_doc_id']}:{os.path.basename(item['path'])}"
+
+
+def attach_indexed_digests(items, index_name, skip_unchanged=True, batch_size=500):
+    """
+    Look up the documents already stored under each item's tc_doc_id, whether they were
+    loaded by this tool or uploaded through the API. PDFs whose bytes are indexed under
+    their tc_doc_id can be skipped; a stored document with the same title is replaced in
+    place, and its old passages deleted after the load.
+    """
+    batch = []
+
+    def flush():
+        stored = {}
+        query = {"query": {"terms": {"tc_doc_id": list({item["tc_doc_id"] for item in batch})}},
+                 "_source": ["tc_doc_id", "title", "content_digest", "hash"]}
+        for hit in helpers.scan(es, index=index_name, query=query):
+            stored.setdefault(hit["_source"]["tc_doc_id"], []).append(hit)
+        for item in batch:
+            hits = stored.get(item["tc_doc_id"], [])
+            same_title = [hit for hit in hits if hit["_source"].get("title") == os.path.basename(item["path"])]
+            if same_title:
+                item["indexed_id"] = same_title[0]["_id"]
+                item["indexed_hash"] = same_title[0]["_source"].get("hash")
+            if skip_unchanged:
+                item["indexed_digests"] = {hit["_source"].get("content_digest") for hit in hits}
+        return batch
+
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield from flush()
+            batch = []
+    if batch:
+        yield from flush()
+
+
+def extract(item):
+    """
+    Extraction stage, run in the process pool.
+    Files whose bytes are already indexed under their tc_doc_id come back with pages set to None.
+    """
+    started = time.time()
+    item["digest"] = file_digest(item["path"])
+    if item["digest"] in item.get("indexed_digests", ()):
+        return item, None, None, time.time() - started
+    pages = extract_pages_from_pdf(item["path"], item["digest"])
+    text = pages_to_text(pages)
+    return item, pages, text, time.time() - started
+
+
+def extract_all(items, workers):
+    """
+    Run extraction on a process pool, keeping a bounded number of documents in flight.
+    Results are yielded in completion order.
+    """
+    in_flight = workers * 4
+    ocr_memory_mb = max(256, Config.OCR_MAX_MEMORY_MB // workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_extractor, initargs=(ocr_memory_mb,)) as pool:
+        pending = set()
+        for item in items:
+            pending.add(pool.submit(extract, item))
+            if len(pending) >= in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in pending:
+            yield future.result()
+
+
+class Stats:
+    def __init__(self):
+        self.started = time.time()
+        self.timings = {"extract": 0.0, "extract_wait": 0.0, "embed": 0.0}
+        self.counts = {"files": 0, "docs": 0, "unchanged": 0, "passages": 0, "failed": 0, "pages": 0, "bytes": 0,
+                       "stale_passages": 0}
+        self.replaced = []  # (tc_doc_id, previous hash) of re-ingested documents with passages
+
+    def report(self):
+        elapsed = time.time() - self.started
+        stages = {stage: round(seconds, 2) for stage, seconds in self.timings.items()}
+        # extract is time summed over the pool; the rest is wall time in this process.
+        # Wall time not spent waiting on extraction or embedding is spent on bulk indexing.
+        stages["index"] = round(max(0.0, elapsed - self.timings["extract_wait"] - self.timings["embed"]), 2)
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "docs_per_second": round(self.counts["docs"] / elapsed, 2) if elapsed else 0,
+            "counts": self.counts,
+            "stage_seconds": stages
+        }
+
+
+def generate_actions(results, index_name, embed_batch, stats):
+    """
+    Embed extracted documents in batches and yield bulk index actions.
+    """
+    batch = []
+
+    def flush():
+        started = time.time()
+        if Config.CHUNKED_INGESTION:
+            passages = [chunk_pages(pages) for _, pages, _ in batch]
+            embeddings = get_embeddings([p["content"] for doc_passages in passages for p in doc_passages])
+        else:
+            passages = None
+            embeddings = get_embeddings([text for _, _, text in batch])
+        stats.timings["embed"] += time.time() - started
+        if embeddings is None:
+            print(f"Embedding failed for a batch of {len(batch)} document(s); skipping it.")
+            stats.counts["failed"] += len(batch)
+            return
+
+        offset = 0
+        for i, (item, pages, text) in enumerate(batch):
+            title = os.path.basename(item["path"])
+            doc_hash = generate_document_hash({"title": title, "content": text})
+            if passages is not None:
+                doc_embeddings = embeddings[offset:offset + len(passages[i])]
+                offset += len(passages[i])
+                stats.counts["passages"] += len(passages[i])
+                yield from build_chunk_actions(item["tc_doc_id"], title, doc_hash, passages[i], doc_embeddings)
+                embedding = mean_embedding(doc_embeddings)
+                # Passages of the previous version beyond the new count keep their old ids
+                if item.get("indexed_hash") and item["indexed_hash"] != doc_hash:
+                    stats.replaced.append((item["tc_doc_id"], item["indexed_hash"]))
+            else:
+                embedding = embeddings[i]
+
+            yield {
+                "_op_type": "index",
+                "_index": index_name,
+                # Replace the stored document of this title, whatever its id; otherwise use a
+                # deterministic id so re-running the same manifest is idempotent
+                "_id": item.get("indexed_id") or document_id(item),
+                "_source": {
+                    "tc_doc_id": item["tc_doc_id"],
+                    "title": title,
+                    "content": text,
+                    "hash": doc_hash,
+                    "content_digest": item["digest"],
+                    "timestamp": datetime.now().isoformat(),
+                    "embedding": embedding
+                }
+            }
+            stats.counts["docs"] += 1
+
+    results = iter(results)
+    while True:
+        waited = time.time()
+        try:
+            item, pages, text, seconds = next(results)
+        except StopIteration:
+            break
+        stats.timings["extract_wait"] += time.time() - waited
+        stats.counts["files"] += 1
+        stats.timings["extract"] += seconds
+        if pages is None:
+            stats.counts["unchanged"] += 1
+            continue
+        if not text:
+            print(f"Skipping {item['path']} due to failed text extraction.")
+            stats.counts["failed"] += 1
+            continue
+        stats.counts["pages"] += len(pages)
+        stats.counts["bytes"] += os.path.getsize(item["path"])
+        batch.append((item, pages, text))
+        if len(batch) >= embed_batch:
+            yield from flush()
+            batch = []
+    if batch:
+        yield from flush()
+
+
+def prepare_for_load(index_names):
+    """
+    Disable refresh and replicas for the load; returns the settings to restore.
+    """
+    previous = {}
+    for index_name in index_names:
+        # Keyed by the concrete index when index_name is an alias
+        settings = next(iter(es.indices.get_settings(index=index_name).values()))
+        current = settings.get("settings", {}).get("index", {})
+        # An unset refresh_interval is restored as null, which resets it to the default
+        previous[index_name] = {
+            "refresh_interval": current.get("refresh_interval"),
+            "number_of_replicas": current.get("number_of_replicas", "1")
+        }
+        es.indices.put_settings(index=index_name, body={"index": {"refresh_interval": "-1", "number_of_replicas": 0}})
+    return previous
+
+
+def restore_after_load(previous, force_merge, max_segments):
+    for index_name, settings in previous.items():
+        es.indices.put_settings(index=index_name, body={"index": settings})
+        es.indices.refresh(index=index_name)
+        if force_merge:
+            print(f"Force-merging '{index_name}' to {max_segments} segment(s)...")
+            es.indices.forcemerge(index=index_name, max_num_segments=max_segments, request_timeout=3600)
+
+
+def delete_replaced_chunks(replaced, batch_size=500):
+    """
+    Delete the passages of the previous versions of re-ingested documents. The hash
+    (SHA-256 of title and content) singles out the old version of one title under a tc_doc_id.
+    """
+    deleted = 0
+    for start in range(0, len(replaced), batch_size):
+        clauses = [
+            {"bool": {"filter": [{"term": {"tc_doc_id": tc_doc_id}}, {"term": {"hash": old_hash}}]}}
+            for tc_doc_id, old_hash in replaced[start:start + batch_size]
+        ]
+        response = es.delete_by_query(index=Config.CHUNK_INDEX, body={"query": {"bool": {"should": clauses}}},
+                                      conflicts="proceed", refresh=True, request_timeout=3600)
+        deleted += response.get("deleted", 0)
+    return deleted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk ingest a directory tree or manifest of PDFs into Elasticsearch.")
+    parser.add_argument("source", help="Directory of PDFs, or a manifest (.jsonl or .csv with path,tc_doc_id).")
+    parser.add_argument("--index", default=Config.DOCUMENT_INDEX, help=f"Target index or alias (default: {Config.DOCUMENT_INDEX}).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Extraction processes.")
+    parser.add_argument("--embed-batch", type=int, default=Config.EMBEDDING_BATCH_SIZE, help="Documents per embedding batch.")
+    parser.add_argument("--chunk-size", type=int, default=200, help="Documents per bulk request.")
+    parser.add_argument("--max-chunk-mb", type=int, default=50, help="Maximum bulk request size in MB.")
+    parser.add_argument("--threads", type=int, default=4, help="Parallel bulk requests.")
+    parser.add_argument("--reindex-unchanged", action="store_true", help="Re-extract and re-embed PDFs whose bytes are already indexed.")
+    parser.add_argument("--force-merge", action="store_true", help="Force-merge the index after loading.")
+    parser.add_argument("--max-segments", type=int, default=1, help="Segments to force-merge down to.")
+    args = parser.parse_args()
+
+    create_index_with_mapping(args.index)
+    index_names = [args.index]
+    if Config.CHUNKED_INGESTION:
+        create_chunk_index(es)
+        index_names.append(Config.CHUNK_INDEX)
+
+    stats = Stats()
+    bulk_failures = 0
+    previous = prepare_for_load(index_names)
+    print(f"Loading {args.source} into {', '.join(index_names)} (refresh disabled, replicas 0)...")
+    try:
+        items = attach_indexed_digests(load_items(args.source), args.index, skip_unchanged=not args.reindex_unchanged)
+        actions = generate_actions(extract_all(items, args.workers), args.index, args.embed_batch, stats)
+        for ok, info in helpers.parallel_bulk(
+                es, actions, thread_count=args.threads, chunk_size=args.chunk_size,
+                max_chunk_bytes=args.max_chunk_mb * 1024 * 1024, raise_on_error=False, request_timeout=300):
+            if not ok:
+                stats.counts["failed"] += 1
+                bulk_failures += 1
+                print(f"Failed to index: {info}")
+    finally:
+        print("Restoring index settings...")
+        restore_after_load(previous, args.force_merge, args.max_segments)
+
+    if stats.replaced and bulk_failures:
+        # Some new passages may be missing; keep the old ones until a clean re-run
+        print(f"Not deleting stale passages of {len(stats.replaced)} re-ingested document(s) after bulk failures.")
+    elif stats.replaced:
+        print(f"Deleting stale passages of {len(stats.replaced)} re-ingested document(s)...")
+        stats.counts["stale_passages"] = delete_replaced_chunks(stats.replaced)
+
+    print(json.dumps(stats.report(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
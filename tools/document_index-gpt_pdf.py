@@ -1,14 +1,19 @@
 import argparse
+import os
+import sys
 import hashlib
 import openai
 import json
 from elasticsearch import Elasticsearch
-from PyPDF2 import PdfReader
-import pytesseract
-from PIL import Image
-from pdf2image import convert_from_path
 import numpy as np
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.embedding_client import EmbeddingClient, EmbeddingError
+from app.utils import extract_pages_from_pdf, pages_to_text
+from app.config import Config
+from app.mappings import document_mapping
+from app.aliases import ensure_alias
+
 # Elasticsearch setup
 es = Elasticsearch(["http://localhost:9200"])
 
@@ -16,19 +21,19 @@ es = Elasticsearch(["http://localhost:9200"])
 openai.api_key = "your_api_key"  # Replace with your OpenAI API key
 OPENAI_EMBEDDING_MODEL = "text-embedding-ada-002"  # The OpenAI model for embeddings
 
-def get_embedding(text):
+# Pooled client that sends all chunks of a document in batched requests
+embedding_client = EmbeddingClient(backend="openai", model=OPENAI_EMBEDDING_MODEL, api_key=openai.api_key)
+
+
+def get_embeddings(texts):
     """
-    Fetch embedding for the given text using OpenAI's text-embedding-ada-002 model.
+    Fetch embeddings for a list of texts using OpenAI's text-embedding-ada-002 model.
     """
     try:
-        response = openai.Embedding.create(
-            model=OPENAI_EMBEDDING_MODEL,
-            input=text
-        )
-        return response['data'][0]['embedding']
-    except Exception as e:
-        print(f"Error generating embedding: {e}")
-        return None
+        return embedding_client.embed_batch(texts)
+    except EmbeddingError as e:
+        print(f"Error generating embeddings: {e}")
+        return []
 
 
 def generate_document_hash(doc):
@@ -41,59 +46,19 @@ def generate_document_hash(doc):
 
 def create_index():
     """
-    Create an Elasticsearch index with mappings for dense vector and custom fields.
+    Create the Elasticsearch index with the shared document mapping (extra fields are mapped dynamically),
+    behind the application's alias. An existing index is kept; use tools/reindex.py to rebuild it.
     """
-    index_mapping = {
-        "mappings": {
-            "properties": {
-                "title": {"type": "text"},
-                "content": {"type": "text"},
-                "hash": {"type": "text"},
-                "category": {"type": "keyword"},
-                "embedding": {"type": "dense_vector", "dims": 1536},  # 1536 for ada-002
-                "custom_fields": {"type": "object"},
-            }
-        }
-    }
-    # Delete index if it exists
-    es.options(ignore_status=[400, 404]).indices.delete(index="pdf_documents")
-    es.options(ignore_status=[400]).indices.create(index="pdf_documents", body=index_mapping)
-
-
-def extract_text_with_ocr(pdf_path):
-    """
-    Extract text from PDF using OCR as a fallback with support for Greek and English.
-    """
-    try:
-        pages = convert_from_path(pdf_path, dpi=300)
-        text = ""
-        for page in pages:
-            # OCR with both Greek (ell) and English (eng) language support
-            text += pytesseract.image_to_string(page, lang="ell+eng")
-        return text.strip()
-    except Exception as e:
-        print(f"Failed to extract text using OCR from {pdf_path}: {e}")
-        return None
+    # Same mapping and vector quantization as the application
+    index_mapping = document_mapping(dims=1536)  # 1536 for ada-002
+    ensure_alias(es, Config.DOCUMENT_INDEX, index_mapping)
 
 
 def extract_text_from_pdf(pdf_path):
     """
-    Extract text from a PDF file, with OCR fallback.
+    Extract text from a PDF file; only pages without a usable text layer are OCR'd.
     """
-    try:
-        reader = PdfReader(pdf_path)
-        text = ""
-        for page in reader.pages:
-            extracted_text = page.extract_text()
-            if extracted_text:
-                text += extracted_text
-        if not text.strip():
-            print(f"No selectable text found in {pdf_path}. Falling back to OCR.")
-            return extract_text_with_ocr(pdf_path)
-        return text.strip()
-    except Exception as e:
-        print(f"Failed to extract text from {pdf_path}: {e}")
-        return None
+    return pages_to_text(extract_pages_from_pdf(pdf_path))
 
 
 def chunk_text(text, max_length=8192):
@@ -144,14 +109,8 @@ def index_pdf_file(pdf_path):
     # Split the text into chunks to fit within the token limit
     text_chunks = chunk_text(text)
     
-    # Generate embeddings for each chunk and combine them
-    embeddings = []
-    for chunk in text_chunks:
-        embedding = get_embedding(chunk)
-        if embedding:
-            embeddings.append(embedding)
-        else:
-            print(f"Skipping chunk due to failed embedding.")
+    # Generate embeddings for all chunks in batched requests and combine them
+    embeddings = get_embeddings(text_chunks)
 
     # Combine the embeddings (average them)
     combined_embedding = combine_embeddings(embeddings)
@@ -172,7 +131,7 @@ def index_pdf_file(pdf_path):
     }
 
     try:
-        es.index(index="pdf_documents", document=document)
+        es.index(index=Config.DOCUMENT_INDEX, document=document)
         print(f"PDF file {pdf_path} indexed successfully.")
     except Exception as e:
         print(f"Failed to index PDF file {pdf_path}: {e}")
@@ -1,41 +1,38 @@
 import argparse
+import os
+import sys
 from datetime import datetime
 import hashlib
-import requests
 import json
 from elasticsearch import Elasticsearch
-from PyPDF2 import PdfReader
-import pytesseract
-from PIL import Image
-from pdf2image import convert_from_path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.embedding_client import EmbeddingClient, EmbeddingError
+from app.utils import extract_pages_from_pdf, pages_to_text
+from app.config import Config
+from app.mappings import document_mapping
+from app.aliases import ensure_alias
 
 # Elasticsearch setup
 es = Elasticsearch(["http://localhost:9200"])
 
 # Ollama API setup
-OLLAMA_API_URL = "http://localhost:11434/api/embeddings"
+OLLAMA_API_URL = "http://localhost:11434/api/embed"
 OLLAMA_MODEL = "paraphrase-multilingual"
 
+# Pooled client with retry; keeps the HTTP connection alive between calls
+embedding_client = EmbeddingClient(backend="ollama", url=OLLAMA_API_URL, model=OLLAMA_MODEL)
+
 
 def get_embedding(text):
     """
     Fetch embedding for the given text using Ollama API.
     """
-    headers = {"Content-Type": "application/json"}
-    payload = {"model": OLLAMA_MODEL, "prompt": text}
     try:
-        response = requests.post(
-            OLLAMA_API_URL, headers=headers, json=payload, timeout=30
-        )
-        response.raise_for_status()
-        response_json = response.json()
-        return response_json.get("embedding", None)
-    except requests.RequestException as e:
+        return embedding_client.embed_batch([text])[0]
+    except EmbeddingError as e:
         print(f"Request failed: {e}")
         return None
-    except (json.decoder.JSONDecodeError, KeyError):
-        print("Error decoding JSON response or missing 'embedding' key.")
-        return None
 
 # Generate a hash for deduplication
 def generate_document_hash(doc):
@@ -45,60 +42,19 @@ def generate_document_hash(doc):
 
 def create_index():
     """
-    Create an Elasticsearch index with mappings for dense vector and custom fields.
-    """
-    index_mapping = {
-        "mappings": {
-            "properties": {
-                "title": {"type": "text"},
-                "content": {"type": "text"},
-                "hash": {"type": "text"},
-                "category": {"type": "keyword"},
-                "timestamp": datetime.now().isoformat(),
-                "embedding": {"type": "dense_vector", "dims": 768},
-                "custom_fields": {"type": "object"},
-            }
-        }
-    }
-    # Delete index if it exists
-    es.options(ignore_status=[400, 404]).indices.delete(index="pdf_documents")
-    es.options(ignore_status=[400]).indices.create(index="pdf_documents", body=index_mapping)
-
-
-def extract_text_with_ocr(pdf_path):
-    """
-    Extract text from PDF using OCR as a fallback with support for Greek and English.
+    Create the Elasticsearch index with the shared document mapping (extra fields are mapped dynamically),
+    behind the application's alias. An existing index is kept; use tools/reindex.py to rebuild it.
     """
-    try:
-        pages = convert_from_path(pdf_path, dpi=300)
-        text = ""
-        for page in pages:
-            # OCR with both Greek (ell) and English (eng) language support
-            text += pytesseract.image_to_string(page, lang="ell+eng")
-        return text.strip()
-    except Exception as e:
-        print(f"Failed to extract text using OCR from {pdf_path}: {e}")
-        return None
+    # Same mapping and vector quantization as the application
+    index_mapping = document_mapping()
+    ensure_alias(es, Config.DOCUMENT_INDEX, index_mapping)
 
 
 def extract_text_from_pdf(pdf_path):
     """
-    Extract text from a PDF file, with OCR fallback.
+    Extract text from a PDF file; only pages without a usable text layer are OCR'd.
     """
-    try:
-        reader = PdfReader(pdf_path)
-        text = ""
-        for page in reader.pages:
-            extracted_text = page.extract_text()
-            if extracted_text:
-                text += extracted_text
-        if not text.strip():
-            print(f"No selectable text found in {pdf_path}. Falling back to OCR.")
-            return extract_text_with_ocr(pdf_path)
-        return text.strip()
-    except Exception as e:
-        print(f"Failed to extract text from {pdf_path}: {e}")
-        return None
+    return pages_to_text(extract_pages_from_pdf(pdf_path))
 
 
 def index_pdf_file(pdf_path):
@@ -131,7 +87,7 @@ def index_pdf_file(pdf_path):
     document["hash"] = generate_document_hash(document)  # Pass the document object here
 
     try:
-        es.index(index="pdf_documents", document=document)
+        es.index(index=Config.DOCUMENT_INDEX, document=document)
         print(f"PDF file {pdf_path} indexed successfully.")
     except Exception as e:
         print(f"Failed to index PDF file {pdf_path}: {e}")
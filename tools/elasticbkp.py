@@ -1,11 +1,30 @@
 from elasticsearch import Elasticsearch, helpers
+import argparse
+import collections
+import contextlib
+import gzip
+import io
 import json
+import os
+import time
+import zipfile
 from datetime import datetime
 
+try:
+    import zstandard
+except ImportError:  # Optional: needed only to restore .zst backups
+    zstandard = None
+
 # Elasticsearch configuration
 ES_HOST = 'http://localhost:9200'  # Elasticsearch URL
 INDEX_NAME = 'sla_on_contracts'            # Name of the index to backup/restore
 
+# Restore defaults
+CHUNK_SIZE = 500          # Documents per bulk request
+MAX_CHUNK_MB = 50         # Maximum bulk request size
+THREADS = 4               # Parallel bulk requests
+CHECKPOINT_EVERY = 5000   # Documents between checkpoint writes
+
 # Generate a timestamped backup filename
 def get_backup_filename():
     current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -18,51 +37,220 @@ def backup_index():
     """Backup the index data to a file."""
     backup_file = get_backup_filename()
     try:
+        # Keep the mapping so a restore recreates the index as it was
+        mappings = next(iter(es.indices.get_mapping(index=INDEX_NAME).values()))["mappings"]
+        settings = next(iter(es.indices.get_settings(index=INDEX_NAME).values()))["settings"]["index"]
+        meta = {
+            "index": INDEX_NAME,
+            "created": datetime.now().isoformat(),
+            "mappings": mappings,
+            "settings": {key: settings[key] for key in ("number_of_shards", "number_of_replicas", "analysis") if key in settings}
+        }
+
         # Fetch all documents from the index
         query = {"query": {"match_all": {}}}
         results = helpers.scan(es, index=INDEX_NAME, query=query)
 
         # Save to a JSON file
         with open(backup_file, 'w') as f:
+            f.write(json.dumps({"_meta": meta}) + '\n')
             for doc in results:
-                f.write(json.dumps(doc) + '\n')
+                f.write(json.dumps({"_index": doc["_index"], "_id": doc["_id"], "_source": doc["_source"]}) + '\n')
 
         print(f"Backup completed successfully! Data saved to {backup_file}")
     except Exception as e:
         print(f"Error during backup: {e}")
 
-def restore_index():
+@contextlib.contextmanager
+def open_backup(backup_file):
+    """
+    Open a backup as a binary line stream, whatever its compression:
+    plain NDJSON, gzip, zstd, or a zip holding one NDJSON member.
+    """
+    with open(backup_file, 'rb') as f:
+        magic = f.read(4)
+
+    if magic.startswith(b'PK'):
+        with zipfile.ZipFile(backup_file) as archive, archive.open(archive.namelist()[0]) as member:
+            yield member
+    elif magic.startswith(b'\x1f\x8b'):
+        with gzip.open(backup_file, 'rb') as f:
+            yield f
+    elif magic == b'\x28\xb5\x2f\xfd':
+        if zstandard is None:
+            raise RuntimeError("Restoring .zst backups requires the zstandard package")
+        with io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(backup_file, 'rb'), closefd=True)) as f:
+            yield f
+    else:
+        with open(backup_file, 'rb') as f:
+            yield f
+
+def read_backup(backup_file, after_line=0):
+    """
+    Lazily yield (line_number, size, record) from a backup, parsing each line once.
+    Lines up to after_line are skipped without being parsed.
+    """
+    with open_backup(backup_file) as f:
+        for line_number, line in enumerate(f, 1):
+            if line_number > after_line and line.strip():
+                yield line_number, len(line), json.loads(line)
+
+def backup_metadata(backup_file):
+    """
+    The _meta record of a backup, or None for backups written without one.
+    """
+    for _, _, record in read_backup(backup_file):
+        return record.get("_meta")
+    return None
+
+def checkpoint_path(backup_file, index_name):
+    return f"{backup_file}.{index_name}.checkpoint"
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_checkpoint(path, state):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+def recreate_index(index_name, meta):
+    """
+    Recreate the index with the mapping and settings recorded in the backup,
+    tuned for loading: no refresh and no replicas until the restore finishes.
+    """
+    if es.indices.exists_alias(name=index_name):
+        raise RuntimeError(f"'{index_name}' is an alias; restore into a new index with --index, "
+                           f"then point the alias at it with tools/reindex.py --swap-only")
+    if es.indices.exists(index=index_name):
+        es.indices.delete(index=index_name)
+        print(f"Index '{index_name}' deleted.")
+
+    settings = dict((meta or {}).get("settings", {}))
+    settings.update({"refresh_interval": "-1", "number_of_replicas": 0})
+    body = {"settings": {"index": settings}}
+    if meta and meta.get("mappings"):
+        body["mappings"] = meta["mappings"]
+    else:
+        print("Backup has no mapping; the index is created with dynamic mapping.")
+    es.indices.create(index=index_name, body=body)
+    print(f"Index '{index_name}' created.")
+
+def finish_index(index_name, meta):
+    """
+    Put back the refresh interval and replica count after loading.
+    """
+    replicas = (meta or {}).get("settings", {}).get("number_of_replicas", "1")
+    es.indices.put_settings(index=index_name, body={"index": {"refresh_interval": None, "number_of_replicas": replicas}})
+    es.indices.refresh(index=index_name)
+
+def restore_index(backup_file=None, index_name=None, chunk_size=CHUNK_SIZE, threads=THREADS,
+                  max_chunk_mb=MAX_CHUNK_MB, resume=True):
     """Restore the index data from the backup file."""
-    backup_file = input("Enter the backup filename to restore from: ")
+    backup_file = backup_file or input("Enter the backup filename to restore from: ")
     try:
-        # Delete the index if it exists
-        if es.indices.exists(index=INDEX_NAME):
-            es.indices.delete(index=INDEX_NAME)
-            print(f"Index '{INDEX_NAME}' deleted.")
-
-        # Create a new index
-        es.indices.create(index=INDEX_NAME)
-        print(f"Index '{INDEX_NAME}' created.")
-
-        # Load data from the backup file
-        with open(backup_file, 'r') as f:
-            actions = [
-                {
+        meta = backup_metadata(backup_file)
+        index_name = index_name or (meta or {}).get("index") or INDEX_NAME
+        checkpoint_file = checkpoint_path(backup_file, index_name)
+        checkpoint = load_checkpoint(checkpoint_file) if resume else None
+
+        if checkpoint and es.indices.exists(index=index_name):
+            print(f"Resuming restore of '{index_name}' after line {checkpoint['line']} ({checkpoint['docs']} documents loaded).")
+            es.indices.put_settings(index=index_name, body={"index": {"refresh_interval": "-1", "number_of_replicas": 0}})
+        else:
+            checkpoint = {"line": 0, "docs": 0}
+            recreate_index(index_name, meta)
+
+        # Line numbers of the actions sent, in order; parallel_bulk reports results in the same order
+        sent = collections.deque()
+        read_bytes = [0]
+
+        def actions():
+            for line_number, size, record in read_backup(backup_file, checkpoint["line"]):
+                if "_source" not in record:
+                    continue
+                read_bytes[0] += size
+                sent.append(line_number)
+                yield {
                     "_op_type": "index",
-                    "_index": INDEX_NAME,
-                    "_id": json.loads(line)["_id"],
-                    "_source": json.loads(line)["_source"],
+                    "_index": index_name,
+                    "_id": record["_id"],
+                    "_source": record["_source"],
                 }
-                for line in f
-            ]
 
-        # Bulk insert data into the index
-        helpers.bulk(es, actions)
-        print(f"Restore completed successfully! Data restored to '{INDEX_NAME}'")
+        started = time.time()
+        docs = checkpoint["docs"]
+        restored = 0
+        failed = 0
+        # The checkpoint only moves past lines that were all restored; after the first
+        # failure it stays put, so the next run sends the failed documents again
+        last_ok_line = checkpoint["line"]
+        for ok, info in helpers.parallel_bulk(
+                es, actions(), thread_count=threads, chunk_size=chunk_size, queue_size=threads,
+                max_chunk_bytes=max_chunk_mb * 1024 * 1024, raise_on_error=False, request_timeout=300):
+            line_number = sent.popleft()
+            if ok:
+                restored += 1
+                if not failed:
+                    last_ok_line = line_number
+            else:
+                if not failed:
+                    save_checkpoint(checkpoint_file, {"line": last_ok_line, "docs": docs + restored})
+                failed += 1
+                print(f"Failed to restore line {line_number}: {info}")
+            if (restored + failed) % CHECKPOINT_EVERY == 0:
+                if not failed:
+                    save_checkpoint(checkpoint_file, {"line": line_number, "docs": docs + restored})
+                elapsed = time.time() - started
+                print(f"{docs + restored} documents restored ({restored / elapsed:.0f} docs/s)")
+
+        finish_index(index_name, meta)
+        if failed:
+            print(f"{failed} document(s) failed; run the restore again to retry from line {last_ok_line + 1}.")
+        elif os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+
+        elapsed = time.time() - started
+        report = {
+            "index": index_name,
+            "restored": restored,
+            "failed": failed,
+            "total_documents": docs + restored,
+            "elapsed_seconds": round(elapsed, 2),
+            "docs_per_second": round(restored / elapsed, 2) if elapsed else 0,
+            "mb_per_second": round(read_bytes[0] / 1024 / 1024 / elapsed, 2) if elapsed else 0
+        }
+        print(json.dumps(report, indent=2))
+        if not failed:
+            print(f"Restore completed successfully! Data restored to '{index_name}'")
     except Exception as e:
         print(f"Error during restore: {e}")
+        print("Run the restore again to resume from the last checkpoint.")
 
 def main():
+    parser = argparse.ArgumentParser(description="Elasticsearch Backup and Restore Script")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("backup", help=f"Backup '{INDEX_NAME}' to a timestamped NDJSON file.")
+    restore = subparsers.add_parser("restore", help="Restore a backup (plain, zip, gzip or zstd NDJSON).")
+    restore.add_argument("backup_file")
+    restore.add_argument("--index", help="Target index (default: the index recorded in the backup).")
+    restore.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Documents per bulk request.")
+    restore.add_argument("--threads", type=int, default=THREADS, help="Parallel bulk requests.")
+    restore.add_argument("--max-chunk-mb", type=int, default=MAX_CHUNK_MB, help="Maximum bulk request size in MB.")
+    restore.add_argument("--no-resume", action="store_true", help="Ignore any checkpoint and restore from scratch.")
+    args = parser.parse_args()
+
+    if args.command == "backup":
+        backup_index()
+        return
+    if args.command == "restore":
+        restore_index(args.backup_file, args.index, args.chunk_size, args.threads, args.max_chunk_mb, not args.no_resume)
+        return
+
     print("Elasticsearch Backup and Restore Script")
     print("1. Backup")
     print("2. Restore")
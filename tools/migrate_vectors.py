@@ -0,0 +1,38 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.config import Config
+import reindex
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reindex vector indices into the configured quantized layout. "
+                                                 "A front end to tools/reindex.py, which does the copy, check and swap.")
+    parser.add_argument("--index", default=Config.DOCUMENT_INDEX, help=f"Index or alias to migrate (default: {Config.DOCUMENT_INDEX}).")
+    parser.add_argument("--chunks", action="store_true", help=f"Migrate the passage index ({Config.CHUNK_INDEX}) instead.")
+    parser.add_argument("--index-type", default=Config.VECTOR_INDEX_TYPE,
+                        choices=["hnsw", "int8_hnsw", "int4_hnsw", "bbq_hnsw"], help="Vector index type.")
+    parser.add_argument("--swap", action="store_true", help="Switch the name over to the new index once verified.")
+    parser.add_argument("--delete-old", action="store_true",
+                        help="Delete the previous index after the swap (required to replace a legacy concrete index).")
+    parser.add_argument("--force-merge", action="store_true", help="Force-merge the new index before the swap.")
+    parser.add_argument("--poll", type=int, default=10, help="Seconds between progress checks.")
+    args = parser.parse_args()
+
+    argv = ["--alias", Config.CHUNK_INDEX if args.chunks else args.index,
+            "--index-type", args.index_type, "--poll", str(args.poll)]
+    if args.chunks:
+        argv.append("--chunks")
+    if not args.swap:
+        argv.append("--no-swap")
+    if args.delete_old:
+        argv.append("--delete-old")
+    if args.force_merge:
+        argv.append("--force-merge")
+    reindex.run(reindex.build_parser().parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from elasticsearch import helpers
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app import es
+from app.config import Config
+from app.aliases import alias_indices, versioned_name, swap_alias, embedding_dims, wait_for_task, TaskFailed
+from app.embedding_client import EmbeddingClient
+from app.mappings import document_mapping, chunk_mapping, vector_memory_mb
+
+
+class Throttle:
+    """
+    Keeps embedding requests at or below max_rate per second (0 disables it).
+    """
+
+    def __init__(self, max_rate):
+        self.max_rate = max_rate
+        self.started = time.time()
+        self.requests = 0
+
+    def wait(self, requests):
+        self.requests += requests
+        if self.max_rate:
+            ahead = self.requests / self.max_rate - (time.time() - self.started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+def copy(source, target, query, poll_seconds):
+    """
+    Server-side copy of the documents matching query; embeddings are kept as they are.
+    """
+    task = es.reindex(source={"index": source, "query": query, "size": Config.REINDEX_BATCH_SIZE},
+                      dest={"index": target, "op_type": "index"},
+                      slices="auto", wait_for_completion=False, refresh=False)
+    return wait_for_task(es, task["task"], poll_seconds)["total"]
+
+
+def re_embed(source, target, query, client, throttle):
+    """
+    Copy the documents matching query, replacing each embedding with one from the new model.
+    Sources are read without their old embedding, and every page is embedded in batched requests.
+    """
+    copied = 0
+    failed = 0
+    page = []
+
+    def flush():
+        embeddings = client.embed_batch([hit["_source"].get("content") or "" for hit in page])
+        throttle.wait(-(-len(page) // client.batch_size))
+        actions = (
+            {"_op_type": "index", "_index": target, "_id": hit["_id"], "_source": dict(hit["_source"], embedding=embedding)}
+            for hit, embedding in zip(page, embeddings)
+        )
+        ok, errors = helpers.bulk(es, actions, chunk_size=Config.REINDEX_BATCH_SIZE, raise_on_error=False,
+                                  request_timeout=300)
+        for error in errors:
+            print(f"Failed to index: {error}")
+        return ok, len(errors)
+
+    for hit in helpers.scan(es, index=source, query={"query": query, "_source": {"excludes": ["embedding"]}},
+                            size=Config.REINDEX_BATCH_SIZE):
+        page.append(hit)
+        if len(page) >= Config.REINDEX_BATCH_SIZE:
+            ok, errors = flush()
+            copied, failed = copied + ok, failed + errors
+            page = []
+            print(f"  {copied} documents re-embedded")
+    if page:
+        ok, errors = flush()
+        copied, failed = copied + ok, failed + errors
+    if failed:
+        raise SystemExit(f"{failed} document(s) could not be re-embedded; '{target}' is left for inspection.")
+    return copied
+
+
+def rebuild(alias, mapping_for, args):
+    """
+    Build a new versioned index from the one behind alias, optionally re-embedding every
+    document, verify it and atomically point the alias at it.
+    """
+    sources = alias_indices(es, alias)
+    if len(sources) != 1:
+        raise SystemExit(f"'{alias}' resolves to {sources or 'nothing'}; expected exactly one index.")
+    source = sources[0]
+    if not args.no_swap:
+        check_replaceable(alias, args.delete_old)
+
+    client = None
+    if args.re_embed:
+        client = EmbeddingClient(backend=args.backend, url=args.url, model=args.model,
+                                 pool_size=args.concurrency, batch_size=args.embed_batch, batch_window_ms=0)
+        dims = args.dims or len(client.embed_batch(["dimension probe"])[0])
+        model = client.model
+    else:
+        dims = embedding_dims(es, source)
+        model = None
+
+    target = versioned_name(alias)
+    body = mapping_for(dims, args.index_type)
+    if model:
+        body["mappings"]["_meta"] = {"embedding_backend": client.backend, "embedding_model": model}
+    # Load without refreshes or replicas; both are restored before the swap
+    body["settings"] = {"index": {"refresh_interval": "-1", "number_of_replicas": 0}}
+    es.indices.create(index=target, body=body)
+
+    docs = es.count(index=source)["count"]
+    print(f"Rebuilding '{alias}' ({source}, {docs} documents) into '{target}' "
+          f"({dims} dims{', model ' + model if model else ''})")
+    print(f"  Estimated vector memory: {vector_memory_mb(docs, dims, 'hnsw')} MB as float, "
+          f"{vector_memory_mb(docs, dims, args.index_type)} MB as {args.index_type}")
+
+    # Writes keep going to the old index meanwhile; the catch-up pass copies anything written after this point
+    started = datetime.now().isoformat()
+    if client:
+        throttle = Throttle(args.max_rate)
+        copied = re_embed(source, target, {"match_all": {}}, client, throttle)
+        caught_up = re_embed(source, target, {"range": {"timestamp": {"gte": started}}}, client, throttle)
+    else:
+        copied = copy(source, target, {"match_all": {}}, args.poll)
+        caught_up = copy(source, target, {"range": {"timestamp": {"gte": started}}}, args.poll)
+    print(f"Copied {copied} documents, plus {caught_up} written during the rebuild")
+
+    replicas = next(iter(es.indices.get_settings(index=source).values()))["settings"]["index"].get("number_of_replicas", "1")
+    es.indices.put_settings(index=target, body={"index": {"refresh_interval": None, "number_of_replicas": replicas}})
+    es.indices.refresh(index=target)
+    expected = es.count(index=source)["count"]
+    actual = es.count(index=target)["count"]
+    if actual != expected:
+        raise SystemExit(f"Document count mismatch: '{source}' has {expected}, '{target}' has {actual}. "
+                         f"Not swapping; '{target}' is left for inspection.")
+
+    if args.force_merge:
+        print(f"Force-merging '{target}'...")
+        es.indices.forcemerge(index=target, max_num_segments=1, request_timeout=3600)
+
+    report = {"alias": alias, "source": source, "target": target, "documents": actual, "dims": dims,
+              "embedding_model": model, "swapped": not args.no_swap}
+    if not args.no_swap:
+        finish_swap(alias, target, args.delete_old)
+    print(json.dumps(report, indent=2))
+    if model:
+        print_deploy_notes(client, dims, target, args.no_swap)
+
+
+def check_replaceable(alias, delete_old):
+    """
+    Refuse to swap out a legacy concrete index (which the alias must replace, deleting it)
+    unless --delete-old was given.
+    """
+    if alias_indices(es, alias) == [alias] and not delete_old:
+        raise SystemExit(f"'{alias}' is a concrete index; pointing an alias of that name at a new index deletes it. "
+                         f"Re-run with --delete-old to allow that, or with --no-swap to only build the new index.")
+
+
+def finish_swap(alias, target, delete_old):
+    check_replaceable(alias, delete_old)
+    legacy = alias_indices(es, alias) == [alias]
+    previous = swap_alias(es, alias, target)
+    print(f"Alias '{alias}' now points to '{target}'.")
+    if legacy:
+        print(f"Deleted the legacy index '{alias}'.")
+    for old in previous:
+        if delete_old:
+            es.indices.delete(index=old)
+            print(f"Deleted '{old}'.")
+        else:
+            print(f"'{old}' is kept for rollback: python tools/reindex.py --swap-only {old}")
+
+
+def print_deploy_notes(client, dims, target, pending_swap):
+    variable = "OLLAMA_MODEL" if client.backend == "ollama" else "OPENAI_EMBEDDING_MODEL"
+    print("Queries must be embedded with the new model from the moment the alias moves:")
+    print(f"  export EMBEDDING_BACKEND={client.backend} {variable}={client.model} EMBEDDING_DIMS={dims}")
+    if pending_swap:
+        print(f"  python tools/reindex.py --swap-only {target}")
+    print("  bash api.sh stop && bash api.sh start")
+    if dims != Config.EMBEDDING_DIMS:
+        print(f"The semantic answer cache ({Config.SEMANTIC_CACHE_INDEX}) holds {Config.EMBEDDING_DIMS}-dim vectors; "
+              f"delete it so it is recreated with {dims} dims.")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Rebuild the index behind an alias and swap it in without downtime.")
+    parser.add_argument("--chunks", action="store_true", help=f"Rebuild the passage index ({Config.CHUNK_INDEX}).")
+    parser.add_argument("--alias", help=f"Alias to rebuild (default: {Config.DOCUMENT_INDEX}, or {Config.CHUNK_INDEX} with --chunks).")
+    parser.add_argument("--index-type", default=Config.VECTOR_INDEX_TYPE,
+                        choices=["hnsw", "int8_hnsw", "int4_hnsw", "bbq_hnsw"], help="Vector index type of the new index.")
+    parser.add_argument("--re-embed", action="store_true", help="Recompute every embedding with the model below.")
+    parser.add_argument("--backend", default=Config.EMBEDDING_BACKEND, choices=["ollama", "openai"], help="Embedding backend.")
+    parser.add_argument("--model", help="Embedding model (default: the configured one).")
+    parser.add_argument("--url", help="Embedding endpoint (default: the configured one for the backend).")
+    parser.add_argument("--dims", type=int, help="Embedding dimensions (default: probed from the model).")
+    parser.add_argument("--embed-batch", type=int, default=Config.REINDEX_EMBED_BATCH, help="Texts per embedding request.")
+    parser.add_argument("--concurrency", type=int, default=Config.EMBEDDING_POOL_SIZE, help="Embedding requests in flight.")
+    parser.add_argument("--max-rate", type=float, default=Config.REINDEX_MAX_EMBED_RATE,
+                        help="Embedding requests per second (0: unlimited).")
+    parser.add_argument("--no-swap", action="store_true", help="Build and verify the new index but leave the alias alone.")
+    parser.add_argument("--swap-only", metavar="INDEX", help="Only point the alias at INDEX (e.g. after --no-swap, or to roll back).")
+    parser.add_argument("--delete-old", action="store_true",
+                        help="Delete the previous index after the swap (required to replace a legacy concrete index).")
+    parser.add_argument("--force-merge", action="store_true", help="Force-merge the new index before the swap.")
+    parser.add_argument("--poll", type=int, default=10, help="Seconds between progress checks.")
+    return parser
+
+
+def run(args):
+    alias = args.alias or (Config.CHUNK_INDEX if args.chunks else Config.DOCUMENT_INDEX)
+    if args.swap_only:
+        if not es.indices.exists(index=args.swap_only):
+            raise SystemExit(f"Index '{args.swap_only}' not found.")
+        finish_swap(alias, args.swap_only, args.delete_old)
+        return
+    try:
+        rebuild(alias, chunk_mapping if args.chunks else document_mapping, args)
+    except TaskFailed as e:
+        raise SystemExit(str(e))
+
+
+def main():
+    run(build_parser().parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+import sys
+from app.config import Config
+from app.jobs import run_workers
+
+
+if __name__ == "__main__" :
+    # Optional worker count: python worker.py [workers]
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else Config.JOB_WORKERS
+    run_workers(workers)